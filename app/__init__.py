@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, request
 from .routes.email import email_bp
 from .routes.config import config_bp
 from .routes.health import health_bp
@@ -23,9 +23,31 @@ def create_app():
     app.register_blueprint(health_bp)
     app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB
 
+    from .services.metrics import metrics
+
+    @app.before_request
+    def _metrics_start():
+        # /healthz e /metrics não contam como carga
+        if request.blueprint != "health":
+            request.environ["respondo.in_flight"] = True
+            metrics.request_started()
+
+    @app.teardown_request
+    def _metrics_end(_exc=None):
+        if request.environ.pop("respondo.in_flight", False):
+            metrics.request_finished()
+
     try:
         from .services.classifier_service import classifier_service
     except Exception as _:
         pass
+    # sob o gunicorn o app é montado no master (preload): nada de conexões nem threads lá;
+    # o post_fork do gunicorn.conf.py aquece cada worker
+    if os.getenv("PREWARM_ON_CREATE", "1") == "1":
+        try:
+            from .services.ai_provider import prewarm_provider
+            prewarm_provider()
+        except Exception as e:
+            print(f"[http] pré-aquecimento ignorado: {e}")
     return app
 
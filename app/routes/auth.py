@@ -6,6 +6,7 @@ auth_bp = Blueprint("auth", __name__)
 PUBLIC_PATHS = {
     "/login",
     "/health",
+    "/metrics",  # coleta do Prometheus, sem sessão
     "/static/",
     "/config",
 }
@@ -1,15 +1,17 @@
-from flask import Blueprint, render_template, request, jsonify
-from ..services.nlp_service import detect_language, preprocess
+from flask import Blueprint, Response, render_template, request, jsonify, stream_with_context
 from ..utils.extract import extract_text_from_pdf, extract_text_from_txt
-from ..services.response_service import build_reply
-import re
+from ..utils.ocr import ocr_pdf
+from ..services.metrics import metrics
+from ..services.pipeline import DOC_ONLY_TEXT, classify_text, classify_batch, prepare, stream_classify, validate_text
+import json
 import os
 import time
 import uuid
+from typing import Optional
 
 email_bp = Blueprint("email", __name__)
 
-REQUIRE_AI = os.getenv("REQUIRE_AI", "true").lower() == "true"
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
 
 
 @email_bp.get("/")
@@ -17,22 +19,49 @@ def index():
     return render_template("index.html")
 
 
-def _pick_intent(*candidates):
-    """CLOSURE vence sempre; depois voto + precedência."""
-    PRIOR = [
-        "CLOSURE", "ERROR", "STATUS", "ATTACHMENT", "ACCESS",
-        "SUPPORT", "THANKS", "GREETINGS", "NON_MESSAGE", "OTHER",
-    ]
-    cands = [c for c in candidates if c]
-    if not cands:
-        return "OTHER"
-    if "CLOSURE" in cands:
-        return "CLOSURE"
-    counts = {k: cands.count(k) for k in set(cands)}
-    return sorted(
-        counts.items(),
-        key=lambda kv: (-kv[1], PRIOR.index(kv[0]) if kv[0] in PRIOR else 99)
-    )[0][0]
+def _email_input(req_id: str):
+    """
+    (raw_text, doc_only, preferred_lang, ocr_info) do form de /classify (arquivo > texto).
+    ValueError com a mensagem do 400 se a entrada não serve.
+    """
+    raw_text = ""
+    had_file = False
+    ocr_info = None
+    if "email_file" in request.files and request.files["email_file"].filename:
+        had_file = True
+        f = request.files["email_file"]
+        name = f.filename.lower()
+        t_ext = time.perf_counter()
+        if name.endswith(".pdf"):
+            raw_text = extract_text_from_pdf(f.stream)
+            metrics.observe("stage_seconds", time.perf_counter() - t_ext, stage="extract")
+            if not raw_text.strip():
+                # PDF sem camada de texto (scan): OCR no pool de processos, com prazo
+                raw_text, ocr_info = ocr_pdf(f.stream)
+                print(f"[{req_id}] OCR: {ocr_info}")
+                metrics.observe("stage_seconds", ocr_info["elapsed_ms"] / 1000, stage="ocr")
+        elif name.endswith(".txt"):
+            raw_text = extract_text_from_txt(f.stream)
+            metrics.observe("stage_seconds", time.perf_counter() - t_ext, stage="extract")
+        else:
+            raise ValueError("Formato de arquivo não suportado. Envie .txt ou .pdf.")
+    else:
+        raw_text = request.form.get("email_text", "")
+
+    # Caso especial: arquivo enviado mas o PDF é só imagem (sem texto)
+    doc_only = False
+    if had_file and (not raw_text or not raw_text.strip()):
+        doc_only = True
+        # placeholder só para seguir o pipeline sem dar 400
+        raw_text = DOC_ONLY_TEXT
+
+    # Se não tem arquivo e nem texto, aí sim erro
+    err = validate_text(raw_text, doc_only)
+    if err:
+        raise ValueError(err)
+
+    # preferência de idioma vinda do front (pt|en|auto)
+    return raw_text, doc_only, request.form.get("preferred_lang"), ocr_info
 
 
 @email_bp.post("/classify")
@@ -40,195 +69,147 @@ def classify():
     req_id = str(uuid.uuid4())[:8]
     t0 = time.perf_counter()
 
-    def _lang_mismatch(target: str, txt: str) -> bool:
-        if not txt:
-            return False
-        low = (txt or "").lower()
-        if target == "en":
-            pt_markers = ["olá", "prezado", "prezada", "obrigado", "obrigada", "atenciosamente", "equipe de suporte", "favor"]
-            if any(m in low for m in pt_markers):
-                return True
-        if target == "pt":
-            en_markers = ["hi,", "dear", "thank you", "thanks", "best regards", "support team"]
-            if any(m in low for m in en_markers):
-                return True
-        try:
-            det = detect_language(txt)
-            return det != target
-        except Exception:
-            return False
-
     try:
-        # ------------------ arquivo > texto ------------------
-        raw_text = ""
-        had_file = False
-        if "email_file" in request.files and request.files["email_file"].filename:
-            had_file = True
-            f = request.files["email_file"]
-            name = f.filename.lower()
-            if name.endswith(".pdf"):
-                raw_text = extract_text_from_pdf(f.stream)
-            elif name.endswith(".txt"):
-                raw_text = extract_text_from_txt(f.stream)
-            else:
-                return jsonify({"ok": False, "error": "Formato de arquivo não suportado. Envie .txt ou .pdf."}), 400
-        else:
-            raw_text = request.form.get("email_text", "")
-
-        # Caso especial: arquivo enviado mas o PDF é só imagem (sem texto)
-        doc_only = False
-        if had_file and (not raw_text or not raw_text.strip()):
-            doc_only = True
-            # placeholder só para seguir o pipeline sem dar 400
-            raw_text = "(arquivo anexado sem texto extraível; provável imagem/scan)"
-
-        # Se não tem arquivo e nem texto, aí sim erro
-        if not doc_only and (not raw_text or not raw_text.strip()):
-            return jsonify({"ok": False, "error": "Nenhum texto de email fornecido."}), 400
-        if len(raw_text.strip()) < 10 and not doc_only:
-            return jsonify({"ok": False, "error": "Texto muito curto para classificar. Envie mais detalhes."}), 400
-
-        # preferência de idioma vinda do front (pt|en|auto)
-        preferred_lang = (request.form.get("preferred_lang") or "").strip().lower()
-        if preferred_lang not in ("pt", "en", "auto"):
-            preferred_lang = "auto"
-
-        # ------------------ NLP básico ------------------
-        lang = detect_language(raw_text)           # 'pt' ou 'en'
-        clean = preprocess(raw_text, lang=lang)
-        chosen_lang = lang if preferred_lang == "auto" else preferred_lang
-
-        # ------------------ IA (HF/OpenAI/Fastpath) ------------------
-        from ..services.ai_provider import ai_classify, ai_generate_reply, AIClassifyResult, fastpath_from_config
-        ai_start = time.perf_counter()
-        ai_res: AIClassifyResult = ai_classify(raw_text)
-        ai_ms = int((time.perf_counter() - ai_start) * 1000)
-
-        # ------------------ Intenções locais/config ------------------
-        from ..services.classifier_service import classifier_service, detect_intent
-        intent_local = detect_intent(raw_text, lang)
-        fp = fastpath_from_config(raw_text) or {}
-        intent_cfg = fp.get("intent")
-
-        # ------------------ Escolha da fonte de classificação ------------------
-        label_api = None
-        label_local = None
-        top_feats = []
-        intent_api = None
-        proba = 0.0
-
-        if ai_res.ok:
-            label_api = ai_res.category
-            proba = ai_res.confidence or 0.0
-            intent_api = ai_res.intent
-            ai_source = ai_res.raw.get("source") or "api"
-        else:
-            ai_source = "unavailable"
-            if REQUIRE_AI:
-                debug = {
-                    "req_id": req_id,
-                    "provider_env": os.getenv("PROVIDER", "").lower(),
-                    "require_ai": True,
-                    "ai_source": "unavailable",
-                    "ai_error": ai_res.raw.get("error") if ai_res and ai_res.raw else "unknown",
-                    "elapsed_ms_total": int((time.perf_counter() - t0) * 1000),
-                    "elapsed_ms_ai": ai_ms,
-                }
-                print(f"[{req_id}] IA indisponível e REQUIRE_AI=true. Erro={debug['ai_error']}")
-                return jsonify({"ok": False, "error": "Falha ao chamar o provedor de IA. Verifique a chave/modelo.", "debug": debug}), 502
-
-            # Fallback local permitido
-            label_local, proba, top_feats = classifier_service.predict(clean)
-            ai_source = "local_fallback"
-
-        # Se for documento puro (scan), força NON_MESSAGE/Improdutivo
-        if doc_only:
-            intent = "NON_MESSAGE"
-        else:
-            intent = _pick_intent(intent_api, intent_local, intent_cfg)
+        try:
+            raw_text, doc_only, preferred_lang, ocr_info = _email_input(req_id)
+        except ValueError as e:
+            metrics.inc("requests_total", status=400)
+            return jsonify({"ok": False, "error": str(e)}), 400
+
+        body, status = classify_text(raw_text, preferred_lang, doc_only, req_id=req_id, t0=t0)
+        if ocr_info is not None and isinstance(body.get("debug"), dict):
+            body["debug"]["ocr"] = ocr_info
+        return jsonify(body), status
+    except Exception as e:
+        print(f"[{req_id}] ERROR: {e}")
+        metrics.inc("requests_total", status=500)
+        return jsonify({"ok": False, "error": str(e)}), 500
 
-            ERROR_SIGNS = r"\b(erro|falha|bug|inoperante|indispon[ií]vel|lentid[aã]o|exce[cç][aã]o|problema|incidente|error|failure|crash|timeout|stacktrace|exception|issue|incident)\b"
-            if intent == "ATTACHMENT" and re.search(ERROR_SIGNS, (raw_text or "").lower()):
-                intent = "ERROR"
 
-        PRODUCTIVE = {"STATUS", "ATTACHMENT", "ACCESS", "ERROR", "SUPPORT"}
-        forced_label = "Improdutivo" if intent == "NON_MESSAGE" else ("Produtivo" if intent in PRODUCTIVE else "Improdutivo")
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-        source_label = label_api if ai_res.ok else label_local
-        source_conf = float(proba or 0.0)
-        if source_label and source_label != forced_label:
-            source_conf = min(source_conf, 0.75)
 
-        label = forced_label
-        proba = source_conf
+@email_bp.post("/classify/stream")
+def classify_stream():
+    """
+    Mesma entrada de /classify, resposta em Server-Sent Events:
+    classification -> token* -> done (ou error). Erros de entrada continuam JSON 400.
+    """
+    req_id = str(uuid.uuid4())[:8]
+    t0 = time.perf_counter()
 
-        # ------------------ Geração da resposta ------------------
-        reply_pt = reply_en = ""
-        reply_source = "local_template"
-        gen_start = time.perf_counter()
-        try:
-            if ai_res.ok and not doc_only:
-                order = [chosen_lang, "en" if chosen_lang == "pt" else "pt"]
-                out = {}
-                for L in order:
-                    gen = (ai_generate_reply(raw_text, label, intent, L) or "").strip()
-                    if gen and _lang_mismatch(L, gen):
-                        print(f"[{req_id}] descartando resposta {L} por mismatch de idioma")
-                        gen = ""
-                    out[L] = gen
-                reply_pt = out.get("pt", "")
-                reply_en = out.get("en", "")
-                if reply_pt or reply_en:
-                    reply_source = ai_res.raw.get("source") or "api"
-        except Exception as e:
-            print(f"[{req_id}] Erro ao gerar resposta via IA: {e}")
-
-
-        if not reply_pt:
-            reply_pt = build_reply(raw_text, category=label, lang='pt', intent=intent).strip()
-        if not reply_en:
-            reply_en = build_reply(raw_text, category=label, lang='en', intent=intent).strip()
-        gen_ms = int((time.perf_counter() - gen_start) * 1000)
-
-        # ------------------ Debug & retorno ------------------
-        debug = {
-            "req_id": req_id,
-            "provider_env": os.getenv("PROVIDER", "").lower(),
-            "require_ai": REQUIRE_AI,
-            "ai_source": ai_source,
-            "reply_source": reply_source,
-            "intent_api": intent_api,
-            "intent_local": intent_local,
-            "intent_cfg": intent_cfg,
-            "intent_final": intent,
-            "label_api": label_api,
-            "label_local": label_local,
-            "label_final": label,
-            "conf_final": float(proba),
-            "elapsed_ms_ai": ai_ms,
-            "elapsed_ms_gen": gen_ms,
-            "elapsed_ms_total": int((time.perf_counter() - t0) * 1000),
-            "doc_only": doc_only,
-        }
-        print(f"[{req_id}] DEBUG: {debug}")
-
-        return jsonify({
-            "ok": True,
-            "category": label,
-            "probability": round(float(proba or 0.0), 3),
-            "reply_pt": reply_pt,
-            "reply_en": reply_en,
-            "reply_lang_default": (lang if preferred_lang == "auto" else preferred_lang),
-            "explanation": {
-                "top_features": top_feats,
-                "language": lang,
-                "intent": intent
-            },
-            "debug": debug,
-            "text_preview": raw_text[:2000]
-        })
+    try:
+        raw_text, doc_only, preferred_lang, ocr_info = _email_input(req_id)
+    except ValueError as e:
+        metrics.inc("requests_total", status=400)
+        return jsonify({"ok": False, "error": str(e)}), 400
     except Exception as e:
         print(f"[{req_id}] ERROR: {e}")
+        metrics.inc("requests_total", status=500)
         return jsonify({"ok": False, "error": str(e)}), 500
 
+    def generate():
+        try:
+            t_nlp = time.perf_counter()
+            prep = prepare(raw_text, preferred_lang, doc_only)
+            metrics.observe("stage_seconds", time.perf_counter() - t_nlp, stage="nlp")
+            for event, data in stream_classify(prep, req_id=req_id, t0=t0):
+                if event == "done" and ocr_info is not None:
+                    data["debug"]["ocr"] = ocr_info
+                yield _sse(event, data)
+        except Exception as e:
+            print(f"[{req_id}] ERROR: {e}")
+            metrics.inc("requests_total", status=500)
+            yield _sse("error", {"ok": False, "error": str(e), "status": 500})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # sem cache e sem buffer de proxy (nginx), senão os eventos chegam todos no fim
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def parse_batch(is_json: bool, body: str):
+    """
+    Aceita um array JSON ou JSONL (um email por linha).
+    Cada item pode ser uma string ou {"id", "text"|"email_text", "preferred_lang"}.
+    Item com campo de tipo errado segue com "error" e sai como uma linha 400 no resultado.
+    Compartilhado com o modo assíncrono (asgi.py).
+    """
+    if is_json:
+        try:
+            data = json.loads(body) if body.strip() else None
+        except Exception:
+            data = None
+        if isinstance(data, dict):
+            data = data.get("emails")
+        if not isinstance(data, list):
+            raise ValueError("Envie um array JSON de emails.")
+    else:
+        data = []
+        for n, line in enumerate(body.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                data.append(json.loads(line))
+            except Exception:
+                raise ValueError(f"JSONL inválido na linha {n}.")
+
+    items = []
+    for entry in data:
+        if isinstance(entry, str):
+            entry = {"text": entry}
+        if not isinstance(entry, dict):
+            raise ValueError("Cada item deve ser uma string ou um objeto com 'text'.")
+        text = entry.get("text") or entry.get("email_text") or ""
+        lang = entry.get("preferred_lang")
+        error = None
+        if not isinstance(text, str):
+            error, text = "'text' deve ser uma string.", ""
+        elif lang is not None and not isinstance(lang, str):
+            error, lang = "'preferred_lang' deve ser uma string (pt, en ou auto).", None
+        items.append({"id": entry.get("id"), "text": text, "preferred_lang": lang, "error": error})
+    return items
+
+
+def batch_error(items) -> Optional[tuple[str, int]]:
+    """(mensagem, status) se o lote não pode seguir."""
+    if not items:
+        return "Nenhum email no lote.", 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return f"Lote excede o limite de {BATCH_MAX_ITEMS} emails.", 413
+    return None
+
+
+@email_bp.post("/classify/batch")
+def classify_batch_route():
+    try:
+        items = parse_batch(request.is_json, request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    err = batch_error(items)
+    if err:
+        return jsonify({"ok": False, "error": err[0]}), err[1]
+
+    def _line(i, body, status):
+        body = dict(body, index=i, id=items[i]["id"], status=status)
+        return json.dumps(body, ensure_ascii=False) + "\n"
+
+    def generate():
+        valid = []
+        for i, it in enumerate(items):
+            err = it["error"] or validate_text(it["text"])
+            if err:
+                metrics.inc("requests_total", status=400)
+                yield _line(i, {"ok": False, "error": err}, 400)
+            else:
+                valid.append(i)
+
+        # resultados saem por item, na ordem de conclusão
+        batch = [(items[i]["text"], items[i]["preferred_lang"]) for i in valid]
+        for j, body, status in classify_batch(batch):
+            yield _line(valid[j], body, status)
 
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
@@ -1,4 +1,9 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify
+from ..services.breaker import breakers
+from ..services.cache import result_cache
+from ..services.classifier_service import classifier_service
+from ..services.http_clients import clients
+from ..services.metrics import metrics
 import os
 
 health_bp = Blueprint("health", __name__)
@@ -11,4 +16,14 @@ def healthz():
         "require_ai": os.getenv("REQUIRE_AI", "true").lower(),
         "model_openai": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         "force_api_classify": os.getenv("FORCE_API_CLASSIFY","0"),
+        "cache": result_cache.stats(),
+        "http": clients.stats(),
+        "breakers": breakers.stats(),
+        "models": classifier_service.model_info(),
+        "saturation": metrics.saturation(),
     })
+
+
+@health_bp.get("/metrics")
+def metrics_text():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -1,11 +1,20 @@
 import os
 import json
-import unicodedata
-import requests
+import threading
 import time
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from functools import lru_cache
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, Optional
+
+import httpx
+
+from .breaker import CircuitOpen, breakers
+from .cache import MISS, make_key, normalize_for_key, result_cache
+from .http_clients import clients
+from .singleflight import INFLIGHT, singleflight
+from .metrics import metrics
+from .email_text import EmailLike, normalized
+from .matcher import SUB, KeywordMatcher, norm_text
 
 OPENAI = "openai"
 HF     = "huggingface"
@@ -18,20 +27,36 @@ HUGGINGFACE_API_KEY  = os.getenv("HUGGINGFACE_API_KEY")
 HF_ZEROSHOT_MODEL    = os.getenv("HF_ZEROSHOT_MODEL", "facebook/bart-large-mnli")
 HF_GENERATION_MODEL  = os.getenv("HF_GENERATION_MODEL", "google/flan-t5-base")
 FORCE_API_CLASSIFY   = os.getenv("FORCE_API_CLASSIFY", "0") == "1"
+# "dual" = dois zero-shots (categoria + intenção); "single" = um zero-shot sobre INTENTS
+HF_CLASSIFY_MODE     = os.getenv("HF_CLASSIFY_MODE", "dual").lower()
+# "split" = 3 chamadas (classificação + resposta PT + resposta EN); "oneshot" = uma só, com as duas respostas
+OPENAI_MODE          = os.getenv("OPENAI_MODE", "split").lower()
+OPENAI_ONESHOT_TIMEOUT = float(os.getenv("OPENAI_ONESHOT_TIMEOUT", "20"))
+# modelo de intenção local (classifier_service): confiança mínima para responder sem fastpath,
+# e (opcional, >0) para responder antes mesmo de chamar o provedor remoto
+LOCAL_INTENT_MIN_CONF   = float(os.getenv("LOCAL_INTENT_MIN_CONF", "0.5"))
+LOCAL_FIRST_MIN_CONF    = float(os.getenv("LOCAL_FIRST_MIN_CONF", "0"))
 
 HF_TIMEOUT = int(os.getenv("HF_TIMEOUT", "20"))
 HF_RETRIES = int(os.getenv("HF_RETRIES", "3"))
 HF_BACKOFF = float(os.getenv("HF_BACKOFF", "1.5"))
+HF_USE_CACHE = os.getenv("HF_USE_CACHE", "1") == "1"  # cache do lado da Inference API
+HF_API_URL = "https://api-inference.huggingface.co"
+OPENAI_API_URL = "https://api.openai.com"
+
+# incrementar sempre que os prompts mudarem: invalida o cache de resultados
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "1")
 
 CATEGORIES = ["Produtivo", "Improdutivo"]
 INTENTS = [
     "STATUS","ATTACHMENT","ACCESS","ERROR","CLOSURE",
     "THANKS","GREETINGS","SUPPORT","NON_MESSAGE","OTHER"
 ]
+PRODUCTIVE = {"STATUS", "ATTACHMENT", "ACCESS", "ERROR", "SUPPORT"}
 
-@lru_cache(maxsize=256)
-def _memo_key(text, provider, model):
-    return text.strip(), provider, model
+def _memo_key(kind, text, provider, model, *extra):
+    """Chave do cache: hash do texto normalizado + provedor + modelo + versão do prompt."""
+    return make_key(kind, normalize_for_key(text), provider, model, PROMPT_VERSION, *extra)
 
 @dataclass
 class AIClassifyResult:
@@ -70,63 +95,101 @@ def _trim_text(text: str, limit: int = 4000) -> str:
     half = limit // 2
     return t[:half] + "\n...\n" + t[-half:]
 
-def _openai_classify_and_intent(text: str) -> AIClassifyResult:
-    import os
-    import openai as _openai
-    _openai.api_key = OPENAI_API_KEY
-    req_timeout = float(os.getenv("OPENAI_TIMEOUT", "10"))
-    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-
-    system = (
-        "Você é um classificador de emails corporativos. "
-        "Classifique o CONTEÚDO como categoria Produtivo ou Improdutivo, e a subintenção em "
-        "STATUS|ATTACHMENT|ACCESS|ERROR|CLOSURE|THANKS|GREETINGS|SUPPORT|NON_MESSAGE|OTHER.\n"
-        "• NON_MESSAGE quando for majoritariamente um documento não-mensagem (CV, portfólio, contrato etc.).\n"
-        "Responda SOMENTE JSON: "
-        "{\"category\":\"Produtivo|Improdutivo\",\"intent\":\"...\",\"confidence\":0..1}."
-    )
-
-    user = f"""
+def _breaker_names(provider: str, model: str) -> tuple[str, str]:
+    """Um circuito para o provedor inteiro e outro para o modelo."""
+    return provider, f"{provider}:{model}"
+
+def _breaker_failed(names: tuple[str, ...], e: Exception):
+    if isinstance(e, CircuitOpen):
+        return
+    # 4xx (exceto 429) é erro do pedido, não queda do provedor
+    status = getattr(e, "status_code", None)
+    breakers.record(status is not None and status < 500 and status != 429, *names)
+
+def _openai_chat(model: str, messages: list, temperature: float, timeout: float, **extra):
+    """chat.completions.create atrás do circuit breaker (aberto = CircuitOpen na hora)."""
+    names = _breaker_names(OPENAI, model)
+    breakers.check(*names)
+    try:
+        resp = clients.openai(OPENAI_API_KEY).chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+            timeout=timeout,  # <- apenas 'timeout'
+            **extra
+        )
+    except Exception as e:
+        _breaker_failed(names, e)
+        if not isinstance(e, CircuitOpen):
+            metrics.inc("provider_errors_total", provider=OPENAI)
+        raise
+    breakers.record(True, *names)
+    return resp
+
+_OPENAI_CLASSIFY_SYSTEM = (
+    "Você é um classificador de emails corporativos. "
+    "Classifique o CONTEÚDO como categoria Produtivo ou Improdutivo, e a subintenção em "
+    "STATUS|ATTACHMENT|ACCESS|ERROR|CLOSURE|THANKS|GREETINGS|SUPPORT|NON_MESSAGE|OTHER.\n"
+    "• NON_MESSAGE quando for majoritariamente um documento não-mensagem (CV, portfólio, contrato etc.).\n"
+)
+
+_OPENAI_CLASSIFY_RULES = """
 Regras rápidas:
 - Se houver pedido claro (status, erro, acesso etc.), category=Produtivo e intent correspondente.
 - Documento genérico (CV/Resume, portfolio, manual, política, anúncio): intent=NON_MESSAGE e category=Improdutivo.
 - Exemplos:
-  • "Segue currículo..." -> {{"category":"Improdutivo","intent":"NON_MESSAGE","confidence":0.9}}
-  • "Erro ao salvar, ver prints" -> {{"category":"Produtivo","intent":"ERROR","confidence":0.9}}
-  • "Obrigado, era só isso." -> {{"category":"Improdutivo","intent":"THANKS","confidence":0.9}}
-
-Conteúdo:
-{_trim_text(text)}
+  • "Segue currículo..." -> {"category":"Improdutivo","intent":"NON_MESSAGE","confidence":0.9}
+  • "Erro ao salvar, ver prints" -> {"category":"Produtivo","intent":"ERROR","confidence":0.9}
+  • "Obrigado, era só isso." -> {"category":"Improdutivo","intent":"THANKS","confidence":0.9}
 """
 
-    try:
-        t0 = time.perf_counter()
-        resp = _openai.chat.completions.create(
-            model=model,
-            temperature=0.0,
-            messages=[{"role": "system", "content": system},
-                      {"role": "user", "content": user}],
-            timeout=req_timeout  # <- apenas 'timeout'
-        )
-        ms = int((time.perf_counter() - t0) * 1000)
-        print(f"[openai] classify ms={ms}")
+def _openai_classify_messages(text: str) -> list:
+    system = _OPENAI_CLASSIFY_SYSTEM + (
+        "Responda SOMENTE JSON: "
+        "{\"category\":\"Produtivo|Improdutivo\",\"intent\":\"...\",\"confidence\":0..1}."
+    )
+    user = f"{_OPENAI_CLASSIFY_RULES}\nConteúdo:\n{_trim_text(text)}\n"
+    return [{"role": "system", "content": system},
+            {"role": "user", "content": user}]
 
-        raw = (resp.choices[0].message.content or "").strip()
-        try:
-            data = json.loads(raw)
-        except Exception:
-            data = {}
+def _openai_json(resp) -> dict:
+    raw = (resp.choices[0].message.content or "").strip()
+    try:
+        data = json.loads(raw)
+    except Exception:
+        data = {}
+    return data if isinstance(data, dict) else {}
 
-        cat = (data.get("category") or "").strip().title()
-        if cat not in CATEGORIES:
-            cat = "Improdutivo" if (data.get("intent", "").upper() == "NON_MESSAGE") else "Produtivo"
+def _openai_labels(data: dict) -> tuple[str, str, float]:
+    """(categoria, intenção, confiança) do JSON do modelo; campo ausente/inválido cai no padrão."""
+    intent = str(data.get("intent") or "").strip().upper()
+    if intent not in INTENTS:
+        intent = "OTHER"
 
-        intent = (data.get("intent") or "").strip().upper()
-        if intent not in INTENTS:
-            intent = "OTHER"
+    cat = str(data.get("category") or "").strip().title()
+    if cat not in CATEGORIES:
+        cat = "Improdutivo" if intent == "NON_MESSAGE" else "Produtivo"
 
+    try:
         conf = float(data.get("confidence", 0.65))
-        return AIClassifyResult(True, cat, intent, conf, {"source": "openai", "openai_raw": data})
+    except (TypeError, ValueError):
+        conf = 0.65
+    return cat, intent, conf
+
+def _openai_classify_result(resp) -> AIClassifyResult:
+    data = _openai_json(resp)
+    cat, intent, conf = _openai_labels(data)
+    return AIClassifyResult(True, cat, intent, conf, {"source": "openai", "openai_raw": data})
+
+def _openai_classify_and_intent(text: str) -> AIClassifyResult:
+    req_timeout = float(os.getenv("OPENAI_TIMEOUT", "10"))
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    try:
+        t0 = time.perf_counter()
+        resp = _openai_chat(model, _openai_classify_messages(text), temperature=0.0, timeout=req_timeout)
+        ms = int((time.perf_counter() - t0) * 1000)
+        print(f"[openai] classify ms={ms}")
+        return _openai_classify_result(resp)
 
     except Exception as e:
         print(f"[openai] ERROR classify: {e}")
@@ -135,58 +198,60 @@ Conteúdo:
 
 
 # --- OPENAI: gerar resposta ---
+OPENAI_REPLY_TONE = {
+    "pt": "Use tom corporativo, objetivo e cordial. Retorne APENAS o corpo do e-mail.",
+    "en": "Use a corporate, concise and polite tone. Return ONLY the email body.",
+}
+OPENAI_REPLY_INSTRUCTIONS = {
+    "pt": {
+        "STATUS":"Informe que estamos verificando o status; peça ticket/logs se necessário.",
+        "ATTACHMENT":"Confirme recebimento do arquivo e que será avaliado; próximos passos em breve.",
+        "ACCESS":"Peça e-mail de login e mensagem de bloqueio; ofereça desbloqueio/reset.",
+        "ERROR":"Se mencionar anexos, confirme; senão peça passos, horário e logs/prints.",
+        "CLOSURE":"Agradeça e confirme encerramento; à disposição.",
+        "THANKS":"Agradeça; sem ação.",
+        "GREETINGS":"Agradeça os votos; sem ação.",
+        "NON_MESSAGE":"Agradeça o documento; explique que esta caixa é para suporte; sem ação.",
+        "OTHER":"Confirme recebimento; retornaremos em breve."
+    },
+    "en": {
+        "STATUS":"We're checking the status; ask for ticket/logs if needed.",
+        "ATTACHMENT":"Confirm file receipt; will review and follow up.",
+        "ACCESS":"Ask for login e-mail / lockout message; offer unlock/password reset.",
+        "ERROR":"If attachments mentioned, acknowledge them; else ask steps, time, logs/screens.",
+        "CLOSURE":"Thank and confirm closure; stay available.",
+        "THANKS":"Thank you; no action.",
+        "GREETINGS":"Thanks for the wishes; no action.",
+        "NON_MESSAGE":"Thanks for the document; note this inbox is for support; no action.",
+        "OTHER":"Confirm receipt; will analyze and follow up soon."
+    },
+}
+OPENAI_REPLY_SIGN = {
+    "pt": "Atenciosamente,\nEquipe de Suporte",
+    "en": "Best regards,\nSupport Team",
+}
+
+def _openai_reply_messages(text: str, category: str, intent: str, lang: str) -> list:
+    L = "en" if lang == "en" else "pt"
+    prompt = (
+        f"E-mail original:\n{_trim_text(text)}\n\n"
+        f"Categoria: {category}\n"
+        f"Subintenção: {intent}\n\n"
+        f"Instrução: {OPENAI_REPLY_INSTRUCTIONS[L].get(intent,'OTHER')}\n"
+        f"{OPENAI_REPLY_TONE[L]}\n\n"
+        f"Assinatura: {OPENAI_REPLY_SIGN[L]} (anexe ao final)"
+    )
+    return [{"role": "system", "content": "Você redige respostas de e-mail."},
+            {"role": "user", "content": prompt}]
+
 def _openai_generate_reply(text: str, category: str, intent: str, lang: str) -> str:
     try:
-        import os
-        import openai as _openai
-        _openai.api_key = OPENAI_API_KEY
         req_timeout = float(os.getenv("OPENAI_GEN_TIMEOUT", "10"))
         model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
-        tone_pt = "Use tom corporativo, objetivo e cordial. Retorne APENAS o corpo do e-mail."
-        tone_en = "Use a corporate, concise and polite tone. Return ONLY the email body."
-        instructions_pt = {
-            "STATUS":"Informe que estamos verificando o status; peça ticket/logs se necessário.",
-            "ATTACHMENT":"Confirme recebimento do arquivo e que será avaliado; próximos passos em breve.",
-            "ACCESS":"Peça e-mail de login e mensagem de bloqueio; ofereça desbloqueio/reset.",
-            "ERROR":"Se mencionar anexos, confirme; senão peça passos, horário e logs/prints.",
-            "CLOSURE":"Agradeça e confirme encerramento; à disposição.",
-            "THANKS":"Agradeça; sem ação.",
-            "GREETINGS":"Agradeça os votos; sem ação.",
-            "NON_MESSAGE":"Agradeça o documento; explique que esta caixa é para suporte; sem ação.",
-            "OTHER":"Confirme recebimento; retornaremos em breve."
-        }
-        instructions_en = {
-            "STATUS":"We're checking the status; ask for ticket/logs if needed.",
-            "ATTACHMENT":"Confirm file receipt; will review and follow up.",
-            "ACCESS":"Ask for login e-mail / lockout message; offer unlock/password reset.",
-            "ERROR":"If attachments mentioned, acknowledge them; else ask steps, time, logs/screens.",
-            "CLOSURE":"Thank and confirm closure; stay available.",
-            "THANKS":"Thank you; no action.",
-            "GREETINGS":"Thanks for the wishes; no action.",
-            "NON_MESSAGE":"Thanks for the document; note this inbox is for support; no action.",
-            "OTHER":"Confirm receipt; will analyze and follow up soon."
-        }
-        sign_pt = "Atenciosamente,\nEquipe de Suporte"
-        sign_en = "Best regards,\nSupport Team"
-
-        prompt = (
-            f"E-mail original:\n{_trim_text(text)}\n\n"
-            f"Categoria: {category}\n"
-            f"Subintenção: {intent}\n\n"
-            f"Instrução: {(instructions_en if lang=='en' else instructions_pt).get(intent,'OTHER')}\n"
-            f"{tone_en if lang=='en' else tone_pt}\n\n"
-            f"Assinatura: {(sign_en if lang=='en' else sign_pt)} (anexe ao final)"
-        )
-
         t0 = time.perf_counter()
-        resp = _openai.chat.completions.create(
-            model=model,
-            temperature=0.2,
-            messages=[{"role": "system", "content": "Você redige respostas de e-mail."},
-                      {"role": "user", "content": prompt}],
-            timeout=req_timeout  # <- apenas 'timeout'
-        )
+        resp = _openai_chat(model, _openai_reply_messages(text, category, intent, lang),
+                            temperature=0.2, timeout=req_timeout)
         ms = int((time.perf_counter() - t0) * 1000)
         print(f"[openai] generate ms={ms}")
         return (resp.choices[0].message.content or "").strip()
@@ -195,19 +260,110 @@ def _openai_generate_reply(text: str, category: str, intent: str, lang: str) ->
         print(f"[openai] ERROR generate: {e}")
         return ""
 
+def _openai_stream_reply(text: str, category: str, intent: str, lang: str) -> Iterator[str]:
+    """Mesma geração de _openai_generate_reply, em pedaços (stream=True); erros sobem para quem consome."""
+    req_timeout = float(os.getenv("OPENAI_GEN_TIMEOUT", "10"))
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    names = _breaker_names(OPENAI, model)
 
-# -------------------- Hugging Face--------------------
-def _hf_post(model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    breakers.check(*names)
+    try:
+        stream = clients.openai(OPENAI_API_KEY).chat.completions.create(
+            model=model,
+            temperature=0.2,
+            messages=_openai_reply_messages(text, category, intent, lang),
+            timeout=req_timeout,  # com stream, vale por leitura
+            stream=True,
+        )
+        try:
+            first = True
+            for chunk in stream:
+                piece = chunk.choices[0].delta.content if chunk.choices else None
+                if piece:
+                    if first:
+                        print(f"[openai] generate first token ms={int((time.perf_counter() - t0) * 1000)}")
+                        first = False
+                    yield piece
+        finally:
+            stream.close()  # cliente desistiu no meio: fecha a conexão do stream
+    except Exception as e:
+        _breaker_failed(names, e)
+        if not isinstance(e, CircuitOpen):
+            metrics.inc("provider_errors_total", provider=OPENAI)
+        raise
+    breakers.record(True, *names)
+    print(f"[openai] generate ms={int((time.perf_counter() - t0) * 1000)} (stream)")
+
+# --- OPENAI: classificação + respostas PT/EN numa chamada só (OPENAI_MODE=oneshot) ---
+def _openai_oneshot_messages(text: str) -> list:
+    system = _OPENAI_CLASSIFY_SYSTEM + (
+        "Depois redija a resposta ao e-mail em português (reply_pt) e em inglês (reply_en), "
+        "seguindo a instrução da subintenção escolhida. "
+        "Tom corporativo, objetivo e cordial; cada resposta só com o corpo do e-mail, "
+        "terminando com a assinatura do idioma.\n"
+        "Responda SOMENTE JSON: "
+        "{\"category\":\"Produtivo|Improdutivo\",\"intent\":\"...\",\"confidence\":0..1,"
+        "\"reply_pt\":\"...\",\"reply_en\":\"...\"}."
+    )
+    instructions = "\n".join(f"- {k}: {v}" for k, v in OPENAI_REPLY_INSTRUCTIONS["pt"].items())
+    user = (
+        f"{_OPENAI_CLASSIFY_RULES}\n"
+        f"Instruções de resposta por subintenção:\n{instructions}\n\n"
+        f"Assinatura PT: {OPENAI_REPLY_SIGN['pt']}\nAssinatura EN: {OPENAI_REPLY_SIGN['en']}\n\n"
+        f"Conteúdo:\n{_trim_text(text)}\n"
+    )
+    return [{"role": "system", "content": system},
+            {"role": "user", "content": user}]
+
+def _openai_oneshot_result(resp) -> AIClassifyResult:
     """
-    Chamada robusta à Inference API com:
-    - retries exponenciais (503 = modelo carregando / 429 = rate limit)
-    - options.wait_for_model/use_cache para estabilidade
-    - logs de latência/status
+    Mesma validação de categoria/intenção do modo split; as respostas ficam em raw["replies"]
+    (só as que vieram preenchidas — o idioma que faltar é gerado à parte pelo pipeline).
     """
+    data = _openai_json(resp)
+    cat, intent, conf = _openai_labels(data)
+    replies = {}
+    for lang in ("pt", "en"):
+        reply = data.pop(f"reply_{lang}", None)
+        if isinstance(reply, str) and reply.strip():
+            replies[lang] = reply.strip()
+    return AIClassifyResult(True, cat, intent, conf, {"source": "openai", "openai_raw": data, "replies": replies})
+
+def _openai_oneshot(text: str) -> AIClassifyResult:
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    try:
+        t0 = time.perf_counter()
+        resp = _openai_chat(model, _openai_oneshot_messages(text), temperature=0.0,
+                            timeout=OPENAI_ONESHOT_TIMEOUT, response_format={"type": "json_object"})
+        ms = int((time.perf_counter() - t0) * 1000)
+        print(f"[openai] oneshot ms={ms}")
+        return _openai_oneshot_result(resp)
+
+    except Exception as e:
+        print(f"[openai] ERROR oneshot: {e}")
+        return AIClassifyResult(False, "", "OTHER", 0.0, {"error": str(e)})
+
+def _openai_classifier():
+    """(função, id do modelo p/ cache) conforme OPENAI_MODE."""
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    if OPENAI_MODE == "oneshot":
+        return _openai_oneshot, f"{model}:oneshot"
+    return _openai_classify_and_intent, model
+
+
+# -------------------- Hugging Face--------------------
+def _hf_backoff(attempt: int):
+    """Espera entre tentativas; depois da última não há por que dormir."""
+    if attempt < HF_RETRIES:
+        time.sleep(HF_BACKOFF ** attempt)
+
+def _hf_request(model: str, payload: Dict[str, Any]) -> tuple[str, dict, Dict[str, Any]]:
+    """(url, headers, payload com options.wait_for_model/use_cache) de uma chamada à Inference API."""
     if not HUGGINGFACE_API_KEY:
         raise RuntimeError("HUGGINGFACE_API_KEY ausente")
 
-    url = f"https://api-inference.huggingface.co/models/{model}"
+    url = f"{HF_API_URL}/models/{model}"
     headers = {
         "Authorization": f"Bearer {HUGGINGFACE_API_KEY}",
         "Accept": "application/json",
@@ -218,71 +374,98 @@ def _hf_post(model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     opts.setdefault("wait_for_model", True)
     opts.setdefault("use_cache", True)
     payload["options"] = opts
+    return url, headers, payload
+
+def _hf_response(r: httpx.Response, model: str, attempt: int, ms: int,
+                 names: tuple[str, ...]) -> tuple[Any, Optional[Exception]]:
+    """Trata a resposta HTTP: (saída, None) se deu certo, (None, erro) para tentar de novo."""
+    if r.status_code in (503, 429):
+        breakers.record(False, *names)
+        metrics.inc("provider_errors_total", provider=HF)
+        print(f"[hf] {r.status_code} (retry) model={model} attempt={attempt}/{HF_RETRIES} ms={ms}")
+        return None, RuntimeError(f"HF {r.status_code}")
+
+    if r.status_code != 200:
+        # 4xx é erro do pedido, não queda do provedor
+        breakers.record(r.status_code < 500, *names)
+        try:
+            body = r.json()
+        except Exception:
+            body = {"text": r.text[:200]}
+        err = RuntimeError(f"HF non-200 {r.status_code}: {body}")
+        metrics.inc("provider_errors_total", provider=HF)
+        print(f"[hf] post error model={model} attempt={attempt}/{HF_RETRIES}: {err}")
+        return None, err
+
+    out = r.json()
+    if isinstance(out, dict) and out.get("error"):
+        breakers.record(False, *names)
+        err = out.get("error", "")
+        metrics.inc("provider_errors_total", provider=HF)
+        print(f"[hf] 200-with-error: {err}")
+        return None, RuntimeError(err)
+
+    breakers.record(True, *names)
+    print(f"[hf] ok model={model} ms={ms}")
+    return out, None
+
+def _hf_failed(e: Exception, model: str, attempt: int, names: tuple[str, ...]) -> Exception:
+    """Falha de transporte (timeout, conexão, JSON inválido): registra e devolve o erro."""
+    breakers.record(False, *names)
+    metrics.inc("provider_errors_total", provider=HF)
+    if isinstance(e, httpx.TimeoutException):
+        print(f"[hf] timeout model={model} attempt={attempt}/{HF_RETRIES}")
+        return RuntimeError("HF timeout")
+    print(f"[hf] post error model={model} attempt={attempt}/{HF_RETRIES}: {e}")
+    return e
 
+def _hf_post(model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chamada robusta à Inference API com:
+    - retries exponenciais (503 = modelo carregando / 429 = rate limit)
+    - options.wait_for_model/use_cache para estabilidade
+    - cliente httpx compartilhado (pool keep-alive), sem nova conexão por chamada
+    - circuit breaker por provedor/modelo: aberto = CircuitOpen na hora, sem retries
+    - logs de latência/status
+    """
+    url, headers, payload = _hf_request(model, payload)
+    names = _breaker_names(HF, model)
     last_err: Optional[Exception] = None
     for attempt in range(1, HF_RETRIES + 1):
+        breakers.check(*names)  # aberto: falha na hora, sem dormir nem gastar retry
+        if attempt > 1:
+            metrics.inc("provider_retries_total", provider=HF)
         try:
             t0 = time.perf_counter()
-            r = requests.post(url, headers=headers, json=payload, timeout=HF_TIMEOUT)
+            r = clients.http().post(url, headers=headers, json=payload, timeout=HF_TIMEOUT)
             ms = int((time.perf_counter() - t0) * 1000)
-
-            if r.status_code in (503, 429):
-                print(f"[hf] {r.status_code} (retry) model={model} attempt={attempt}/{HF_RETRIES} ms={ms}")
-                time.sleep((HF_BACKOFF ** attempt))
-                continue
-
-            if r.status_code != 200:
-                try:
-                    body = r.json()
-                except Exception:
-                    body = {"text": r.text[:200]}
-                raise RuntimeError(f"HF non-200 {r.status_code}: {body}")
-
-            out = r.json()
-            if isinstance(out, dict) and out.get("error"):
-                err = out.get("error", "")
-                print(f"[hf] 200-with-error: {err}")
-                time.sleep((HF_BACKOFF ** attempt))
-                last_err = RuntimeError(err)
-                continue
-
-            print(f"[hf] ok model={model} ms={ms}")
-            return out
-
-        except requests.Timeout:
-            last_err = RuntimeError("HF timeout")
-            print(f"[hf] timeout model={model} attempt={attempt}/{HF_RETRIES}")
-            time.sleep((HF_BACKOFF ** attempt))
+            out, last_err = _hf_response(r, model, attempt, ms, names)
         except Exception as e:
-            last_err = e
-            print(f"[hf] post error model={model} attempt={attempt}/{HF_RETRIES}: {e}")
-            time.sleep((HF_BACKOFF ** attempt))
+            last_err = _hf_failed(e, model, attempt, names)
+        else:
+            if last_err is None:
+                return out
+        _hf_backoff(attempt)
 
     raise RuntimeError(f"HF POST failed after {HF_RETRIES} attempts: {last_err}")
 
-def _hf_zero_shot(text: str, candidate_labels: list[str]):
-    payload = {
+def _hf_zero_shot_payload(text: str, candidate_labels: list[str]) -> Dict[str, Any]:
+    return {
         "inputs": _trim_text(text),
         "parameters": {
             "candidate_labels": candidate_labels,
             "multi_label": False,
             "hypothesis_template": "This email is about {}."
         },
-        "options": {"wait_for_model": True, "use_cache": True}
+        "options": {"wait_for_model": True, "use_cache": HF_USE_CACHE}
     }
-    return _hf_post(HF_ZEROSHOT_MODEL, payload)
 
+def _hf_zero_shot(text: str, candidate_labels: list[str]):
+    return _hf_post(HF_ZEROSHOT_MODEL, _hf_zero_shot_payload(text, candidate_labels))
 
-def _hf_generate(text: str, instruction: str, lang: str) -> str:
-    """
-    Geração com FLAN-T5 (ou equivalente) via Inference API.
-    - Backoff interno
-    - Trata formatos de retorno (lista/dict) e respostas vazias
-    - Max tokens um pouco maior p/ evitar truncamento
-    """
-    if not HUGGINGFACE_API_KEY:
-        return ""
 
+def _hf_gen_request(text: str, instruction: str, lang: str) -> tuple[list[str], Dict[str, Any]]:
+    """(modelos candidatos, payload) da geração."""
     t = (text or "")
     if len(t) > 4000:
         t = t[:2000] + "\n...\n" + t[-2000:]
@@ -295,113 +478,186 @@ def _hf_generate(text: str, instruction: str, lang: str) -> str:
         f"Reply:\n"
     )
 
-    candidates = [
+    # sem repetir o modelo configurado quando ele já é o padrão
+    candidates = list(dict.fromkeys([
         os.getenv("HF_GENERATION_MODEL", "google/flan-t5-base"),
         "google/flan-t5-base",
         "google/flan-t5-small",
-    ]
+    ]))
 
     params = {
         "max_new_tokens": 220,
         "temperature": 0.2,
         "do_sample": False
     }
+    payload = {
+        "inputs": prompt,
+        "parameters": params,
+        "options": {"wait_for_model": True, "use_cache": True}
+    }
+    return candidates, payload
+
+def _hf_gen_text(out) -> Optional[str]:
+    """Texto gerado (lista/dict), sem o eco do prompt; None se veio vazio (tentar de novo)."""
+    text_out = ""
+    if isinstance(out, list) and out:
+        cand = out[0] or {}
+        text_out = cand.get("generated_text", "")
+    elif isinstance(out, dict):
+        text_out = out.get("generated_text", "")
+    if not text_out:
+        return None
+    if "Reply:" in text_out:
+        text_out = text_out.split("Reply:", 1)[-1].strip()
+    return (text_out or "").strip()
+
+def _hf_generate(text: str, instruction: str, lang: str) -> str:
+    """
+    Geração com FLAN-T5 (ou equivalente) via Inference API.
+    - Backoff interno
+    - Trata formatos de retorno (lista/dict) e respostas vazias
+    - Max tokens um pouco maior p/ evitar truncamento
+    """
+    if not HUGGINGFACE_API_KEY:
+        return ""
 
+    candidates, payload = _hf_gen_request(text, instruction, lang)
     for repo in candidates:
-        payload = {
-            "inputs": prompt,
-            "parameters": params,
-            "options": {"wait_for_model": True, "use_cache": True}
-        }
         for attempt in range(1, HF_RETRIES + 1):
             try:
                 start = time.perf_counter()
-                out = _hf_post(repo, payload)
+                out = _hf_post(repo, dict(payload))
                 ms = int((time.perf_counter() - start) * 1000)
                 print(f"[hf] gen repo={repo} ms={ms} attempt={attempt}/{HF_RETRIES}")
 
-                text_out = ""
-                if isinstance(out, list) and out:
-                    cand = out[0] or {}
-                    text_out = cand.get("generated_text", "")
-                elif isinstance(out, dict):
-                    text_out = out.get("generated_text", "")
-
-                if not text_out:
+                text_out = _hf_gen_text(out)
+                if text_out is None:
                     print("[hf] gen empty response, retrying…")
+                    metrics.inc("provider_retries_total", provider=HF)
                     time.sleep(HF_BACKOFF * attempt)
                     continue
-                if "Reply:" in text_out:
-                    text_out = text_out.split("Reply:", 1)[-1].strip()
-
-                return (text_out or "").strip()
+                return text_out
 
+            except CircuitOpen as e:
+                # modelo (ou provedor) fora do ar: próximo candidato, sem esperar
+                print(f"[hf] gen repo={repo}: {e}")
+                break
             except Exception as e:
                 print(f"[hf] gen error repo={repo} attempt={attempt}/{HF_RETRIES}: {e}")
+                metrics.inc("provider_retries_total", provider=HF)
                 time.sleep(HF_BACKOFF * attempt)
 
     return ""
 
 
 
+def _top_label(res, default: str, default_score: float = 0.6) -> tuple[str, float]:
+    if isinstance(res, dict) and res.get("labels"):
+        return str(res["labels"][0]), float(res["scores"][0])
+    if isinstance(res, list) and res and isinstance(res[0], dict) and res[0].get("labels"):
+        return str(res[0]["labels"][0]), float(res[0]["scores"][0])
+    return default, default_score
+
+def _hf_dual_result(cat_res, intent_res) -> AIClassifyResult:
+    """Resultado do modo dual a partir dos dois zero-shots (categoria e intenção)."""
+    cat, cat_score = _top_label(cat_res, "Produtivo")
+    raw_intent, intent_score = _top_label(intent_res, "OTHER")
+
+    intent = _sanitize_label(raw_intent, INTENTS, "OTHER")
+    cat_norm = _sanitize_label(cat, CATEGORIES, "Produtivo")
+
+    conf = (cat_score + intent_score) / 2.0
+    return AIClassifyResult(
+        True,
+        cat_norm,
+        intent,
+        float(conf),
+        {"source": "huggingface", "hf_raw": {"cat": cat_res, "intent": intent_res}},
+    )
+
 def _hf_classify_and_intent(text: str) -> AIClassifyResult:
     """
     Dois zero-shots independentes (categoria e subintenção), com normalização de saída.
     """
     try:
-        # Categoria: Produtivo | Improdutivo
-        cat_res = _hf_zero_shot(text, ["Produtivo", "Improdutivo"])
-        if isinstance(cat_res, dict) and cat_res.get("labels"):
-            cat = str(cat_res["labels"][0])
-            cat_score = float(cat_res["scores"][0])
-        elif isinstance(cat_res, list) and cat_res and isinstance(cat_res[0], dict) and cat_res[0].get("labels"):
-            cat = str(cat_res[0]["labels"][0])
-            cat_score = float(cat_res[0]["scores"][0])
-        else:
-            cat, cat_score = "Produtivo", 0.6
-
-        # Intenção
+        cat_res = _hf_zero_shot(text, CATEGORIES)
         intent_res = _hf_zero_shot(text, INTENTS)
-        if isinstance(intent_res, dict) and intent_res.get("labels"):
-            raw_intent = str(intent_res["labels"][0])
-            intent_score = float(intent_res["scores"][0])
-        elif isinstance(intent_res, list) and intent_res and isinstance(intent_res[0], dict) and intent_res[0].get("labels"):
-            raw_intent = str(intent_res[0]["labels"][0])
-            intent_score = float(intent_res[0]["scores"][0])
-        else:
-            raw_intent, intent_score = "OTHER", 0.6
-
-        intent = _sanitize_label(raw_intent, INTENTS, "OTHER")
-        cat_norm = _sanitize_label(cat, CATEGORIES, "Produtivo")
-
-        conf = (cat_score + intent_score) / 2.0
-        return AIClassifyResult(
-            True,
-            cat_norm,
-            intent,
-            float(conf),
-            {"source": "huggingface", "hf_raw": {"cat": cat_res, "intent": intent_res}},
-        )
+        return _hf_dual_result(cat_res, intent_res)
     except Exception as e:
         print(f"[hf] ERROR classify: {e}")
         return AIClassifyResult(False, "", "OTHER", 0.0, {"error": str(e)})
 
 
+def _zero_shot_scores(res) -> dict[str, float]:
+    """{rótulo: score} a partir do retorno do zero-shot (dict ou lista com um dict)."""
+    if isinstance(res, list) and res and isinstance(res[0], dict):
+        res = res[0]
+    if not isinstance(res, dict) or not res.get("labels"):
+        return {}
+    return {str(l): float(sc) for l, sc in zip(res["labels"], res.get("scores", []))}
+
+
+def _hf_single_result(res) -> AIClassifyResult:
+    scores = {}
+    for label, sc in _zero_shot_scores(res).items():
+        intent = _sanitize_label(label, INTENTS, "OTHER")
+        scores[intent] = scores.get(intent, 0.0) + sc
+
+    if scores:
+        intent = max(scores, key=scores.get)
+        intent_score = scores[intent]
+    else:
+        intent, intent_score = "OTHER", 0.6
+
+    productive = intent in PRODUCTIVE
+    cat = "Produtivo" if productive else "Improdutivo"
+    cat_score = sum(sc for i, sc in scores.items() if (i in PRODUCTIVE) == productive) if scores else 0.6
+
+    conf = (cat_score + intent_score) / 2.0
+    return AIClassifyResult(
+        True,
+        cat,
+        intent,
+        float(conf),
+        {"source": "huggingface", "mode": "single", "hf_raw": {"intent": res}},
+    )
+
+def _hf_classify_single(text: str) -> AIClassifyResult:
+    """
+    Um zero-shot só, sobre INTENTS: a categoria sai da intenção vencedora (como PRODUCTIVE no
+    pipeline) e o score da categoria é a massa somada das intenções daquela categoria.
+    Metade da latência e da cota do modo dual.
+    """
+    try:
+        return _hf_single_result(_hf_zero_shot(text, INTENTS))
+    except Exception as e:
+        print(f"[hf] ERROR classify: {e}")
+        return AIClassifyResult(False, "", "OTHER", 0.0, {"error": str(e)})
+
+
+def _hf_classifier():
+    """(função, id do modelo p/ cache) conforme HF_CLASSIFY_MODE."""
+    if HF_CLASSIFY_MODE == "single":
+        return _hf_classify_single, f"{HF_ZEROSHOT_MODEL}:single"
+    return _hf_classify_and_intent, HF_ZEROSHOT_MODEL
+
+
+HF_REPLY_INSTRUCTIONS = {
+    "STATUS": "We are checking the status and will get back soon; ask for ticket/logs if needed.",
+    "ATTACHMENT": "Confirm file receipt and say it will be reviewed; follow up with next steps.",
+    "ACCESS": "Ask for login e-mail and whether there is a lockout message; offer unlock/password reset.",
+    "ERROR": "Ask for reproduction steps, approximate time, and any logs/screenshots. If attachments were mentioned, acknowledge them.",
+    "CLOSURE": "Thank and confirm closure; keep availability if anything else is needed.",
+    "THANKS": "Thank for the message; no action required.",
+    "GREETINGS": "Thank for the wishes; no action required.",
+    "NON_MESSAGE": "Thank for the document and clarify this inbox is for support requests; no action required.",
+    "SUPPORT": "Acknowledge a technical support request and say the team will review and reply with guidance.",
+    "OTHER": "Confirm receipt; say you will analyze and follow up soon."
+}
+
 def _hf_generate_reply(text: str, category: str, intent: str, lang: str) -> str:
     try:
-        instructions = {
-            "STATUS": "We are checking the status and will get back soon; ask for ticket/logs if needed.",
-            "ATTACHMENT": "Confirm file receipt and say it will be reviewed; follow up with next steps.",
-            "ACCESS": "Ask for login e-mail and whether there is a lockout message; offer unlock/password reset.",
-            "ERROR": "Ask for reproduction steps, approximate time, and any logs/screenshots. If attachments were mentioned, acknowledge them.",
-            "CLOSURE": "Thank and confirm closure; keep availability if anything else is needed.",
-            "THANKS": "Thank for the message; no action required.",
-            "GREETINGS": "Thank for the wishes; no action required.",
-            "NON_MESSAGE": "Thank for the document and clarify this inbox is for support requests; no action required.",
-            "SUPPORT": "Acknowledge a technical support request and say the team will review and reply with guidance.",
-            "OTHER": "Confirm receipt; say you will analyze and follow up soon."
-        }
-        instr = instructions.get(intent, instructions["OTHER"])
+        instr = HF_REPLY_INSTRUCTIONS.get(intent, HF_REPLY_INSTRUCTIONS["OTHER"])
         return _hf_generate(text, instr, lang)
     except Exception as e:
         print(f"[hf] ERROR generate: {e}")
@@ -409,68 +665,234 @@ def _hf_generate_reply(text: str, category: str, intent: str, lang: str) -> str:
 
 
 # -------------------- Fastpath por configuração --------------------
-_INTENT_CFG = None
+class _SynonymIndex:
+    """
+    intents_config.json pré-compilado: termos já normalizados, um único matcher
+    (uma família por intenção) e o rank de prioridade em dict.
+    """
+    def __init__(self, path: str, mtime: int, cfg: dict):
+        self.path = path
+        self.mtime = mtime
+        self.cfg = cfg
+        priority = cfg.get("priority_order", INTENTS)
+        self.rank = {intent: i for i, intent in enumerate(priority)}
+
+        # termo normalizado -> multiplicidade (variações com/sem acento contam cada uma, como antes)
+        self.weights: dict[str, dict[str, int]] = {}
+        for intent, terms in cfg.get("synonyms", {}).items():
+            w = self.weights.setdefault(intent, {})
+            for term in terms:
+                nt = norm_text(term)
+                w[nt] = w.get(nt, 0) + 1
+        # termo -> [(intenção, peso)], para somar tudo numa passada sobre os termos encontrados
+        self.term_intents: dict[str, list[tuple[str, int]]] = {}
+        for intent, w in self.weights.items():
+            for term, n in w.items():
+                self.term_intents.setdefault(term, []).append((intent, n))
+        self.matcher = KeywordMatcher({
+            intent: (SUB, list(w)) for intent, w in self.weights.items()
+        })
+        self.found_terms = lru_cache(maxsize=64)(self.matcher.found_terms)
+
+
+_INDEX: Optional[_SynonymIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def _synonym_index() -> _SynonymIndex:
+    """Índice atual; recompila (e troca atomicamente) quando o mtime do arquivo muda."""
+    global _INDEX
+    path = os.getenv("INTENT_CFG_PATH", "intents_config.json")
+    idx = _INDEX
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        if idx is not None:
+            return idx
+        raise
+    if idx is not None and idx.path == path and idx.mtime == mtime:
+        return idx
+
+    with _INDEX_LOCK:
+        idx = _INDEX
+        if idx is None or idx.path != path or idx.mtime != mtime:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    cfg = json.load(f)
+                _INDEX = _SynonymIndex(path, mtime, cfg)
+                print(f"[fastpath] índice de sinônimos carregado de {path}")
+            except Exception as e:
+                # arquivo no meio de uma escrita/JSON inválido: segue com o índice anterior
+                if idx is None:
+                    raise
+                print(f"[fastpath] falha ao recarregar {path}, mantendo versão anterior: {e}")
+        return _INDEX
 
-def _norm(s: str) -> str:
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    return s.lower()
 
 def _load_intent_cfg():
-    global _INTENT_CFG
-    if _INTENT_CFG is None:
-        path = os.getenv("INTENT_CFG_PATH", "intents_config.json")
-        with open(path, "r", encoding="utf-8") as f:
-            _INTENT_CFG = json.load(f)
-    return _INTENT_CFG
-
-def fastpath_from_config(text: str):
-    t = _norm(text or "")
-    if not t:
+    return _synonym_index().cfg
+
+
+def fastpath_from_config(text: EmailLike):
+    email = normalized(text)
+    if not email.text:
       return None
-    none_markers = ["curriculo", "currículo", "resume", "curriculum", "portfólio", "portfolio", "linkedin.com/in/", "contrato", "contract", "manual", "política", "policy", "anúncio", "announcement"]
-    action_markers = ["status", "ticket", "protocolo", "erro", "error", "acesso", "login", "suporte", "support"]
-    if any(m in t for m in none_markers) and not any(m in t for m in action_markers):
+    h = email.hits
+    if h.has("doc_none") and not h.has("doc_action"):
         return {"category": "Improdutivo", "intent": "NON_MESSAGE", "confidence": 0.9}
 
     try:
-        cfg = _load_intent_cfg()
+        idx = _synonym_index()
     except Exception:
         return None
 
     hits_by_intent = {}
-    for intent, terms in cfg.get("synonyms", {}).items():
-        count = sum(1 for term in terms if _norm(term) in t)
-        if count > 0:
-            hits_by_intent[intent] = count
+    for term in idx.found_terms(email.norm):
+        for intent, n in idx.term_intents[term]:
+            hits_by_intent[intent] = hits_by_intent.get(intent, 0) + n
 
     if not hits_by_intent:
         return None
 
-    best_intents = sorted(
+    intent, hits = min(
         hits_by_intent.items(),
-        key=lambda kv: (-kv[1], cfg.get("priority_order", INTENTS).index(kv[0]) if kv[0] in cfg.get("priority_order", INTENTS) else 999)
+        key=lambda kv: (-kv[1], idx.rank.get(kv[0], 999))
     )
-    intent, hits = best_intents[0]
 
     base = 0.55
     conf = base + 0.12 * min(hits, 4)
-    if 80 <= len(t) <= 800:
+    if 80 <= len(email.raw) <= 800:
         conf += 0.05
     conf = max(0.55, min(conf, 0.95))
 
-    category = "Produtivo" if intent in {"STATUS", "ATTACHMENT", "ACCESS", "ERROR", "SUPPORT"} else "Improdutivo"
+    category = "Produtivo" if intent in PRODUCTIVE else "Improdutivo"
     return {"category": category, "intent": intent, "confidence": float(conf)}
 
+# -------------------- Cache de resultados --------------------
+def _classify_peek(key: str) -> Optional[AIClassifyResult]:
+    hit = result_cache.peek(key)
+    return AIClassifyResult(**hit) if hit else None
+
+
+def _cached_classify(provider: str, model: str, fn, text: str) -> AIClassifyResult:
+    key = _memo_key("classify", text, provider, model)
+    hit, tier = result_cache.get(key)
+    if hit:
+        res = AIClassifyResult(**hit)
+        res.raw["cache"] = tier
+        return res
+    # rajada de emails idênticos: só uma chamada vai ao provedor, as outras esperam por ela
+    flight = singleflight.begin(key, lambda: _classify_peek(key))
+    if flight.shared:
+        res = flight.value
+        res.raw["cache"] = INFLIGHT
+        return res
+    with flight:
+        res = fn(text)
+        if res.ok:
+            result_cache.set(key, asdict(res))  # antes de soltar o lock: outros workers leem daqui
+        flight.finish(res, ok=res.ok)  # falha não é repassada: quem espera tenta por conta própria
+    res.raw["cache"] = MISS
+    return res
+
+
+def _cached_reply(provider: str, model: str, fn, text: str, category: str, intent: str,
+                  lang: str, info: Optional[dict]) -> str:
+    key = _memo_key("reply", text, provider, model, category, intent, lang)
+    hit, tier = result_cache.get(key)
+    if info is not None:
+        info["cache"] = tier
+    if hit:
+        return hit
+    flight = singleflight.begin(key, lambda: result_cache.peek(key))
+    if flight.shared:
+        if info is not None:
+            info["cache"] = INFLIGHT
+        return flight.value or ""
+    with flight:
+        out = fn(text, category, intent, lang)
+        if out:
+            result_cache.set(key, out)
+        flight.finish(out, ok=bool(out))
+    return out
+
+
+def _hf_stream_reply(text: str, category: str, intent: str, lang: str) -> Iterator[str]:
+    # os modelos text2text da Inference API não têm stream: a resposta inteira vira um pedaço
+    out = _hf_generate_reply(text, category, intent, lang)
+    if out:
+        yield out
+
+
 # -------------------- API pública --------------------
-def ai_classify(text: str) -> AIClassifyResult:
+def remote_provider_enabled() -> bool:
+    """True se há um provedor remoto (OpenAI/HF) configurado com chave."""
+    return (PROVIDER == OPENAI and bool(OPENAI_API_KEY)) or (PROVIDER == HF and bool(HUGGINGFACE_API_KEY))
+
+def replies_with_classify() -> bool:
+    """True se a classificação já traz as respostas PT/EN (OPENAI_MODE=oneshot)."""
+    return PROVIDER == OPENAI and bool(OPENAI_API_KEY) and OPENAI_MODE == "oneshot"
+
+def prewarm_provider():
+    """Abre as conexões com o provedor configurado antes da primeira requisição."""
+    if PROVIDER == OPENAI and OPENAI_API_KEY:
+        clients.openai(OPENAI_API_KEY)
+        clients.prewarm([OPENAI_API_URL])
+    elif PROVIDER == HF and HUGGINGFACE_API_KEY:
+        clients.prewarm([HF_API_URL])
+
+def _local_model_classify(text: EmailLike, clean: Optional[str] = None, pred: Optional[tuple] = None) -> Optional[AIClassifyResult]:
     """
-    Prioriza o provedor (OPENAI/HF); se falhar e FORCE_API_CLASSIFY=0, cai para fastpath local.
+    Modelo multiclasse local (em processo, sem rede). `pred` = (intent, proba, probs) já
+    calculado em lote; senão pré-processa `text` (ou usa `clean`) e prevê aqui.
+    A categoria sai da intenção (PRODUCTIVE), com a massa das intenções da mesma categoria.
     """
+    try:
+        if pred is None:
+            from .classifier_service import classifier_service
+            if clean is None:
+                from .nlp_service import detect_language, preprocess
+                clean = preprocess(text, lang=detect_language(text))
+            pred = classifier_service.predict_intent(clean)
+        if not pred:
+            return None
+        raw_intent, intent_p, probs = pred
+    except Exception as e:
+        print(f"[local] ERROR classify: {e}")
+        return None
+
+    intent = _sanitize_label(raw_intent, INTENTS, "OTHER")
+    productive = intent in PRODUCTIVE
+    cat_p = sum(p for i, p in probs.items() if (i in PRODUCTIVE) == productive)
+    conf = (cat_p + intent_p) / 2.0
+    return AIClassifyResult(
+        True,
+        "Produtivo" if productive else "Improdutivo",
+        intent,
+        float(conf),
+        {"source": "local_model", "intent_proba": round(intent_p, 3)},
+    )
+
+
+def ai_classify(text: EmailLike, clean: Optional[str] = None, local_pred: Optional[tuple] = None) -> AIClassifyResult:
+    """
+    Prioriza o provedor (OPENAI/HF); se falhar e FORCE_API_CLASSIFY=0, cai para o modelo de
+    intenção local e, se ele não tiver confiança, para o fastpath.
+    Com LOCAL_FIRST_MIN_CONF > 0, o modelo local responde antes do provedor quando está seguro.
+    clean/local_pred: texto pré-processado / predição local já calculados pelo pipeline.
+    text pode ser o NormalizedEmail do pipeline: o fallback reaproveita a normalização.
+    """
+    email = normalized(text)
+    text = email.raw
+    local = _local_first(email, clean, local_pred)
+    if local and local.raw["intent_proba"] >= LOCAL_FIRST_MIN_CONF:
+        return local
+
     # 1) Tenta provedor configurado
     if PROVIDER == OPENAI and OPENAI_API_KEY:
         try:
-            res = _openai_classify_and_intent(text)
+            fn, model_id = _openai_classifier()
+            res = _cached_classify(OPENAI, model_id, fn, text)
             if res.ok:
                 return res
         except Exception as e:
@@ -478,14 +900,36 @@ def ai_classify(text: str) -> AIClassifyResult:
 
     if PROVIDER == HF and HUGGINGFACE_API_KEY:
         try:
-            res = _hf_classify_and_intent(text)
+            fn, model_id = _hf_classifier()
+            res = _cached_classify(HF, model_id, fn, text)
             if res.ok:
                 return res
         except Exception as e:
             print(f"[hf] ERROR classify: {e}")
 
-    # 2) Se não for para **forçar** API, usa fastpath local
+    return _classify_fallback(email, clean, local_pred, local)
+
+
+def _local_first(text: EmailLike, clean: Optional[str], local_pred: Optional[tuple]) -> Optional[AIClassifyResult]:
+    """Com LOCAL_FIRST_MIN_CONF > 0, a predição local antes do provedor (None se desligado)."""
+    if LOCAL_FIRST_MIN_CONF > 0 and not FORCE_API_CLASSIFY and remote_provider_enabled():
+        local = _local_model_classify(text, clean, local_pred)
+        if local and local.raw["intent_proba"] >= LOCAL_FIRST_MIN_CONF:
+            print(f"[local] intent={local.intent} (sem chamada remota)")
+        return local
+    return None
+
+
+def _classify_fallback(text: EmailLike, clean: Optional[str], local_pred: Optional[tuple],
+                       local: Optional[AIClassifyResult]) -> AIClassifyResult:
+    """Depois do provedor: modelo local, fastpath ou falha."""
+    # 2) Se não for para **forçar** API, usa o modelo local e depois o fastpath
     if not FORCE_API_CLASSIFY:
+        local = local or _local_model_classify(text, clean, local_pred)
+        if local and local.raw["intent_proba"] >= LOCAL_INTENT_MIN_CONF:
+            print(f"[local] intent={local.intent} p={local.raw['intent_proba']:.3f}")
+            return local
+
         hp = fastpath_from_config(text)
         if hp:
             print(f"[fastpath] intent={hp['intent']} conf={hp['confidence']:.3f}")
@@ -495,15 +939,63 @@ def ai_classify(text: str) -> AIClassifyResult:
     return AIClassifyResult(False, "", "OTHER", 0.0, {"error": "provider-not-configured-or-failed"})
 
 
-def ai_generate_reply(text: str, category: str, intent: str, lang: str) -> str:
+def ai_generate_reply(text: str, category: str, intent: str, lang: str, info: Optional[dict] = None) -> str:
+    """info (opcional) recebe {"cache": nível} para o bloco de debug."""
     if PROVIDER == OPENAI and OPENAI_API_KEY:
         try:
-            return _openai_generate_reply(text, category, intent, lang)
+            return _cached_reply(OPENAI, os.getenv("OPENAI_MODEL", "gpt-4o-mini"), _openai_generate_reply,
+                                 text, category, intent, lang, info)
         except Exception as e:
             print(f"[openai] ERROR generate: {e}")
     if PROVIDER == HF and HUGGINGFACE_API_KEY:
         try:
-            return _hf_generate_reply(text, category, intent, lang)
+            return _cached_reply(HF, os.getenv("HF_GENERATION_MODEL", HF_GENERATION_MODEL), _hf_generate_reply,
+                                 text, category, intent, lang, info)
         except Exception as e:
             print(f"[hf] ERROR generate: {e}")
     return ""
+
+
+def ai_stream_reply(text: str, category: str, intent: str, lang: str, info: Optional[dict] = None) -> Iterator[str]:
+    """
+    Como ai_generate_reply, mas gera os pedaços da resposta conforme o provedor manda.
+    Mesma chave de cache: acerto sai num pedaço só; resposta completa é gravada no fim.
+    info recebe {"cache": nível} e, se a geração falhou no meio, {"error": ...}.
+    """
+    info = info if info is not None else {}
+    if PROVIDER == OPENAI and OPENAI_API_KEY:
+        provider, model, fn = OPENAI, os.getenv("OPENAI_MODEL", "gpt-4o-mini"), _openai_stream_reply
+    elif PROVIDER == HF and HUGGINGFACE_API_KEY:
+        provider, model, fn = HF, os.getenv("HF_GENERATION_MODEL", HF_GENERATION_MODEL), _hf_stream_reply
+    else:
+        return
+
+    key = _memo_key("reply", text, provider, model, category, intent, lang)
+    hit, tier = result_cache.get(key)
+    info["cache"] = tier
+    if hit:
+        yield hit
+        return
+
+    # mesma geração já em andamento (stream ou não): espera e manda a resposta inteira
+    flight = singleflight.begin(key, lambda: result_cache.peek(key))
+    if flight.shared:
+        info["cache"] = INFLIGHT
+        if flight.value:
+            yield flight.value
+        return
+
+    with flight:  # cliente desistiu no meio: quem espera segue por conta própria
+        parts = []
+        try:
+            for piece in fn(text, category, intent, lang):
+                parts.append(piece)
+                yield piece
+        except Exception as e:
+            print(f"[{'openai' if provider == OPENAI else 'hf'}] ERROR generate: {e}")
+            info["error"] = str(e)
+            return
+        out = "".join(parts).strip()
+        if out:
+            result_cache.set(key, out)
+        flight.finish(out, ok=bool(out))
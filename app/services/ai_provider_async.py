@@ -0,0 +1,305 @@
+"""
+Versão assíncrona das chamadas ao provedor (usada pelo modo ASGI, ver asgi.py).
+
+Mesmos prompts, parsers, cache, circuit breaker e métricas de ai_provider — só o
+transporte muda: httpx.AsyncClient / openai.AsyncOpenAI, sem prender uma thread por
+requisição enquanto o provedor responde. A concorrência de chamadas ao provedor é
+limitada por ASYNC_PROVIDER_CONCURRENCY (por processo), não pelo número de threads.
+O que toca SQLite (cache, breaker) roda em thread, para não travar o event loop.
+"""
+import asyncio
+import os
+import time
+from dataclasses import asdict
+from typing import Any, Dict, Optional
+
+from .ai_provider import (
+    CATEGORIES, HF, HF_BACKOFF, HF_CLASSIFY_MODE, HF_GENERATION_MODEL, HF_REPLY_INSTRUCTIONS,
+    HF_RETRIES, HF_TIMEOUT, HF_ZEROSHOT_MODEL, HUGGINGFACE_API_KEY, INTENTS, LOCAL_FIRST_MIN_CONF,
+    OPENAI, OPENAI_API_KEY, OPENAI_MODE, OPENAI_ONESHOT_TIMEOUT, PROVIDER, AIClassifyResult, _breaker_failed,
+    _breaker_names,
+    _classify_fallback, _hf_dual_result, _hf_failed, _hf_gen_request, _hf_gen_text, _hf_request,
+    _classify_peek, _hf_response, _hf_single_result, _hf_zero_shot_payload, _local_first, _memo_key,
+    _openai_classify_messages, _openai_classify_result, _openai_oneshot_messages, _openai_oneshot_result,
+    _openai_reply_messages,
+)
+from .breaker import CircuitOpen, breakers
+from .cache import MISS, result_cache
+from .email_text import EmailLike, normalized
+from .http_clients import clients
+from .metrics import metrics
+from .singleflight import INFLIGHT, singleflight
+
+ASYNC_PROVIDER_CONCURRENCY = int(os.getenv("ASYNC_PROVIDER_CONCURRENCY", "64"))
+
+_SLOTS: dict[int, asyncio.Semaphore] = {}
+
+
+def _slots() -> asyncio.Semaphore:
+    """Semáforo de chamadas ao provedor do event loop atual."""
+    loop_id = id(asyncio.get_running_loop())
+    sem = _SLOTS.get(loop_id)
+    if sem is None:
+        sem = _SLOTS[loop_id] = asyncio.Semaphore(ASYNC_PROVIDER_CONCURRENCY)
+    return sem
+
+
+# -------------------- OpenAI --------------------
+async def _openai_chat(model: str, messages: list, temperature: float, timeout: float, **extra):
+    names = _breaker_names(OPENAI, model)
+    await asyncio.to_thread(breakers.check, *names)
+    try:
+        async with _slots():
+            resp = await clients.async_openai(OPENAI_API_KEY).chat.completions.create(
+                model=model,
+                temperature=temperature,
+                messages=messages,
+                timeout=timeout,
+                **extra,
+            )
+    except Exception as e:
+        await asyncio.to_thread(_breaker_failed, names, e)
+        if not isinstance(e, CircuitOpen):
+            metrics.inc("provider_errors_total", provider=OPENAI)
+        raise
+    await asyncio.to_thread(breakers.record, True, *names)
+    return resp
+
+
+async def _openai_classify_and_intent(text: str) -> AIClassifyResult:
+    req_timeout = float(os.getenv("OPENAI_TIMEOUT", "10"))
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    try:
+        t0 = time.perf_counter()
+        resp = await _openai_chat(model, _openai_classify_messages(text), temperature=0.0, timeout=req_timeout)
+        ms = int((time.perf_counter() - t0) * 1000)
+        print(f"[openai] classify ms={ms} (async)")
+        return _openai_classify_result(resp)
+    except Exception as e:
+        print(f"[openai] ERROR classify: {e}")
+        return AIClassifyResult(False, "", "OTHER", 0.0, {"error": str(e)})
+
+
+async def _openai_oneshot(text: str) -> AIClassifyResult:
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    try:
+        t0 = time.perf_counter()
+        resp = await _openai_chat(model, _openai_oneshot_messages(text), temperature=0.0,
+                                  timeout=OPENAI_ONESHOT_TIMEOUT, response_format={"type": "json_object"})
+        ms = int((time.perf_counter() - t0) * 1000)
+        print(f"[openai] oneshot ms={ms} (async)")
+        return _openai_oneshot_result(resp)
+    except Exception as e:
+        print(f"[openai] ERROR oneshot: {e}")
+        return AIClassifyResult(False, "", "OTHER", 0.0, {"error": str(e)})
+
+
+def _openai_classifier():
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    if OPENAI_MODE == "oneshot":
+        return _openai_oneshot, f"{model}:oneshot"
+    return _openai_classify_and_intent, model
+
+
+async def _openai_generate_reply(text: str, category: str, intent: str, lang: str) -> str:
+    try:
+        req_timeout = float(os.getenv("OPENAI_GEN_TIMEOUT", "10"))
+        model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        t0 = time.perf_counter()
+        resp = await _openai_chat(model, _openai_reply_messages(text, category, intent, lang),
+                                  temperature=0.2, timeout=req_timeout)
+        ms = int((time.perf_counter() - t0) * 1000)
+        print(f"[openai] generate ms={ms} (async)")
+        return (resp.choices[0].message.content or "").strip()
+    except Exception as e:
+        print(f"[openai] ERROR generate: {e}")
+        return ""
+
+
+# -------------------- Hugging Face --------------------
+async def _hf_backoff(attempt: int):
+    if attempt < HF_RETRIES:
+        await asyncio.sleep(HF_BACKOFF ** attempt)
+
+
+async def _hf_post(model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Mesmo contrato de ai_provider._hf_post (retries, breaker, métricas), sem bloquear o loop."""
+    url, headers, payload = _hf_request(model, payload)
+    names = _breaker_names(HF, model)
+    last_err: Optional[Exception] = None
+    for attempt in range(1, HF_RETRIES + 1):
+        await asyncio.to_thread(breakers.check, *names)
+        if attempt > 1:
+            metrics.inc("provider_retries_total", provider=HF)
+        try:
+            t0 = time.perf_counter()
+            async with _slots():
+                r = await clients.async_http().post(url, headers=headers, json=payload, timeout=HF_TIMEOUT)
+            ms = int((time.perf_counter() - t0) * 1000)
+            out, last_err = await asyncio.to_thread(_hf_response, r, model, attempt, ms, names)
+        except Exception as e:
+            last_err = await asyncio.to_thread(_hf_failed, e, model, attempt, names)
+        else:
+            if last_err is None:
+                return out
+        await _hf_backoff(attempt)
+
+    raise RuntimeError(f"HF POST failed after {HF_RETRIES} attempts: {last_err}")
+
+
+async def _hf_zero_shot(text: str, candidate_labels: list[str]):
+    return await _hf_post(HF_ZEROSHOT_MODEL, _hf_zero_shot_payload(text, candidate_labels))
+
+
+async def _hf_classify_and_intent(text: str) -> AIClassifyResult:
+    try:
+        # os dois zero-shots são independentes: em paralelo
+        cat_res, intent_res = await asyncio.gather(_hf_zero_shot(text, CATEGORIES), _hf_zero_shot(text, INTENTS))
+        return _hf_dual_result(cat_res, intent_res)
+    except Exception as e:
+        print(f"[hf] ERROR classify: {e}")
+        return AIClassifyResult(False, "", "OTHER", 0.0, {"error": str(e)})
+
+
+async def _hf_classify_single(text: str) -> AIClassifyResult:
+    try:
+        return _hf_single_result(await _hf_zero_shot(text, INTENTS))
+    except Exception as e:
+        print(f"[hf] ERROR classify: {e}")
+        return AIClassifyResult(False, "", "OTHER", 0.0, {"error": str(e)})
+
+
+def _hf_classifier():
+    if HF_CLASSIFY_MODE == "single":
+        return _hf_classify_single, f"{HF_ZEROSHOT_MODEL}:single"
+    return _hf_classify_and_intent, HF_ZEROSHOT_MODEL
+
+
+async def _hf_generate(text: str, instruction: str, lang: str) -> str:
+    if not HUGGINGFACE_API_KEY:
+        return ""
+
+    candidates, payload = _hf_gen_request(text, instruction, lang)
+    for repo in candidates:
+        for attempt in range(1, HF_RETRIES + 1):
+            try:
+                start = time.perf_counter()
+                out = await _hf_post(repo, dict(payload))
+                ms = int((time.perf_counter() - start) * 1000)
+                print(f"[hf] gen repo={repo} ms={ms} attempt={attempt}/{HF_RETRIES} (async)")
+
+                text_out = _hf_gen_text(out)
+                if text_out is None:
+                    print("[hf] gen empty response, retrying…")
+                    metrics.inc("provider_retries_total", provider=HF)
+                    await asyncio.sleep(HF_BACKOFF * attempt)
+                    continue
+                return text_out
+
+            except CircuitOpen as e:
+                print(f"[hf] gen repo={repo}: {e}")
+                break
+            except Exception as e:
+                print(f"[hf] gen error repo={repo} attempt={attempt}/{HF_RETRIES}: {e}")
+                metrics.inc("provider_retries_total", provider=HF)
+                await asyncio.sleep(HF_BACKOFF * attempt)
+
+    return ""
+
+
+async def _hf_generate_reply(text: str, category: str, intent: str, lang: str) -> str:
+    try:
+        instr = HF_REPLY_INSTRUCTIONS.get(intent, HF_REPLY_INSTRUCTIONS["OTHER"])
+        return await _hf_generate(text, instr, lang)
+    except Exception as e:
+        print(f"[hf] ERROR generate: {e}")
+        return ""
+
+
+# -------------------- cache --------------------
+async def _cached_classify(provider: str, model: str, fn, text: str) -> AIClassifyResult:
+    key = _memo_key("classify", text, provider, model)
+    hit, tier = await asyncio.to_thread(result_cache.get, key)
+    if hit:
+        res = AIClassifyResult(**hit)
+        res.raw["cache"] = tier
+        return res
+    flight = await singleflight.abegin(key, lambda: _classify_peek(key))
+    if flight.shared:
+        res = flight.value
+        res.raw["cache"] = INFLIGHT
+        return res
+    async with flight:
+        res = await fn(text)
+        if res.ok:
+            await asyncio.to_thread(result_cache.set, key, asdict(res))
+        await flight.afinish(res, ok=res.ok)  # falha não é repassada: quem espera tenta por conta própria
+    res.raw["cache"] = MISS
+    return res
+
+
+async def _cached_reply(provider: str, model: str, fn, text: str, category: str, intent: str,
+                        lang: str, info: Optional[dict]) -> str:
+    key = _memo_key("reply", text, provider, model, category, intent, lang)
+    hit, tier = await asyncio.to_thread(result_cache.get, key)
+    if info is not None:
+        info["cache"] = tier
+    if hit:
+        return hit
+    flight = await singleflight.abegin(key, lambda: result_cache.peek(key))
+    if flight.shared:
+        if info is not None:
+            info["cache"] = INFLIGHT
+        return flight.value or ""
+    async with flight:
+        out = await fn(text, category, intent, lang)
+        if out:
+            await asyncio.to_thread(result_cache.set, key, out)
+        await flight.afinish(out, ok=bool(out))
+    return out
+
+
+# -------------------- API pública --------------------
+async def ai_classify(text: EmailLike, clean: Optional[str] = None, local_pred: Optional[tuple] = None) -> AIClassifyResult:
+    """Mesma ordem de ai_provider.ai_classify: local seguro > provedor > modelo local > fastpath."""
+    email = normalized(text)
+    text = email.raw
+    local = _local_first(email, clean, local_pred)
+    if local and local.raw["intent_proba"] >= LOCAL_FIRST_MIN_CONF:
+        return local
+
+    if PROVIDER == OPENAI and OPENAI_API_KEY:
+        try:
+            fn, model_id = _openai_classifier()
+            res = await _cached_classify(OPENAI, model_id, fn, text)
+            if res.ok:
+                return res
+        except Exception as e:
+            print(f"[openai] ERROR classify: {e}")
+
+    if PROVIDER == HF and HUGGINGFACE_API_KEY:
+        try:
+            fn, model_id = _hf_classifier()
+            res = await _cached_classify(HF, model_id, fn, text)
+            if res.ok:
+                return res
+        except Exception as e:
+            print(f"[hf] ERROR classify: {e}")
+
+    return _classify_fallback(email, clean, local_pred, local)
+
+
+async def ai_generate_reply(text: str, category: str, intent: str, lang: str, info: Optional[dict] = None) -> str:
+    if PROVIDER == OPENAI and OPENAI_API_KEY:
+        try:
+            return await _cached_reply(OPENAI, os.getenv("OPENAI_MODEL", "gpt-4o-mini"), _openai_generate_reply,
+                                       text, category, intent, lang, info)
+        except Exception as e:
+            print(f"[openai] ERROR generate: {e}")
+    if PROVIDER == HF and HUGGINGFACE_API_KEY:
+        try:
+            return await _cached_reply(HF, os.getenv("HF_GENERATION_MODEL", HF_GENERATION_MODEL), _hf_generate_reply,
+                                       text, category, intent, lang, info)
+        except Exception as e:
+            print(f"[hf] ERROR generate: {e}")
+    return ""
@@ -0,0 +1,243 @@
+"""
+Circuit breaker por provedor e por modelo (ex.: "huggingface" e "huggingface:google/flan-t5-base").
+
+- fechado: chamadas passam; abre com N falhas seguidas (BREAKER_FAILURES) ou taxa de erro
+  alta (BREAKER_ERROR_RATE sobre pelo menos BREAKER_MIN_CALLS chamadas na janela BREAKER_WINDOW_S)
+- aberto: falha na hora (CircuitOpen) e o chamador cai para fastpath/templates locais
+- meio-aberto: depois de BREAKER_OPEN_S, libera até BREAKER_PROBES chamadas de teste;
+  sucesso fecha, falha reabre
+O estado fica no mesmo SQLite do cache, então todos os workers do gunicorn enxergam a mesma
+queda. O caminho comum (circuito fechado, sem falhas na janela) é só leitura: allow/check e
+record de sucesso fazem um SELECT, sem transação de escrita nem fsync. BEGIN IMMEDIATE só
+para transições, reserva de teste e falhas; a janela da taxa de erro começa na primeira falha
+(sucessos antes dela não são contados). Banco ocupado além do timeout adia a escrita (não troca
+de estado); só sem SQLite algum (arquivo não abre) cada processo mantém o estado em memória.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from .cache import CACHE_DB_PATH
+
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "1") == "1"
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_WINDOW_S = float(os.getenv("BREAKER_WINDOW_S", "60"))
+BREAKER_OPEN_S = float(os.getenv("BREAKER_OPEN_S", "30"))
+BREAKER_PROBES = int(os.getenv("BREAKER_PROBES", "1"))
+BREAKER_DB_PATH = os.getenv("BREAKER_DB_PATH", CACHE_DB_PATH)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_FIELDS = ("state", "consecutive", "window_start", "calls", "failures", "opened_at", "probes", "probe_at")
+
+
+class CircuitOpen(RuntimeError):
+    """Circuito aberto: a chamada nem foi feita."""
+
+
+def _new_row(now: float) -> dict:
+    return {"state": CLOSED, "consecutive": 0, "window_start": now, "calls": 0,
+            "failures": 0, "opened_at": 0.0, "probes": 0, "probe_at": 0.0}
+
+
+def _clean(row: dict) -> bool:
+    """Fechado e sem falha na janela: um sucesso aqui não muda nada."""
+    return row["state"] == CLOSED and not row["consecutive"] and not row["failures"]
+
+
+class CircuitBreakers:
+    def __init__(self, db_path: str = BREAKER_DB_PATH, enabled: bool = BREAKER_ENABLED):
+        self.db_path = db_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._mem: dict[str, dict] = {}  # fallback sem SQLite
+
+    # ---------------- armazenamento ----------------
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        # uma conexão por thread e por processo (nunca herdar conexão através de fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL: commit sem fsync; durável no checkpoint
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS breakers ("
+                " name TEXT PRIMARY KEY, state TEXT NOT NULL, consecutive INTEGER NOT NULL,"
+                " window_start REAL NOT NULL, calls INTEGER NOT NULL, failures INTEGER NOT NULL,"
+                " opened_at REAL NOT NULL, probes INTEGER NOT NULL, probe_at REAL NOT NULL)"
+            )
+        except Exception as e:
+            print(f"[breaker] sqlite indisponível ({self.db_path}), estado só em memória: {e}")
+            conn = None
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _read(self, names: tuple[str, ...]) -> Optional[dict]:
+        """Linhas atuais sem transação de escrita (no WAL o leitor não espera o escritor)."""
+        now = time.time()
+        conn = self._conn()
+        if conn is None:
+            with self._lock:
+                return {name: dict(self._mem.get(name) or _new_row(now)) for name in names}
+        try:
+            found = conn.execute(
+                f"SELECT name, {', '.join(_FIELDS)} FROM breakers"
+                f" WHERE name IN ({', '.join('?' * len(names))})", names,
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"[breaker] erro sqlite na leitura: {e}")
+            return None
+        rows = {r[0]: dict(zip(_FIELDS, r[1:])) for r in found}
+        return {name: rows.get(name) or _new_row(now) for name in names}
+
+    def _transaction(self, names: tuple[str, ...], update, busy=None) -> object:
+        """
+        Lê as linhas, aplica `update(rows, now)` e grava as que mudaram, tudo atomicamente
+        entre processos. Se o SQLite não responder, devolve `busy` sem mudar nada: cair para
+        a memória separaria o estado deste worker do dos outros.
+        """
+        now = time.time()
+        conn = self._conn()
+        if conn is not None:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = {}
+                    for name in names:
+                        r = conn.execute(
+                            f"SELECT {', '.join(_FIELDS)} FROM breakers WHERE name = ?", (name,)
+                        ).fetchone()
+                        rows[name] = dict(zip(_FIELDS, r)) if r else _new_row(now)
+                    before = {name: dict(row) for name, row in rows.items()}
+                    out = update(rows, now)
+                    for name, row in rows.items():
+                        if row == before[name]:
+                            continue
+                        conn.execute(
+                            f"INSERT OR REPLACE INTO breakers (name, {', '.join(_FIELDS)})"
+                            f" VALUES (?{', ?' * len(_FIELDS)})",
+                            (name, *(row[f] for f in _FIELDS)),
+                        )
+                    conn.execute("COMMIT")
+                    return out
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            except Exception as e:
+                print(f"[breaker] erro sqlite, transição adiada: {e}")
+                return busy
+
+        with self._lock:
+            rows = {name: self._mem.setdefault(name, _new_row(now)) for name in names}
+            return update(rows, now)
+
+    # ---------------- transições ----------------
+    @staticmethod
+    def _trip(row: dict, now: float):
+        row.update(state=OPEN, opened_at=now, probes=0, consecutive=0, calls=0, failures=0,
+                   window_start=now)
+
+    def allow(self, *names: str) -> bool:
+        """True se TODOS os circuitos deixam a chamada passar (reserva vaga de teste se meio-aberto)."""
+        if not self.enabled or not names:
+            return True
+        rows = self._read(names)
+        if rows is None:
+            return True  # sem leitura não dá para saber: não bloqueia o provedor por isso
+        now = time.time()
+        if all(row["state"] == CLOSED for row in rows.values()):
+            return True
+        if any(row["state"] == OPEN and now - row["opened_at"] < BREAKER_OPEN_S for row in rows.values()):
+            return False
+
+        # aberto vencido ou meio-aberto: reserva de teste sob BEGIN IMMEDIATE
+        def update(rows: dict, now: float) -> bool:
+            for row in rows.values():
+                if row["state"] == OPEN and now - row["opened_at"] >= BREAKER_OPEN_S:
+                    row.update(state=HALF_OPEN, probes=0)
+                if row["state"] == OPEN:
+                    return False
+                # teste que nunca voltou (worker morreu etc.) não trava o circuito para sempre
+                if (row["state"] == HALF_OPEN and row["probes"] >= BREAKER_PROBES
+                        and now - row["probe_at"] < BREAKER_OPEN_S):
+                    return False
+            for row in rows.values():
+                if row["state"] == HALF_OPEN:
+                    if now - row["probe_at"] >= BREAKER_OPEN_S:
+                        row["probes"] = 0
+                    row["probes"] += 1
+                    row["probe_at"] = now
+            return True
+
+        return self._transaction(names, update, busy=False)
+
+    def record(self, ok: bool, *names: str):
+        if not self.enabled or not names:
+            return
+        rows = self._read(names)
+        if rows is not None and all(row["state"] == OPEN or (ok and _clean(row)) for row in rows.values()):
+            return  # nada a mudar (sucesso sem falhas na janela, ou resposta atrasada com o circuito aberto)
+
+        def update(rows: dict, now: float):
+            for name, row in rows.items():
+                state = row["state"]
+                if state == HALF_OPEN:
+                    if ok:
+                        row.update(_new_row(now))
+                        print(f"[breaker] {name}: fechado")
+                    else:
+                        self._trip(row, now)
+                        print(f"[breaker] {name}: teste falhou, aberto de novo")
+                    continue
+                if state == OPEN:
+                    continue  # resposta atrasada de antes de abrir
+                if now - row["window_start"] > BREAKER_WINDOW_S:
+                    row.update(window_start=now, calls=0, failures=0)
+                row["calls"] += 1
+                if ok:
+                    row["consecutive"] = 0
+                    continue
+                row["failures"] += 1
+                row["consecutive"] += 1
+                if (row["consecutive"] >= BREAKER_FAILURES or (
+                        row["calls"] >= BREAKER_MIN_CALLS
+                        and row["failures"] / row["calls"] >= BREAKER_ERROR_RATE)):
+                    print(f"[breaker] {name}: aberto ({row['consecutive']} seguidas, "
+                          f"{row['failures']}/{row['calls']} na janela)")
+                    self._trip(row, now)
+
+        self._transaction(names, update)
+
+    def check(self, *names: str):
+        """Levanta CircuitOpen se algum dos circuitos estiver aberto."""
+        if not self.allow(*names):
+            raise CircuitOpen(f"circuito aberto: {', '.join(names)}")
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        out: dict = {"enabled": True}
+        conn = self._conn()
+        try:
+            if conn is not None:
+                out.update(conn.execute("SELECT name, state FROM breakers").fetchall())
+            else:
+                with self._lock:
+                    out.update({name: row["state"] for name, row in self._mem.items()})
+        except Exception as e:
+            out["error"] = str(e)
+        return out
+
+
+breakers = CircuitBreakers()
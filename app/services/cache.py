@@ -0,0 +1,208 @@
+"""
+Cache de resultados do provedor, endereçado por conteúdo, em dois níveis:
+- memória: LRU por processo com TTL e limite de itens/bytes
+- disco: SQLite (WAL) compartilhado entre os workers do gunicorn
+Falhas no cache nunca derrubam a requisição: viram miss.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_TTL_S = int(os.getenv("CACHE_TTL_S", "86400"))
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "2048"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "cache/results.sqlite3")
+CACHE_DISK_MAX_ROWS = int(os.getenv("CACHE_DISK_MAX_ROWS", "100000"))
+
+MEMORY = "memory"
+DISK = "disk"
+MISS = "miss"
+
+
+def normalize_for_key(text: str) -> str:
+    """Normalização usada na chave: reenvios/encaminhamentos só diferem em espaços."""
+    return " ".join((text or "").split())
+
+
+def make_key(*parts: Any) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, db_path: str = CACHE_DB_PATH, ttl_s: int = CACHE_TTL_S,
+                 max_items: int = CACHE_MAX_ITEMS, max_bytes: int = CACHE_MAX_BYTES,
+                 disk_max_rows: int = CACHE_DISK_MAX_ROWS, enabled: bool = CACHE_ENABLED):
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_max_rows = disk_max_rows
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, tuple[float, int, str]]" = OrderedDict()  # key -> (expira, bytes, json)
+        self._mem_bytes = 0
+        self._local = threading.local()
+        self._sets = 0
+        self._stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "sets": 0,
+                       "evictions": 0, "expired": 0, "disk_errors": 0}
+
+    # ---------------- disco ----------------
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        # uma conexão por thread e por processo (nunca herdar conexão através de fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+        except Exception as e:
+            print(f"[cache] sqlite indisponível ({self.db_path}): {e}")
+            self._bump("disk_errors")
+            return None
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _disk_get(self, key: str) -> Optional[tuple[float, str]]:
+        conn = self._conn()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute("SELECT expires_at, value FROM results WHERE key = ?", (key,)).fetchone()
+        except Exception as e:
+            print(f"[cache] erro leitura disco: {e}")
+            self._bump("disk_errors")
+            return None
+        if not row:
+            return None
+        if row[0] < time.time():
+            return None
+        return row[0], row[1]
+
+    def _disk_set(self, key: str, payload: str, expires_at: float):
+        conn = self._conn()
+        if conn is None:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, time.time()),
+            )
+            self._sets += 1
+            if self._sets % 200 == 0:
+                self._disk_prune(conn)
+        except Exception as e:
+            print(f"[cache] erro escrita disco: {e}")
+            self._bump("disk_errors")
+
+    def _disk_prune(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+        (n,) = conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        extra = n - self.disk_max_rows
+        if extra > 0:
+            conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY created_at LIMIT ?)",
+                (extra,),
+            )
+            self._bump("evictions", extra)
+
+    # ---------------- memória ----------------
+    def _bump(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _mem_put(self, key: str, payload: str, expires_at: float):
+        size = len(payload)
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old:
+                self._mem_bytes -= old[1]
+            self._mem[key] = (expires_at, size, payload)
+            self._mem_bytes += size
+            while self._mem and (len(self._mem) > self.max_items or self._mem_bytes > self.max_bytes):
+                _, (_, sz, _) = self._mem.popitem(last=False)
+                self._mem_bytes -= sz
+                self._stats["evictions"] += 1
+
+    def _mem_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._mem.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._mem[key]
+                self._mem_bytes -= item[1]
+                self._stats["expired"] += 1
+                return None
+            self._mem.move_to_end(key)
+            return item[2]
+
+    # ---------------- API ----------------
+    def get(self, key: str) -> tuple[Any, str]:
+        """Retorna (valor, nível) — nível é 'memory', 'disk' ou 'miss' (valor None)."""
+        if not self.enabled:
+            return None, MISS
+        payload = self._mem_get(key)
+        if payload is not None:
+            self._bump("hits_memory")
+            return json.loads(payload), MEMORY
+
+        row = self._disk_get(key)
+        if row is not None:
+            expires_at, payload = row
+            self._mem_put(key, payload, expires_at)  # promove para a memória
+            self._bump("hits_disk")
+            return json.loads(payload), DISK
+
+        self._bump("misses")
+        return None, MISS
+
+    def peek(self, key: str) -> Any:
+        """Valor ou None, sem contar nas estatísticas (usado na espera do singleflight)."""
+        if not self.enabled:
+            return None
+        payload = self._mem_get(key)
+        if payload is None:
+            row = self._disk_get(key)
+            if row is None:
+                return None
+            expires_at, payload = row
+            self._mem_put(key, payload, expires_at)
+        return json.loads(payload)
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        payload = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + self.ttl_s
+        self._mem_put(key, payload, expires_at)
+        self._disk_set(key, payload, expires_at)
+        self._bump("sets")
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["memory_items"] = len(self._mem)
+            out["memory_bytes"] = self._mem_bytes
+        lookups = out["hits_memory"] + out["hits_disk"] + out["misses"]
+        out["hit_ratio"] = round((out["hits_memory"] + out["hits_disk"]) / lookups, 3) if lookups else 0.0
+        out["enabled"] = self.enabled
+        return out
+
+
+result_cache = ResultCache()
@@ -1,11 +1,27 @@
 import os
-import re
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+
 import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
+import sklearn
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 
 MODEL_PATH = os.getenv("MODEL_PATH", "models/model.joblib")
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "models/intent_model.joblib")
+# espaço de features fixo (hashing): memória não cresce com o vocabulário; 2**15 colunas
+# sobram para ~200 exemplos de treino (artefato de ~2.6MB)
+INTENT_HASH_FEATURES = int(os.getenv("INTENT_HASH_FEATURES", str(2 ** 15)))
+# arrays do modelo mapeados do arquivo (compartilhados entre workers) e intervalo da checagem de troca
+MODEL_MMAP = os.getenv("MODEL_MMAP", "1") == "1"
+MODEL_RELOAD_S = float(os.getenv("MODEL_RELOAD_S", "10"))
+EXPLAIN_TOP_K = 6  # top features devolvidas em explanation.top_features
 
 SEED = [
     ("Bom dia, podem informar o status do chamado 123456? Atualização do protocolo.", "Produtivo"),
@@ -34,6 +50,99 @@ SEED = [
     ("Solicito encerramento do protocolo 555666. Tudo resolvido.", "Improdutivo")
 ]
 
+# Exemplos rotulados por intenção (PT/EN) para o modelo multiclasse local;
+# os sinônimos do intents_config.json entram como exemplos extras no treino.
+INTENT_SEED = [
+    ("Bom dia, podem informar o status do chamado 123456?", "STATUS"),
+    ("Qual a previsão de retorno do protocolo 998877?", "STATUS"),
+    ("Gostaria de saber o andamento da minha solicitação.", "STATUS"),
+    ("Ainda não tive retorno sobre o ticket aberto semana passada.", "STATUS"),
+    ("Alguma atualização sobre o caso em aberto?", "STATUS"),
+    ("Could you please update me on the status of my ticket 123456?", "STATUS"),
+    ("Any update on case 4455? What is the ETA?", "STATUS"),
+    ("Following up on my previous request, is there any progress?", "STATUS"),
+
+    ("Segue em anexo o comprovante solicitado.", "ATTACHMENT"),
+    ("Conforme combinado, anexei o contrato assinado.", "ATTACHMENT"),
+    ("Encaminho em anexo a nota fiscal do pedido 5544.", "ATTACHMENT"),
+    ("Seguem os documentos anexados para análise.", "ATTACHMENT"),
+    ("Podem confirmar o recebimento do arquivo em anexo?", "ATTACHMENT"),
+    ("Attached is the requested invoice. Please confirm receipt.", "ATTACHMENT"),
+    ("Please find attached the signed form.", "ATTACHMENT"),
+    ("I have enclosed the documents you asked for.", "ATTACHMENT"),
+
+    ("Não consigo acessar o sistema, minha senha não funciona.", "ACCESS"),
+    ("Minha conta está bloqueada, podem desbloquear?", "ACCESS"),
+    ("Preciso resetar a senha do portal.", "ACCESS"),
+    ("Não recebi o código de autenticação 2FA para logar.", "ACCESS"),
+    ("Esqueci minha senha e não consigo fazer login.", "ACCESS"),
+    ("I can't log in, my account seems to be locked.", "ACCESS"),
+    ("Please reset my password, I lost access to the portal.", "ACCESS"),
+    ("The MFA code is not arriving and I cannot sign in.", "ACCESS"),
+
+    ("O sistema apresenta erro ao salvar o formulário.", "ERROR"),
+    ("Meu notebook está travando com artefatos de vídeo.", "ERROR"),
+    ("A aplicação está indisponível desde cedo, aparece uma exceção.", "ERROR"),
+    ("Falha ao gerar o relatório, a tela fica em branco.", "ERROR"),
+    ("Estamos com lentidão e o sistema trava ao abrir pedidos.", "ERROR"),
+    ("The application crashes with an exception when I export.", "ERROR"),
+    ("We are getting a timeout error on the checkout page.", "ERROR"),
+    ("There is a bug: the screen freezes after login.", "ERROR"),
+
+    ("Podem encerrar o chamado 778899, o problema foi resolvido.", "CLOSURE"),
+    ("Favor fechar o protocolo 987654; está finalizado.", "CLOSURE"),
+    ("Pode finalizar o ticket, já está tudo certo.", "CLOSURE"),
+    ("Solicito o encerramento do chamado, já foi resolvido.", "CLOSURE"),
+    ("Podem desconsiderar meu último email e fechar o caso.", "CLOSURE"),
+    ("You can close the ticket, the issue is resolved.", "CLOSURE"),
+    ("Problem solved, please close case 3321.", "CLOSURE"),
+    ("Issue closed on our side, thanks.", "CLOSURE"),
+
+    ("Muito obrigado pelo suporte, era só isso mesmo.", "THANKS"),
+    ("Agradeço a ajuda de vocês!", "THANKS"),
+    ("Obrigada pelo retorno rápido.", "THANKS"),
+    ("Valeu pela atenção, pessoal.", "THANKS"),
+    ("Thank you for the support, that's all.", "THANKS"),
+    ("Thanks a lot for your help!", "THANKS"),
+    ("Many thanks for the quick answer.", "THANKS"),
+
+    ("Feliz Natal e boas festas para toda a equipe!", "GREETINGS"),
+    ("Feliz ano novo a todos!", "GREETINGS"),
+    ("Parabéns pelo excelente trabalho!", "GREETINGS"),
+    ("Bom final de semana! Abraços.", "GREETINGS"),
+    ("Que Deus abençoe a todos!", "GREETINGS"),
+    ("Happy holidays team! All the best!", "GREETINGS"),
+    ("Merry Christmas and a happy new year!", "GREETINGS"),
+    ("Congratulations on the launch, great job!", "GREETINGS"),
+
+    ("Preciso de suporte técnico para integrar o arquivo XML no portal.", "SUPPORT"),
+    ("Podem ajudar a configurar a integração com o ERP?", "SUPPORT"),
+    ("Gostaria de orientação para instalar o módulo novo.", "SUPPORT"),
+    ("Como faço para configurar a impressora na rede?", "SUPPORT"),
+    ("Solicito ajuda com a instalação do certificado.", "SUPPORT"),
+    ("I need technical support to set up the API integration.", "SUPPORT"),
+    ("Could you help me install the new plugin?", "SUPPORT"),
+    ("We need assistance configuring the SSO setup.", "SUPPORT"),
+
+    ("Segue meu currículo para avaliação.", "NON_MESSAGE"),
+    ("Portfólio profissional: projetos, experiência e formação acadêmica.", "NON_MESSAGE"),
+    ("Contrato de prestação de serviços, cláusula primeira: do objeto.", "NON_MESSAGE"),
+    ("Manual do usuário, capítulo 1: introdução.", "NON_MESSAGE"),
+    ("Política de privacidade e termos de uso.", "NON_MESSAGE"),
+    ("Resume: professional experience, education and skills.", "NON_MESSAGE"),
+    ("Announcement: the office will move to a new address.", "NON_MESSAGE"),
+    ("linkedin.com/in/fulano - curriculum vitae", "NON_MESSAGE"),
+
+    ("Olá, tudo bem?", "OTHER"),
+    ("Recebi sua mensagem.", "OTHER"),
+    ("Vou verificar aqui e depois falo com vocês.", "OTHER"),
+    ("Reunião remarcada para quinta-feira.", "OTHER"),
+    ("Ok, entendido.", "OTHER"),
+    ("Hello, how are you?", "OTHER"),
+    ("Noted, I will check later.", "OTHER"),
+    ("The meeting was moved to Thursday.", "OTHER"),
+]
+
 # ------------------------- INTENTS (regex) -------------------------
 STATUS_TERMS_PT = r"(status|andamento|previs[aã]o|prazo|atualiza[cç][aã]o|retorno|posi[cç][aã]o|acompanhamento|protocolo|ticket|caso)"
 STATUS_TERMS_EN = r"(status|update|eta|progress|follow[- ]?up|ticket|case)"
@@ -56,113 +165,387 @@ GREET_EN = r"(merry|happy (holidays|christmas|new year)|congratulations|congrats
 CLOSURE_PT = r"(pode(m)? (encerrar|fechar)|encerrar (o )?(chamado|ticket|protocolo)|fechar (o )?(chamado|ticket|protocolo)|finalizar (o )?(chamado|ticket|protocolo)|encerramento|desconsiderar|problema (ja )?resolvido)"
 CLOSURE_EN = r"((please|kindly)\s*)?(close|closed|resolved|issue\s*closed)(\s*(the )?(ticket|case|issue))?"
 
-import re, unicodedata
+from .email_text import EmailLike, scan
 
-def _norm(s: str) -> str:
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    return (s or "").lower()
-
-def detect_intent(text: str, lang: str) -> str:
+def detect_intent(text: EmailLike, lang: str) -> str:
     """
     Intenções: STATUS, ATTACHMENT, ACCESS, ERROR, CLOSURE, THANKS, GREETINGS, SUPPORT, OTHER
     Prioridade: CLOSURE > ERROR > STATUS > ATTACHMENT > ACCESS > THANKS > GREETINGS > SUPPORT > pedido genérico > OTHER
+    As famílias de termos vivem no matcher (uma varredura só, compartilhada com as outras etapas).
     """
-    t = _norm(text)
-
-    re_closure = re.compile(
-        r"(?:\b(encerrar|encerramento|fechar|finalizar|desconsiderar)\b.*\b(chamado|ticket|protocolo)\b)"
-        r"|(?:\bresolvid\w*\b|issue\s*closed|resolved)"
-    )
-    re_status  = re.compile(r"\b(status|andamento|previsao|prazo|atualizacao|retorno|posicao|acompanhamento|ticket|case|protocolo)\b")
-    re_access  = re.compile(r"\b(acesso|logar|login|senha|reset|bloquead|desbloque|autenticacao|2fa|mfa|access|signin|password|locked|unlock|authentication)\b")
-    re_error   = re.compile(r"\b(erro|falha|bug|trava|travando|inoperante|indisponivel|artefatos?|lentidao|excecao|problema|incidente|error|failure|crash|frozen|hang|timeout|stacktrace|exception|issue|incident)\b")
-    re_thanks  = re.compile(r"\b(obrigado|obrigada|valeu|agradeco|agradeço|thanks|thank you|thx)\b")
-    re_greet   = re.compile(r"\b(bom dia|boa tarde|boa noite|boas festas|feliz natal|feliz ano|saudacoes|sauda[cç]oes|merry|happy (holidays|christmas|new year)|congratulations|congrats|greetings)\b")
-    re_support = re.compile(
-        r"\b(suporte(?:\s+tecnic[oa])?|technical support|support)\b.*\b(ajuda|ajudar|preciso|poderia|pode(?:m)?|gostaria|solicito|"
-        r"integrar|instalar|configurar|setup|integra[cç][aã]o|instala[cç][aã]o|configura[cç][aã]o|help|assist)\b"
-    )
-    
-    re_attach = re.compile(
-      r"\b("
-      r"em\s+anexo|"
-      r"segue(?:m)?\s+(?:em\s+)?anexo[s]?|"
-      r"conforme\s+anexo|"
-      r"anexei|anexamos|anexado[s]?|"
-      r"vai\s+anexo|vão\s+anexos|"
-      r"attached|attachment[s]?|enclosed|"
-      r"please\s+find\s+attached"
-      r")\b"
-    )
-    if re_attach.search(t):  return "ATTACHMENT"
-    if re_closure.search(t): return "CLOSURE"
-    if re_error.search(t):   return "ERROR"
-    if re_status.search(t):  return "STATUS"
-
-    if re.search(r"\b(anex\w+|em\s+anexo|segue(?:m)?\s+em\s+anexo|attached|attachment|enclosed|please\s+find\s+attached|logs?|screenshots?)\b", t):
-        return "ATTACHMENT"
-
-    if re_access.search(t):  return "ACCESS"
-
-    if re_thanks.search(t): return "THANKS"
-    if re_greet.search(t):  return "GREETINGS"
-
-    if re_support.search(t): return "SUPPORT"
-
-    if re.search(r"\b(pode(m)?|podem|poderia(m)?|preciso|consegue(m)?)\b", t):
+    h = scan(text)
+
+    if h.has("attach_strong"): return "ATTACHMENT"
+    if h.has("closure_direct") or h.followed_on_line("closure_verb", "closure_object"):
+        return "CLOSURE"
+    if h.has("error"):  return "ERROR"
+    if h.has("status"): return "STATUS"
+
+    if h.has("attach_weak"): return "ATTACHMENT"
+
+    if h.has("access"): return "ACCESS"
+
+    if h.has("thanks"): return "THANKS"
+    if h.has("greet"):  return "GREETINGS"
+
+    if h.followed_on_line("support_term", "support_verb"): return "SUPPORT"
+
+    if h.has("request"):
         return "STATUS"
 
     return "OTHER"
 
 # ------------------------- CLASSIFIER -------------------------
+def _intent_training_set():
+    """INTENT_SEED + sinônimos do intents_config.json, já pré-processados como na inferência."""
+    from .nlp_service import detect_language, preprocess
+
+    pairs = list(INTENT_SEED)
+    try:
+        with open(os.getenv("INTENT_CFG_PATH", "intents_config.json"), "r", encoding="utf-8") as f:
+            synonyms = json.load(f).get("synonyms", {})
+        pairs += [(term, intent) for intent, terms in synonyms.items() for term in terms]
+    except Exception as e:
+        print(f"[classifier] sinônimos indisponíveis para o modelo de intenção: {e}")
+
+    texts, labels = [], []
+    for text, intent in pairs:
+        clean = preprocess(text, lang=detect_language(text))
+        if clean.strip():
+            texts.append(clean)
+            labels.append(intent)
+    return texts, labels
+
+
+# ------------------------- ARTEFATOS -------------------------
+# arquivo do modelo + "<arquivo>.meta.json" com formato, sha256 do conteúdo e versão dos dados de treino
+ARTIFACT_FORMAT = 1
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stamp(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def _data_version(texts, labels) -> str:
+    raw = json.dumps([list(texts), list(labels)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _write_atomic(path: str, write):
+    """Escreve num temporário do mesmo diretório e troca com os.replace: leitor nunca vê arquivo pela metade."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def save_artifact(obj, path: str, trained_on: str) -> dict:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sha = {}
+
+    def dump(tmp):
+        joblib.dump(obj, tmp)  # sem compressão: os arrays podem ser mapeados com mmap_mode
+        sha["v"] = _file_sha256(tmp)
+
+    _write_atomic(path, dump)
+    meta = {"format": ARTIFACT_FORMAT, "sha256": sha["v"], "trained_on": trained_on,
+            "created_at": time.time(), "sklearn": sklearn.__version__}
+
+    def dump_meta(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    _write_atomic(_meta_path(path), dump_meta)
+    return meta
+
+
+def load_artifact(path: str):
+    """
+    Carrega (objeto, meta). Com MODEL_MMAP os arrays numpy ficam mapeados do arquivo
+    (páginas compartilhadas entre os workers). Se o hash não bate com o meta, o artefato
+    está no meio de uma troca: levanta erro e quem chamou tenta de novo depois.
+    """
+    stamp = _stamp(path)
+    try:
+        with open(_meta_path(path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        meta = {"format": 0}  # artefato antigo, sem metadados
+    sha = _file_sha256(path)
+    if meta.get("sha256") not in (None, sha):
+        raise RuntimeError(f"sha256 de {path} não confere com {_meta_path(path)}")
+    obj = joblib.load(path, mmap_mode="r" if MODEL_MMAP else None)
+    return obj, {**meta, "sha256": sha, "stamp": stamp}
+
+
+@contextmanager
+def _train_lock(path: str):
+    """Só um processo treina por vez; os demais esperam e carregam o que ele gravou."""
+    try:
+        import fcntl
+    except ImportError:  # Windows: sem lock, o os.replace ainda evita arquivo corrompido
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
 class _ClassifierService:
     def __init__(self):
         self.pipeline = None
+        self.intent_pipeline = None
+        self.artifacts: dict[str, dict] = {}  # nome -> meta do artefato carregado
+        self._explain = None  # (pipeline, nomes das features, coef_) do modelo de categoria
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
         self._ensure_model()
+        self._ensure_intent_model()
+
+    def _models(self):
+        return (("category", MODEL_PATH, "pipeline", self._fit_category),
+                ("intent", INTENT_MODEL_PATH, "intent_pipeline", self._fit_intent))
+
+    def _load_or_train(self, name: str, path: str, fit):
+        with _train_lock(path):
+            if os.path.exists(path):
+                try:
+                    return load_artifact(path)
+                except Exception as e:
+                    print(f"[classifier] artefato {path} inválido ({e}); treinando de novo")
+            obj, trained_on = fit()
+            save_artifact(obj, path, trained_on)
+            print(f"[classifier] modelo '{name}' treinado e salvo em {path}")
+            return load_artifact(path)  # recarrega do disco: mesmo mapeamento que os outros workers
 
     def _ensure_model(self):
-        if os.path.exists(MODEL_PATH):
-            self.pipeline = joblib.load(MODEL_PATH)
-        else:
-            self._train_and_save()
+        self.pipeline, self.artifacts["category"] = self._load_or_train("category", MODEL_PATH, self._fit_category)
+        self._explain_index(self.pipeline)
+
+    def _ensure_intent_model(self):
+        """
+        Sem treino implícito: o modelo de intenção só existe depois de scripts/train_models.py.
+        Até lá a intenção sai do fastpath e o _maybe_reload carrega o artefato quando aparecer.
+        """
+        try:
+            self.intent_pipeline, self.artifacts["intent"] = load_artifact(INTENT_MODEL_PATH)
+        except FileNotFoundError:
+            print(f"[classifier] modelo de intenção ausente em {INTENT_MODEL_PATH}; "
+                  f"intenção pelo fastpath até rodar scripts/train_models.py")
+        except Exception as e:
+            print(f"[classifier] modelo de intenção em {INTENT_MODEL_PATH} ilegível ({e}); "
+                  f"intenção pelo fastpath até a próxima recarga")
 
-    def _train_and_save(self):
+    def _fit_category(self):
         texts, labels = zip(*SEED)
-        self.pipeline = Pipeline([
+        pipeline = Pipeline([
             ("tfidf", TfidfVectorizer(ngram_range=(1, 2), min_df=1)),
             ("clf", LogisticRegression(max_iter=1000, class_weight="balanced", random_state=42))
         ])
+        pipeline.fit(texts, labels)
+        return pipeline, _data_version(texts, labels)
 
-        self.pipeline.fit(texts, labels)
-        os.makedirs(os.path.dirname(MODEL_PATH) or ".", exist_ok=True)
-        joblib.dump(self.pipeline, MODEL_PATH)
+    def _fit_intent(self):
+        texts, labels = _intent_training_set()
+        pipeline = Pipeline([
+            ("hash", HashingVectorizer(analyzer="char_wb", ngram_range=(2, 5),
+                                       n_features=INTENT_HASH_FEATURES, alternate_sign=False)),
+            # sigmoid por classe sobre predições out-of-fold; ensemble=False = um modelo só na inferência.
+            # cv=2: com poucos exemplos por intenção, mais dobras só multiplicam o tempo de treino
+            ("clf", CalibratedClassifierCV(
+                LogisticRegression(max_iter=2000, C=10.0, class_weight="balanced", random_state=42),
+                method="sigmoid", cv=2, ensemble=False,
+            )),
+        ])
+        pipeline.fit(texts, labels)
+        return pipeline, _data_version(texts, labels)
+
+    def retrain(self):
+        """Retreina e publica os dois artefatos; os outros workers trocam sozinhos (ver _maybe_reload)."""
+        for name, path, attr, fit in self._models():
+            with _train_lock(path):
+                obj, trained_on = fit()
+                save_artifact(obj, path, trained_on)
+            obj, meta = load_artifact(path)
+            if attr == "pipeline":
+                self._explain_index(obj)
+            setattr(self, attr, obj)
+            self.artifacts[name] = meta
+
+    def _maybe_reload(self):
+        """
+        Troca a quente: a cada MODEL_RELOAD_S, se o arquivo mudou (mtime/tamanho/inode)
+        e o hash é outro, carrega o novo artefato e troca a referência.
+        """
+        now = time.monotonic()
+        if MODEL_RELOAD_S <= 0 or now < self._next_check:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + MODEL_RELOAD_S
+            for name, path, attr, _fit in self._models():
+                current = self.artifacts.get(name) or {}
+                try:
+                    if _stamp(path) == current.get("stamp"):
+                        continue
+                    obj, meta = load_artifact(path)
+                except FileNotFoundError:
+                    continue  # ainda não publicado (modelo de intenção antes do train_models.py)
+                except Exception as e:
+                    print(f"[classifier] recarga de '{name}' adiada: {e}")
+                    continue
+                if meta["sha256"] != current.get("sha256"):
+                    if attr == "pipeline":
+                        self._explain_index(obj)  # antes da troca: a 1ª predição já acha o índice pronto
+                    setattr(self, attr, obj)
+                    print(f"[classifier] modelo '{name}' trocado: sha256={meta['sha256'][:12]}")
+                self.artifacts[name] = meta
+        finally:
+            self._reload_lock.release()
+
+    def model_info(self) -> dict:
+        return {name: {k: meta.get(k) for k in ("format", "sha256", "trained_on", "created_at")}
+                for name, meta in self.artifacts.items()}
 
-    def predict(self, clean_text):
-        probs = self.pipeline.predict_proba([clean_text])[0]
-        classes = self.pipeline.classes_
+    def predict_intent_batch(self, clean_texts):
+        """
+        Intenção pelo modelo multiclasse: UM predict_proba para o lote inteiro.
+        Retorna [(intent, proba, {intent: proba, ...}), ...] na mesma ordem da entrada
+        (None em cada posição enquanto o modelo não foi publicado).
+        """
+        self._maybe_reload()
+        pipe = self.intent_pipeline  # referência única: a troca a quente não muda o modelo no meio
+        if not clean_texts:
+            return []
+        if pipe is None:
+            return [None] * len(clean_texts)  # sem artefato: quem chamou cai no fastpath
+        probs = pipe.predict_proba(list(clean_texts))
+        classes = [str(c) for c in pipe.classes_]
+        out = []
+        for p in probs:
+            idx = p.argmax()
+            out.append((classes[idx], float(p[idx]), dict(zip(classes, map(float, p)))))
+        return out
+
+    def predict_intent(self, clean_text):
+        preds = self.predict_intent_batch([clean_text])
+        return preds[0] if preds else None
+
+    # ---------------- explicação (top features) ----------------
+    def _explain_index(self, pipe):
+        """
+        Nomes das features e linhas de coeficientes do modelo de categoria, montados uma vez
+        por modelo carregado (get_feature_names_out aloca o vocabulário inteiro a cada chamada).
+        """
+        cached = self._explain
+        if cached is None or cached[0] is not pipe:
+            try:
+                names = np.asarray(pipe.named_steps['tfidf'].get_feature_names_out())
+                coef = np.asarray(pipe.named_steps['clf'].coef_)
+            except Exception:
+                names = coef = None
+            cached = self._explain = (pipe, names, coef)
+        return cached
+
+    def _top_features(self, pipe, X_row, idx):
+        """Features do texto com maior peso positivo para a classe idx (seleção parcial, sem sort completo)."""
+        _pipe, names, coef = self._explain_index(pipe)
+        if names is None or coef.shape[0] <= idx:
+            return []
+        cols = np.sort(X_row.indices) if not X_row.has_sorted_indices else X_row.indices
+        if not len(cols):
+            return []
+        w = coef[idx, cols]
+        k = EXPLAIN_TOP_K
+        if len(w) > k:
+            # tudo que empata com o k-ésimo maior entra, para o desempate por coluna ser o de sempre
+            kth = np.partition(w, len(w) - k)[len(w) - k]
+            cand = np.flatnonzero(w >= kth)
+        else:
+            cand = np.arange(len(w))
+        order = cand[np.argsort(-w[cand], kind="stable")][:k]
+        return [str(names[cols[j]]) for j in order if w[j] > 0]
+
+    def explain(self, clean_text, label):
+        """Top features de `label` para um texto já classificado (ex.: predição feita em lote sem explicação)."""
+        pipe = self.pipeline
+        classes = list(pipe.classes_)
+        if label not in classes:
+            return []
+        X = pipe.named_steps['tfidf'].transform([clean_text])
+        try:
+            return self._top_features(pipe, X, classes.index(label))
+        except Exception:
+            return []
+
+    # ---------------- predição ----------------
+    def predict(self, clean_text, explain=False):
+        """(label, proba, top_feats); top_feats só é calculado com explain=True (senão None)."""
+        self._maybe_reload()
+        pipe = self.pipeline
+        X = pipe.named_steps['tfidf'].transform([clean_text])
+        probs = pipe.named_steps['clf'].predict_proba(X)[0]  # mesma matriz serve para a explicação
+        classes = pipe.classes_
         idx = probs.argmax()
         label = classes[idx]
         proba = float(probs[idx])
 
-        top = []
-        try:
-            clf = self.pipeline.named_steps['clf']
-            vec = self.pipeline.named_steps['tfidf']
-            feature_names = vec.get_feature_names_out()
-            X = vec.transform([clean_text])
-            nnz = X.nonzero()[1]
-
-            if clf.coef_.shape[0] > idx:
-                scored = sorted(
-                    [(feature_names[i], clf.coef_[idx][i]) for i in nnz],
-                    key=lambda x: x[1],
-                    reverse=True
-                )
-                top = [t for t, c in scored[:6] if c > 0]
-        except Exception:
-            top = []
+        top = None
+        if explain:
+            try:
+                top = self._top_features(pipe, X, idx)
+            except Exception:
+                top = []
 
         return label, proba, top
 
+    def predict_batch(self, clean_texts, explain=False):
+        """
+        Versão em lote de predict: um único transform + predict_proba sobre a matriz empilhada.
+        Retorna [(label, proba, top_feats), ...] na mesma ordem da entrada
+        (top_feats = None sem explain).
+        """
+        if not clean_texts:
+            return []
+        self._maybe_reload()
+        pipe = self.pipeline
+        clf = pipe.named_steps['clf']
+        vec = pipe.named_steps['tfidf']
+        X = vec.transform(list(clean_texts))
+        probs = clf.predict_proba(X)
+        classes = clf.classes_
+
+        out = []
+        for row, p in enumerate(probs):
+            idx = p.argmax()
+            top = None
+            if explain:
+                try:
+                    top = self._top_features(pipe, X[row], idx)
+                except Exception:
+                    top = []
+            out.append((classes[idx], float(p[idx]), top))
+        return out
+
 classifier_service = _ClassifierService()
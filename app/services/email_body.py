@@ -0,0 +1,91 @@
+"""
+Corpo útil do email: só a mensagem mais recente, sem o histórico citado, a assinatura
+e o rodapé legal.
+
+Roda antes de qualquer etapa local ou chamada ao provedor (pipeline.prepare), então o
+idioma, as palavras-chave, o TF-IDF e os tokens enviados ao provedor olham só o que o
+remetente escreveu agora. Uma varredura (regex única, linha a linha) procura:
+- cabeçalhos de resposta: "Em <data>, <nome> escreveu:" / "On <data>, <name> wrote:"
+  (também quebrados em até 3 linhas), "-----Mensagem original-----", "Forwarded message"
+  e blocos "De:/From:" seguidos de "Para:/To:/Enviado:/Sent:/Assunto:/Subject:..."
+- assinatura: "-- ", fechos ("Atenciosamente", "Att.", "Best regards"...) seguidos de
+  poucas linhas, "Enviado do meu iPhone" / "Sent from my ..."
+- rodapé legal: avisos de confidencialidade, "Antes de imprimir..." e afins
+Linhas citadas com ">" (respostas intercaladas) também saem.
+
+Nunca devolve vazio para um texto com conteúdo: encaminhamento sem comentário usa a
+mensagem encaminhada; se nada sobrar, fica o texto original.
+"""
+import os
+import re
+
+BODY_TRIM = os.getenv("BODY_TRIM", "1") == "1"
+# um fecho ("Atenciosamente", "Regards") só é assinatura se vier com até N linhas depois
+BODY_SIG_MAX_LINES = int(os.getenv("BODY_SIG_MAX_LINES", "8"))
+
+_HEADER_KEY = r"\*{0,2}(?:para|to|cc|cco|bcc|enviad[oa]|sent|data|date|assunto|subject)\*{0,2}[ \t]*:"
+
+_MARKERS = re.compile(
+    r"^[ \t]*(?:"
+    # cabeçalho de resposta do Gmail/Apple Mail (às vezes quebrado em 2-3 linhas)
+    r"(?P<reply>(?:em|on)\b[^\n]{0,300}?(?:\n[^\n]{0,300}?){0,2}?\b(?:escreveu|wrote)[ \t]*:[ \t]*$)"
+    r"|(?P<sep>-{2,}[ \t]*(?:original message|mensagem original|forwarded message|mensagem encaminhada)[ \t]*-*[ \t]*$)"
+    # bloco do Outlook: De/From seguido (na mesma ou na próxima linha) de outro campo
+    rf"|(?P<hdr>\*{{0,2}}(?:de|from)\*{{0,2}}[ \t]*:[^\n]*\n(?:[^\n]*\n)?[ \t]*{_HEADER_KEY})"
+    r"|(?P<sig>--[ \t]*$"
+    r"|(?:atenciosamente|att|atte|cordialmente|abra[cç]os?|abs|sauda[cç][oõ]es"
+    r"|best regards|kind regards|warm regards|regards|best wishes|sincerely|cheers)[ \t]*[,.!]?[ \t]*$)"
+    r"|(?P<device>(?:enviado do meu|enviado de meu|sent from my)\b[^\n]*$)"
+    r"|(?P<legal>(?:aviso legal|aviso de confidencialidade|confidentiality notice|disclaimer"
+    r"|esta (?:mensagem|e-?mail)[^\n]{0,120}confidencia|this (?:message|e-?mail)[^\n]{0,120}confidential"
+    r"|antes de imprimir|please consider the environment)[^\n]*$)"
+    r")",
+    flags=re.IGNORECASE | re.MULTILINE,
+)
+# linhas de cabeçalho (De/Para/Assunto...) de uma mensagem encaminhada, puladas em bloco
+_HEADER_LINES = re.compile(
+    rf"(?:[ \t]*\n|[ \t]*(?:\*{{0,2}}(?:de|from)\*{{0,2}}[ \t]*:|{_HEADER_KEY})[^\n]*(?:\n|$))*",
+    flags=re.IGNORECASE,
+)
+_QUOTED = re.compile(r"(?m)^[ \t]*>[^\n]*(?:\n|$)")
+_BLANK_RUNS = re.compile(r"\n[ \t]*\n(?:[ \t]*\n)+")
+_TRAILING_RULES = re.compile(r"(?:\n[ \t]*[_\-=*~]{3,}[ \t]*)+$")  # "_____" do Outlook antes do corte
+
+_THREAD = ("reply", "sep", "hdr")
+_MAX_DEPTH = 3  # encaminhamentos sem comentário seguidos
+
+
+def _newest(text: str, depth: int) -> str:
+    cut, ends = len(text), []  # ends: (posição, tipo) de assinatura/rodapé antes do corte
+    for m in _MARKERS.finditer(text):
+        kind = m.lastgroup
+        if kind in _THREAD:
+            if not text[:m.start()].strip() and depth < _MAX_DEPTH:
+                # cabeçalho logo no início (encaminhamento puro): a mensagem útil é a citada
+                rest = _HEADER_LINES.match(text, m.start() if kind == "hdr" else m.end()).end()
+                return _newest(text[rest:], depth + 1)
+            cut = m.start()
+            break
+        if text[:m.start()].strip():
+            ends.append((m.start(), m.end(), kind, m.group().strip()))
+
+    stop = cut
+    for start, end, kind, mark in ends:
+        # fecho seguido de muitas linhas ("Abs" no meio do texto) não é assinatura
+        if kind == "sig" and mark != "--" and text.count("\n", end, cut) > BODY_SIG_MAX_LINES:
+            continue
+        stop = start
+        break
+
+    body = text[:stop]
+    body = _QUOTED.sub("", body) if ">" in body else body
+    return _TRAILING_RULES.sub("", _BLANK_RUNS.sub("\n\n", body).strip()).rstrip()
+
+
+def newest_message(text: str) -> str:
+    """Só a mensagem mais recente do email (sem histórico, assinatura e rodapé legal)."""
+    if not BODY_TRIM or not text:
+        return text or ""
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return _newest(text, 0) or text.strip()
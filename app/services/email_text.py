@@ -0,0 +1,113 @@
+"""
+Email normalizado uma vez por requisição e compartilhado entre as etapas.
+
+Idioma, intenção por regras, fastpath, sinais de erro, anexo e ticket do template
+leem o mesmo objeto em vez de cada um normalizar o texto de novo. Tudo é calculado
+na primeira leitura e guardado:
+- text:    texto sem espaços nas pontas
+- lower:   minúsculo, com acentos (base do preprocess)
+- norm:    minúsculo, sem acentos, espaços colapsados (base das palavras-chave)
+- hits:    ocorrências de todas as famílias do matcher sobre `norm`
+- tokens:  palavras de `norm`
+- lang:    'pt' ou 'en' (identificador de n-gramas, lang_id.py) e lang_confidence
+- tickets: INC-123 / números longos, na ordem em que aparecem
+
+Quem só tem a string usa normalized(texto) (memoizado por texto); quem já tem o
+objeto repassa o objeto.
+"""
+import re
+from functools import lru_cache
+from typing import Optional, Union
+
+from .matcher import KEYWORDS, Hits, norm_text
+
+_TICKET_RE = re.compile(r'(INC-\d+|\b\d{5,}\b)', flags=re.IGNORECASE)
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class NormalizedEmail:
+    __slots__ = ("raw", "text", "_lower", "_norm", "_hits", "_tokens", "_lang", "_lang_conf", "_tickets")
+
+    def __init__(self, raw: Optional[str]):
+        self.raw = raw or ""
+        self.text = self.raw.strip()
+        self._lower: Optional[str] = None
+        self._norm: Optional[str] = None
+        self._hits: Optional[Hits] = None
+        self._tokens: Optional[list[str]] = None
+        self._lang: Optional[str] = None
+        self._lang_conf = 0.0
+        self._tickets: Optional[list[str]] = None
+
+    @property
+    def lower(self) -> str:
+        if self._lower is None:
+            self._lower = self.raw.lower()
+        return self._lower
+
+    @property
+    def norm(self) -> str:
+        if self._norm is None:
+            self._norm = norm_text(self.text)
+        return self._norm
+
+    @property
+    def hits(self) -> Hits:
+        if self._hits is None:
+            self._hits = KEYWORDS.scan_normalized(self.norm)
+        return self._hits
+
+    @property
+    def tokens(self) -> list[str]:
+        if self._tokens is None:
+            self._tokens = _TOKEN_RE.findall(self.norm)
+        return self._tokens
+
+    @property
+    def lang(self) -> str:
+        if self._lang is None:
+            from .lang_id import language_identifier
+            self.set_language(*language_identifier().identify(self))
+        return self._lang
+
+    @property
+    def lang_confidence(self) -> float:
+        return self._lang_conf if self.lang else 0.0
+
+    @property
+    def lang_known(self) -> bool:
+        return self._lang is not None
+
+    def set_language(self, lang: str, confidence: float):
+        """Idioma já identificado em lote (nlp_service.detect_language_batch)."""
+        self._lang, self._lang_conf = lang, confidence
+
+    @property
+    def tickets(self) -> list[str]:
+        if self._tickets is None:
+            self._tickets = _TICKET_RE.findall(self.text)
+        return self._tickets
+
+    @property
+    def ticket(self) -> Optional[str]:
+        return self.tickets[0] if self.tickets else None
+
+
+EmailLike = Union[str, NormalizedEmail, None]
+
+
+@lru_cache(maxsize=64)
+def _normalized_cached(raw: str) -> NormalizedEmail:
+    return NormalizedEmail(raw)
+
+
+def normalized(email: EmailLike) -> NormalizedEmail:
+    """O próprio objeto, ou o da string (memoizado: etapas que só têm o texto dividem o mesmo)."""
+    if isinstance(email, NormalizedEmail):
+        return email
+    return _normalized_cached(email or "")
+
+
+def scan(email: EmailLike) -> Hits:
+    """Ocorrências de todas as famílias do matcher (uma varredura por email)."""
+    return normalized(email).hits
@@ -0,0 +1,138 @@
+"""
+Registro de clientes HTTP dos provedores: um cliente com pool de conexões keep-alive
+por processo (HTTP/2 quando o pacote h2 estiver instalado), compartilhado pelas threads.
+Conexões abertas uma vez = sem handshake TLS a cada chamada ao provedor.
+No modo assíncrono (asgi.py) há um httpx.AsyncClient por event loop, com pool maior:
+ali o limite de concorrência é a cota do provedor, não o número de threads.
+"""
+import asyncio
+import os
+import threading
+from typing import Iterable, Optional
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_S", "60"))
+HTTP_HTTP2 = os.getenv("HTTP_HTTP2", "1") == "1"
+HTTP_PREWARM = os.getenv("HTTP_PREWARM", "1") == "1"
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "100"))
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+class _ClientRegistry:
+    def __init__(self):
+        self._lock = threading.RLock()  # a fábrica do cliente OpenAI pede o cliente http
+        self._pid: Optional[int] = None
+        self._clients: dict[str, object] = {}
+
+    def _after_fork(self):
+        # o fork pode ter acontecido com outra thread (ex.: prewarm) segurando o lock:
+        # o filho começa com lock e clientes novos
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+    def _get(self, name: str, factory):
+        # clientes não atravessam fork: cada worker do gunicorn abre os seus
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients = {}
+                self._pid = os.getpid()
+            client = self._clients.get(name)
+            if client is None:
+                client = self._clients[name] = factory()
+            return client
+
+    def http(self) -> httpx.Client:
+        """Cliente httpx compartilhado (thread-safe), com pool e keep-alive."""
+        def factory():
+            return httpx.Client(
+                http2=HTTP_HTTP2 and _h2_available(),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_S,
+                ),
+            )
+        return self._get("http", factory)
+
+    def openai(self, api_key: str):
+        """Cliente OpenAI do processo, com a chave no cliente (não no módulo global)."""
+        def factory():
+            import openai as _openai
+            return _openai.OpenAI(api_key=api_key, http_client=self.http())
+        return self._get(f"openai:{api_key}", factory)
+
+    def async_http(self) -> httpx.AsyncClient:
+        """httpx.AsyncClient do event loop atual (cliente assíncrono não atravessa loops)."""
+        loop_id = id(asyncio.get_running_loop())
+
+        def factory():
+            return httpx.AsyncClient(
+                http2=HTTP_HTTP2 and _h2_available(),
+                limits=httpx.Limits(
+                    max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_S,
+                ),
+            )
+        return self._get(f"async_http:{loop_id}", factory)
+
+    def async_openai(self, api_key: str):
+        """openai.AsyncOpenAI sobre o AsyncClient do loop atual."""
+        loop_id = id(asyncio.get_running_loop())
+
+        def factory():
+            import openai as _openai
+            return _openai.AsyncOpenAI(api_key=api_key, http_client=self.async_http())
+        return self._get(f"async_openai:{loop_id}:{api_key}", factory)
+
+    async def aclose(self):
+        """Fecha os clientes assíncronos do loop atual (desligamento do ASGI)."""
+        loop_id = id(asyncio.get_running_loop())
+        with self._lock:
+            names = [n for n in self._clients if n.startswith("async_") and f":{loop_id}" in n]
+            closing = [self._clients.pop(n) for n in names]
+        for client in closing:
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+
+    def prewarm(self, urls: Iterable[str], timeout: float = 5.0):
+        """Abre as conexões (DNS + TCP + TLS) em segundo plano; erro aqui não importa."""
+        urls = list(urls)
+        if not HTTP_PREWARM or not urls:
+            return
+
+        def run():
+            client = self.http()
+            for url in urls:
+                try:
+                    client.head(url, timeout=timeout)
+                    print(f"[http] conexão aquecida: {url}")
+                except Exception as e:
+                    print(f"[http] falha ao aquecer {url}: {e}")
+
+        threading.Thread(target=run, name="http-prewarm", daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            names = sorted(self._clients) if self._pid == os.getpid() else []
+        return {
+            "clients": [n.split(":", 1)[0] for n in names],
+            "http2": HTTP_HTTP2 and _h2_available(),
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive": HTTP_MAX_KEEPALIVE,
+        }
+
+
+clients = _ClientRegistry()
+os.register_at_fork(after_in_child=clients._after_fork)
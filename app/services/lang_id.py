@@ -0,0 +1,253 @@
+"""
+Identificação de idioma (pt/en) por perfis de n-gramas de caracteres.
+
+- o texto normalizado do email (minúsculo, sem acento) vira um vetor de bytes num alfabeto
+  reduzido (a-z, dígito, outra letra, separador); os n-gramas de 1 a 4 caracteres saem de
+  operações do numpy sobre esse vetor, numa passada, sem laço em Python por caractere
+- cada n-grama é um índice fixo (código na base do alfabeto): sem vocabulário, sem hashing
+- um lote vira UMA matriz esparsa (emails x n-gramas); o escore é X @ w, com w = log-razão
+  en/pt de um Naive Bayes multinomial treinado nos perfis LANG_SEED na primeira chamada
+- confiança = probabilidade a posteriori do idioma escolhido (escore / TEMPERATURE + a priori
+  LANG_ID_EN_PRIOR); sem evidência (texto vazio, só números) fica 'pt', como o detector
+  anterior fazia por padrão
+"""
+import os
+import threading
+from typing import Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from .email_text import EmailLike, NormalizedEmail, normalized
+
+LANG_ID_MAX_CHARS = int(os.getenv("LANG_ID_MAX_CHARS", "20000"))  # início do texto já basta
+LANG_ID_ALPHA = float(os.getenv("LANG_ID_ALPHA", "0.5"))           # suavização (Laplace/Lidstone)
+LANG_ID_EN_PRIOR = float(os.getenv("LANG_ID_EN_PRIOR", "0.3"))     # a priori de inglês (a caixa é brasileira)
+
+MAX_N = 4
+# cada caractere entra em até 1 + 2 + ... + MAX_N n-gramas sobrepostos (não independentes):
+# o escore é dividido por isso para a confiança valer "por caractere", não por n-grama
+TEMPERATURE = MAX_N * (MAX_N + 1) / 2
+
+# alfabeto: 0 = separador (espaço/pontuação), 1..26 = a-z, 27 = dígito, 28 = outra letra
+_SEP, _DIGIT, _OTHER = 0, 27, 28
+_BASE = 29
+
+
+def _alphabet() -> bytes:
+    table = bytearray([_SEP]) * 256
+    for c in range(256):
+        ch = chr(c)
+        if "a" <= ch <= "z":
+            table[c] = ord(ch) - ord("a") + 1
+        elif ch.isdigit():
+            table[c] = _DIGIT
+        elif ch.isalpha():
+            table[c] = _OTHER
+    return bytes(table)
+
+
+_ALPHABET = _alphabet()
+# n-gramas de tamanho n ocupam [_OFFSETS[n], _OFFSETS[n] + _BASE**n)
+_OFFSETS = {n: sum(_BASE ** k for k in range(1, n)) for n in range(1, MAX_N + 1)}
+N_FEATURES = sum(_BASE ** n for n in range(1, MAX_N + 1))
+
+# Perfis de treino: frases típicas de email (suporte e geral) e palavras funcionais de cada idioma.
+LANG_SEED = {
+    "pt": [
+        "Bom dia, tudo bem? Gostaria de saber o andamento da minha solicitação.",
+        "Boa tarde, podem informar o status do chamado aberto na semana passada?",
+        "Boa noite, ainda não tive retorno sobre o protocolo e preciso de uma previsão.",
+        "Segue em anexo o comprovante solicitado, por favor confirmem o recebimento.",
+        "Conforme combinado, encaminho os documentos assinados para análise.",
+        "Não consigo acessar o sistema desde ontem, minha senha não funciona.",
+        "Minha conta está bloqueada, vocês podem desbloquear ou resetar a senha?",
+        "O sistema apresenta erro ao salvar o formulário e a tela fica em branco.",
+        "A aplicação está indisponível desde cedo e aparece uma mensagem de exceção.",
+        "Estamos com lentidão e o sistema trava quando abrimos os pedidos.",
+        "Podem encerrar o chamado, o problema foi resolvido. Obrigado pela ajuda!",
+        "Muito obrigada pelo suporte e pela atenção de sempre, era só isso mesmo.",
+        "Agradeço o retorno rápido, fico no aguardo das próximas orientações.",
+        "Desejo a todos um feliz natal e um próximo ano cheio de conquistas.",
+        "Preciso de ajuda para configurar a integração com o nosso servidor.",
+        "Qual é o prazo para a atualização do cadastro? Aguardo uma posição.",
+        "Atenciosamente, equipe de suporte. Permanecemos à disposição.",
+        "Olá, prezados, tenho uma dúvida sobre a fatura deste mês.",
+        "Favor verificar o incidente com urgência, pois está afetando os clientes.",
+        "Não recebi o código de autenticação e por isso não consigo fazer login.",
+        "Quando o técnico vai retornar a ligação? Estou esperando desde segunda-feira.",
+        "Enviei os prints e os logs no último email, vocês conseguiram analisar?",
+        "A nota fiscal do pedido não chegou, poderiam reenviar para o meu endereço?",
+        "Obrigado pelo contato. Já estamos analisando sua solicitação e voltamos em breve.",
+        "Lamentamos o ocorrido. Poderia nos enviar os passos para reproduzir o problema?",
+        "Recebemos o arquivo e vamos validar o material antes de seguir com os próximos passos.",
+        "Este canal é voltado a solicitações de atendimento; no momento não há ações pendentes.",
+        "Eu não sei se o pagamento foi aprovado, então peço que verifiquem com o financeiro.",
+        "Ele disse que a reunião foi cancelada, mas ninguém me avisou nada até agora.",
+        "Nós precisamos que vocês façam a instalação ainda hoje, se for possível.",
+        "Houve uma falha na entrega e o produto chegou com defeito na embalagem.",
+        "Acho que o problema começou depois da última atualização do aplicativo.",
+        "Vou enviar o contrato revisado amanhã cedo, assim que o jurídico aprovar.",
+        "Estou sem acesso à plataforma e o gerente precisa do relatório hoje.",
+        "Por gentileza, alguém pode me dizer como faço para trocar o meu e-mail de cadastro?",
+        "O boleto venceu ontem; é possível gerar uma segunda via com a data atualizada?",
+        "Seguem as informações pedidas: número do pedido, data da compra e valor pago.",
+        "Também queria saber se existe alguma forma de acompanhar a entrega pelo site.",
+        "A impressora do setor parou de funcionar e já tentamos reiniciar várias vezes.",
+        "Caso precisem de mais alguma informação, estou à disposição para ajudar.",
+        "O ticket continua com status pendente e o log mostra o mesmo erro no driver da GPU.",
+        "Fiz o upload do backup no link que vocês mandaram, mas o deploy falhou de novo.",
+        "O software não abre depois do update do Windows; mandei o print da tela por email.",
+        "Meu notebook reinicia sozinho quando conecto o monitor externo pelo cabo HDMI.",
+        "Vocês conseguem verificar se o servidor está fora do ar? O site não carrega.",
+        "A senha expirou e o aplicativo pede um token que eu não tenho mais.",
+        "Gostaria de cancelar a assinatura e receber o reembolso do valor cobrado a mais.",
+        "Bom dia a todos, passando para lembrar da reunião de alinhamento às dez horas.",
+        "Obrigado, pessoal! Foi um prazer trabalhar com vocês neste projeto.",
+        "Fiquei com uma dúvida: o chamado precisa ser aberto por mim ou pelo meu gestor?",
+        "O relatório mensal está atrasado porque a planilha não foi atualizada a tempo.",
+        "Segue abaixo o histórico da conversa para que vocês entendam o contexto.",
+        "de da do das dos em no na nos nas um uma uns umas com para por pelo pela que não sim "
+        "mas ou se já também muito mais menos ainda então porque quando onde como isso esse essa "
+        "este esta aquele meu minha seu sua nosso nossa eles elas você vocês foi são está estão "
+        "ser ter tem têm fazer pode podem vai vou temos tenho há até após sobre entre sem hoje "
+        "ontem amanhã agora depois antes aqui lá obrigado obrigada olá prezado prezada favor",
+    ],
+    "en": [
+        "Good morning, could you please update me on the status of my ticket?",
+        "Hi team, any update on the case I opened last week? What is the ETA?",
+        "Following up on my previous request, is there any progress on this issue?",
+        "Attached is the requested invoice. Please confirm receipt when you can.",
+        "Please find attached the signed form and the supporting documents.",
+        "I can't log in to the portal, my account seems to be locked.",
+        "Could you reset my password? I lost access after the last update.",
+        "The application crashes with an exception whenever I export the report.",
+        "We are getting a timeout error on the checkout page since this morning.",
+        "There is a bug: the screen freezes right after the login page loads.",
+        "You can close the ticket, the issue is resolved on our side. Thanks!",
+        "Thank you so much for your help and quick response, that was all I needed.",
+        "Thanks for the update, I will wait for the next steps from your team.",
+        "Wishing you and your family a merry Christmas and a happy new year.",
+        "I need help setting up the integration with our server and the firewall.",
+        "When will the account information be updated? Looking forward to hearing from you.",
+        "Best regards, support team. We are at your disposal if you need anything else.",
+        "Hello, dear team, I have a question about this month's invoice.",
+        "Please check the incident urgently because it is affecting our customers.",
+        "I did not receive the authentication code, so I cannot sign in.",
+        "When is the technician going to call me back? I have been waiting since Monday.",
+        "I sent the screenshots and logs in my last email, were you able to review them?",
+        "The invoice for the order never arrived, could you send it again to my address?",
+        "Thanks for your message. We're analyzing it and will share an update soon.",
+        "Sorry about the issue. Please share steps to reproduce and the approximate time.",
+        "We've received your file and will validate it before replying with next steps.",
+        "This mailbox is dedicated to support requests, so no action is required at this time.",
+        "I don't know whether the payment was approved, so please check with billing.",
+        "He said the meeting was cancelled, but nobody has told me anything so far.",
+        "We need you to do the installation today if that's at all possible.",
+        "There was a problem with the delivery and the product arrived damaged.",
+        "I think the problem started after the latest update of the mobile app.",
+        "I will send the revised contract tomorrow morning as soon as legal approves it.",
+        "I have no access to the platform and my manager needs the report today.",
+        "Could someone tell me how I can change the e-mail address on my profile?",
+        "The bill was due yesterday; is it possible to issue a new one with an updated date?",
+        "Here is the requested information: order number, purchase date and amount paid.",
+        "I would also like to know if there is a way to track the delivery on the website.",
+        "The printer in our department stopped working and we already restarted it several times.",
+        "If you need any further information, I'm happy to help.",
+        "The ticket is still pending and the log shows the same error in the GPU driver.",
+        "I uploaded the backup to the link you sent, but the deployment failed again.",
+        "The software won't open after the Windows update; I emailed a screenshot of the screen.",
+        "My laptop restarts by itself when I connect the external monitor through the HDMI cable.",
+        "Can you check whether the server is down? The website doesn't load at all.",
+        "The password expired and the app is asking for a token that I no longer have.",
+        "I would like to cancel the subscription and get a refund for the overcharged amount.",
+        "Good morning everyone, just a reminder about the alignment meeting at ten o'clock.",
+        "Thank you, everyone! It was a pleasure working with you on this project.",
+        "Quick question: should the ticket be opened by me or by my manager?",
+        "The monthly report is late because the spreadsheet was not updated in time.",
+        "Please see the conversation history below so you understand the context.",
+        "the of and to in is it that for on with as was at by be this have from or an are not "
+        "but what all were when we there can your which their said if will each about how up out "
+        "them then she many some so these would other into has more her two like him see time "
+        "could no make than been its who now people my made over did down only way find use may "
+        "please thanks thank you hi hello regards dear request question update attachment case",
+    ],
+}
+
+
+def _codes(norm: str) -> np.ndarray:
+    """Índices de todos os n-gramas (1..MAX_N) do texto normalizado, com separador nas pontas."""
+    raw = norm[:LANG_ID_MAX_CHARS].encode("latin-1", "replace").translate(_ALPHABET)
+    b = np.frombuffer(b"\x00" + raw + b"\x00", dtype=np.uint8).astype(np.int32)
+    out = [b + _OFFSETS[1]]
+    code = b
+    for n in range(2, MAX_N + 1):
+        if len(b) < n:
+            break
+        code = code[:-1] * _BASE + b[n - 1:]
+        out.append(code + _OFFSETS[n])
+    return np.concatenate(out)
+
+
+def _matrix(norms: Sequence[str]) -> sparse.csr_matrix:
+    """Lote -> matriz esparsa de contagens (emails x N_FEATURES)."""
+    codes = [_codes(t) for t in norms]
+    indptr = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in codes], out=indptr[1:])
+    indices = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int32)
+    X = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                          shape=(len(codes), N_FEATURES))
+    X.sum_duplicates()
+    return X
+
+
+class LanguageIdentifier:
+    """Naive Bayes multinomial pt x en sobre contagens de n-gramas de caracteres."""
+    LANGS = ("pt", "en")
+
+    def __init__(self, seed: dict[str, list[str]] = LANG_SEED, alpha: float = LANG_ID_ALPHA,
+                 en_prior: float = LANG_ID_EN_PRIOR):
+        from .matcher import norm_text
+
+        counts = {
+            lang: np.asarray(_matrix([norm_text(t) for t in texts]).sum(axis=0)).ravel()
+            for lang, texts in seed.items()
+        }
+        pt, en = counts["pt"], counts["en"]
+        # só n-gramas vistos no treino pesam; os demais não mudam o escore
+        seen = (pt + en) > 0
+        vocab = int(seen.sum())
+        log_pt = np.log((pt + alpha) / (pt.sum() + alpha * vocab))
+        log_en = np.log((en + alpha) / (en.sum() + alpha * vocab))
+        self.weights = np.where(seen, (log_en - log_pt) / TEMPERATURE, 0.0).astype(np.float64)
+        self.bias = float(np.log(en_prior / (1.0 - en_prior)))
+
+    def scores(self, norms: Sequence[str]) -> np.ndarray:
+        """log-odds en x pt por texto (já normalizado), numa multiplicação esparsa."""
+        if not norms:
+            return np.zeros(0)
+        return _matrix(norms) @ self.weights + self.bias
+
+    def identify_batch(self, texts: Sequence[EmailLike]) -> list[tuple[str, float]]:
+        norms = [t.norm if isinstance(t, NormalizedEmail) else normalized(t).norm for t in texts]
+        out = []
+        for s in self.scores(norms):
+            p_en = 1.0 / (1.0 + np.exp(-np.clip(s, -50.0, 50.0)))
+            out.append(("en", float(p_en)) if s > 0 else ("pt", float(1.0 - p_en)))
+        return out
+
+    def identify(self, text: EmailLike) -> tuple[str, float]:
+        return self.identify_batch([text])[0]
+
+
+_IDENTIFIER: Optional[LanguageIdentifier] = None
+_IDENTIFIER_LOCK = threading.Lock()
+
+
+def language_identifier() -> LanguageIdentifier:
+    global _IDENTIFIER
+    if _IDENTIFIER is None:
+        with _IDENTIFIER_LOCK:
+            if _IDENTIFIER is None:
+                _IDENTIFIER = LanguageIdentifier()
+    return _IDENTIFIER
@@ -0,0 +1,271 @@
+"""
+Matcher de palavras-chave em passada única.
+
+Todas as famílias de palavras-chave (intenções, anexos, idioma, sinais de erro)
+viram UMA regex compilada no import, montada como trie (prefixos comuns fatorados),
+e envolvida num lookahead para enxergar ocorrências sobrepostas. Cada posição do
+texto é visitada uma vez; o resultado traz todas as ocorrências de todas as famílias.
+A varredura de cada email fica no NormalizedEmail (email_text.py), feita uma vez por requisição.
+
+Sintaxe das palavras-chave:
+- "termo"   -> modo padrão da família ("word" = com fronteira de palavra, "sub" = substring)
+- "termo*"  -> radical: fronteira só à esquerda (ex.: "bloquead*" casa "bloqueado")
+- "termo+"  -> radical com pelo menos mais uma letra (como r"termo\w+": "anex+" não casa "anex")
+- espaço dentro de um termo casa também quebra de linha ("em anexo" casa "em\nanexo")
+- "~termo"  -> substring, mesmo numa família "word"
+"""
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Iterable
+
+WORD, STEM, STEM_MORE, SUB = "word", "stem", "stem_more", "sub"
+
+# ------------------------- famílias -------------------------
+FAMILIES: dict[str, tuple[str, list[str]]] = {
+    # ---- detect_intent (classifier_service) ----
+    "attach_strong": (WORD, [
+        "em anexo", "segue anexo", "segue anexos", "seguem anexo", "seguem anexos",
+        "segue em anexo", "segue em anexos", "seguem em anexo", "seguem em anexos",
+        "conforme anexo", "anexei", "anexamos", "anexado", "anexados", "vai anexo",
+        "attached", "attachment", "attachments", "enclosed", "please find attached",
+    ]),
+    "attach_weak": (WORD, [
+        "anex+", "em anexo", "segue em anexo", "seguem em anexo", "attached", "attachment",
+        "enclosed", "please find attached", "log", "logs", "screenshot", "screenshots",
+    ]),
+    "closure_verb": (WORD, ["encerrar", "encerramento", "fechar", "finalizar", "desconsiderar"]),
+    "closure_object": (WORD, ["chamado", "ticket", "protocolo"]),
+    "closure_direct": (WORD, ["resolvid*", "~issue closed", "~issueclosed", "~resolved"]),
+    "status": (WORD, [
+        "status", "andamento", "previsao", "prazo", "atualizacao", "retorno", "posicao",
+        "acompanhamento", "ticket", "case", "protocolo",
+    ]),
+    "access": (WORD, [
+        "acesso", "logar", "login", "senha", "reset", "bloquead*", "desbloque*", "autenticacao",
+        "2fa", "mfa", "access", "signin", "password", "locked", "unlock", "authentication",
+    ]),
+    "error": (WORD, [
+        "erro", "falha", "bug", "trava", "travando", "inoperante", "indisponivel", "artefato",
+        "artefatos", "lentidao", "excecao", "problema", "incidente", "error", "failure", "crash",
+        "frozen", "hang", "timeout", "stacktrace", "exception", "issue", "incident",
+    ]),
+    "thanks": (WORD, ["obrigado", "obrigada", "valeu", "agradeco", "thanks", "thank you", "thx"]),
+    "greet": (WORD, [
+        "bom dia", "boa tarde", "boa noite", "boas festas", "feliz natal", "feliz ano", "saudacoes",
+        "merry", "happy holidays", "happy christmas", "happy new year", "congratulations",
+        "congrats", "greetings",
+    ]),
+    "support_term": (WORD, ["suporte", "technical support", "support"]),
+    "support_verb": (WORD, [
+        "ajuda", "ajudar", "preciso", "poderia", "pode", "podem", "gostaria", "solicito",
+        "integrar", "instalar", "configurar", "setup", "integracao", "instalacao", "configuracao",
+        "help", "assist",
+    ]),
+    "request": (WORD, ["pode", "podem", "poderia", "poderiam", "preciso", "consegue", "conseguem"]),
+
+    # ---- sinais de erro (pipeline: ATTACHMENT -> ERROR) ----
+    "error_signs": (WORD, [
+        "erro", "falha", "bug", "inoperante", "indisponivel", "lentidao", "excecao", "problema",
+        "incidente", "error", "failure", "crash", "timeout", "stacktrace", "exception", "issue",
+        "incident",
+    ]),
+
+    # ---- fastpath_from_config (ai_provider): documento que não é mensagem ----
+    "doc_none": (SUB, [
+        "curriculo", "resume", "curriculum", "portfolio", "linkedin.com/in/", "contrato",
+        "contract", "manual", "politica", "policy", "anuncio", "announcement",
+    ]),
+    "doc_action": (SUB, [
+        "status", "ticket", "protocolo", "erro", "error", "acesso", "login", "suporte", "support",
+    ]),
+
+    # ---- _has_attachment (response_service) ----
+    "att_future": (SUB, [
+        "posso enviar", "vou enviar", "enviarei", "posso mandar", "mandarei", "posso encaminhar",
+        "encaminharei", "poderia enviar", "podem me enviar", "podem enviar", "podem mandar",
+        "poderiam enviar", "i can send", "i will send", "i’ll send", "will provide", "can provide",
+    ]),
+    "att_strong": (SUB, [
+        "em anexo", "segue em anexo", "segue anexo", "conforme anexo", "anexei", "anexamos",
+        "anexado", "vai anexo", "vao anexos", "comprovante em anexo", "documento em anexo",
+        "attached", "attachment", "attachments", "please find attached", "enclosed",
+        "file attached", "files attached",
+    ]),
+    "att_generic": (SUB, [
+        "print", "prints", "captura de tela", "screenshot", "screenshots", "arquivo", "arquivos",
+        "comprovante", "comprovantes", "log", "logs", "evidencia", "evidencias", "evidence",
+        "evidences",
+    ]),
+
+    # ---- _lang_mismatch (pipeline): marcadores de resposta no idioma errado ----
+    "reply_pt": (WORD, [
+        "ola", "prezado", "prezada", "obrigado", "obrigada", "atenciosamente",
+        "equipe de suporte", "favor",
+    ]),
+    "reply_en": (WORD, ["hi,", "dear", "thank you", "thanks", "best regards", "support team"]),
+}
+
+# brancos com quebra de linha viram um "\n" só; os demais, um espaço (só sequências que mudam)
+_NL = re.compile(r"[^\S\n]+\n\s*|\n\s+")
+_WS = re.compile(r"(?: [^\S\n]|[^\S\n ])[^\S\n]*")
+_MARKS = re.compile(r"[\u0300-\u036f]+")
+
+
+def _nfd_fold(s: str) -> str:
+    return _MARKS.sub("", unicodedata.normalize("NFD", s)).lower()
+
+
+# Latin-1 (o caso de PT/EN): minúsculo + sem acento numa tabela de bytes, 1 byte -> 1 byte
+_LATIN1_FOLD = bytes(ord(_nfd_fold(chr(b))) for b in range(256))
+_NL_BYTES = re.compile(
+    rb"[\t\x0b\x0c\r\x1c-\x1f \x85\xa0]+\n[\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0]*|\n[\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0]+"
+)
+_WS_BYTES = re.compile(rb"(?: [\t\x0b\x0c\r\x1c-\x1f \x85\xa0]|[\t\x0b\x0c\r\x1c-\x1f\x85\xa0])[\t\x0b\x0c\r\x1c-\x1f \x85\xa0]*")
+
+
+def norm_text(s: str) -> str:
+    """
+    Sem acentos, minúsculo, brancos colapsados: um "\n" onde havia quebra de linha (as
+    checagens "na mesma linha" dependem dela), senão um espaço.
+    """
+    s = s or ""
+    try:
+        b = s.encode("latin-1")
+    except UnicodeEncodeError:
+        # fora do Latin-1 (aspas curvas, travessão, outros alfabetos): decomposição NFD
+        s = _nfd_fold(s)
+        return _WS.sub(" ", _NL.sub("\n", s) if "\n" in s else s)
+    b = b.translate(_LATIN1_FOLD)
+    return _WS_BYTES.sub(b" ", _NL_BYTES.sub(b"\n", b) if b"\n" in b else b).decode("latin-1")
+
+
+def _one_line(t: str) -> str:
+    """Quebras de linha como espaço (mesmo tamanho): termos com espaço casam através delas."""
+    return t.replace("\n", " ") if "\n" in t else t
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Alternância em forma de trie; o '?' guloso faz o casamento mais longo vencer."""
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class Hits:
+    """Ocorrências por família: {familia: [(inicio, fim, termo), ...]} sobre o texto normalizado."""
+    __slots__ = ("text", "spans")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.spans: dict[str, list[tuple[int, int, str]]] = {}
+
+    def has(self, family: str) -> bool:
+        return family in self.spans
+
+    def count(self, family: str) -> int:
+        return len(self.spans.get(family, ()))
+
+    def terms(self, family: str) -> set[str]:
+        return {kw for _, _, kw in self.spans.get(family, ())}
+
+    def followed_on_line(self, first: str, then: str) -> bool:
+        """Equivale a r"\\b(first)\\b.*\\b(then)\\b": `then` depois de `first`, na mesma linha."""
+        a_spans, b_spans = self.spans.get(first), self.spans.get(then)
+        if not a_spans or not b_spans:
+            return False
+        t = self.text
+        b_starts = [b for b, _, _ in b_spans]  # já em ordem crescente
+        for _, a_end, _ in a_spans:
+            # basta olhar a ocorrência de `then` mais próxima depois de `first`
+            i = bisect_left(b_starts, a_end)
+            if i < len(b_starts) and "\n" not in t[a_end:b_starts[i]]:
+                return True
+        return False
+
+
+class KeywordMatcher:
+    def __init__(self, families: dict[str, tuple[str, Iterable[str]]]):
+        entries: dict[str, list[tuple[str, str]]] = {}  # termo -> [(familia, modo)]
+        for family, (default_mode, words) in families.items():
+            for w in words:
+                mode = default_mode
+                if w.startswith("~"):
+                    w, mode = w[1:], SUB
+                elif w.endswith("*"):
+                    w, mode = w[:-1], STEM
+                elif w.endswith("+"):
+                    w, mode = w[:-1], STEM_MORE
+                w = norm_text(w)
+                if (family, mode) not in entries.setdefault(w, []):
+                    entries[w].append((family, mode))
+
+        # no mesmo ponto de início, todo termo que é prefixo do casamento mais longo também casou;
+        # achatado em (tam, exige_fronteira_esq, exige_fronteira_dir, exige_mais_letras, familia, termo)
+        vocab = sorted(entries)
+        self._closure = {}
+        for p in vocab:
+            flat = []
+            for q in vocab:
+                if not p.startswith(q):
+                    continue
+                for family, mode in entries[q]:
+                    need_left = mode in (STEM, STEM_MORE) or (mode == WORD and _is_word(q[0]))
+                    need_right = mode == WORD and _is_word(q[-1])
+                    flat.append((len(q), need_left, need_right, mode == STEM_MORE, family, q))
+            self._closure[p] = flat
+        self._regex = re.compile("(?=(" + _trie_pattern(vocab) + "))")
+
+    def scan_normalized(self, t: str) -> Hits:
+        hits = Hits(t)  # posições valem para `t`, que mantém as quebras de linha
+        spans = hits.spans
+        n = len(t)
+        closure = self._closure
+        for m in self._regex.finditer(_one_line(t)):
+            start = m.start()
+            left_ok = start == 0 or not _is_word(t[start - 1])
+            for size, need_left, need_right, need_more, family, kw in closure[m.group(1)]:
+                # fronteira como \b: só exigida ao lado de caracteres de palavra
+                if need_left and not left_ok:
+                    continue
+                end = start + size
+                if need_right and end < n and _is_word(t[end]):
+                    continue
+                if need_more and (end >= n or not _is_word(t[end])):
+                    continue
+                spans.setdefault(family, []).append((start, end, kw))
+        return hits
+
+    def scan(self, text: str) -> Hits:
+        return self.scan_normalized(norm_text(text))
+
+    def found_terms(self, t: str) -> set[str]:
+        """
+        Só os termos distintos presentes no texto JÁ normalizado (semântica de substring,
+        sem posições/fronteiras): findall roda inteiro em C e a expansão é feita uma vez
+        por casamento distinto.
+        """
+        out: set[str] = set()
+        closure = self._closure
+        for p in set(self._regex.findall(_one_line(t))):
+            out.update(entry[-1] for entry in closure[p])
+        return out
+
+
+KEYWORDS = KeywordMatcher(FAMILIES)
@@ -0,0 +1,310 @@
+"""
+Métricas no formato texto do Prometheus (/metrics), somadas entre os workers do gunicorn.
+
+- cada processo acumula contadores e histogramas em memória (um dict + lock por evento)
+- uma thread de fundo grava os incrementos (deltas) no SQLite do cache a cada METRICS_FLUSH_S;
+  como são deltas, nada se perde quando um worker é reciclado
+- medidores instantâneos (requisições em andamento, filas dos pools) ficam por processo, com
+  carimbo de tempo; /metrics e /healthz somam os workers vistos nos últimos METRICS_STALE_S
+Sem SQLite, cada processo mostra só os próprios números.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable, Optional
+
+from .cache import CACHE_DB_PATH
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+METRICS_STALE_S = float(os.getenv("METRICS_STALE_S", "30"))
+METRICS_DB_PATH = os.getenv("METRICS_DB_PATH", CACHE_DB_PATH)
+
+PREFIX = "respondo_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# nome -> (tipo, ajuda); só o que está aqui é exportado
+FAMILIES = {
+    "stage_seconds": ("histogram", "Latência por etapa (extract, ocr, nlp, classify, generate, first_event, total)."),
+    "requests_total": ("counter", "Classificações por status HTTP (emails rejeitados na entrada contam como 400)."),
+    "provider_errors_total": ("counter", "Chamadas ao provedor que falharam."),
+    "provider_retries_total": ("counter", "Novas tentativas de chamada ao provedor."),
+    "coalesced_total": ("counter", "Chamadas ao provedor evitadas por coalescência (scope=process|workers)."),
+    "ai_source_total": ("counter", "Origem da classificação (provedor, modelo local, fastpath, fallback)."),
+    "reply_source_total": ("counter", "Origem da resposta (provedor ou template local)."),
+    "intent_total": ("counter", "Intenção final."),
+    "doc_only_total": ("counter", "Arquivos sem texto extraível."),
+    "workers": ("gauge", "Workers que reportaram nos últimos METRICS_STALE_S."),
+    "in_flight": ("gauge", "Requisições em andamento."),
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def _sort_key(item):
+    (name, labels), _v = item
+    return name, tuple((k, float(v) if k == "le" else v) for k, v in labels)
+
+
+class _CountedExecutor:
+    """Executor com contador próprio de tarefas pendentes (na fila ou rodando): +1 no submit, -1 ao terminar."""
+    def __init__(self, pool: Executor):
+        self.pool = pool
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _add(self, n: int):
+        with self._lock:
+            self._pending += n
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        self._add(1)
+        try:
+            fut = self.pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._add(-1)
+            raise
+        fut.add_done_callback(lambda _f: self._add(-1))
+        return fut
+
+    def pending(self) -> int:
+        return self._pending
+
+
+class Metrics:
+    def __init__(self, db_path: str = METRICS_DB_PATH, enabled: bool = METRICS_ENABLED):
+        self.db_path = db_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid: Optional[int] = None
+        self._pending: dict[tuple[str, Labels], float] = {}  # ainda não gravado no SQLite
+        self._totals: dict[tuple[str, Labels], float] = {}   # acumulado deste processo
+        self._gauges: dict[str, Callable[[], float]] = {}
+        self._in_flight = 0
+
+    # ---------------- armazenamento ----------------
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        # uma conexão por thread e por processo (nunca herdar conexão através de fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metrics ("
+                " name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL,"
+                " PRIMARY KEY (name, labels))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metric_gauges ("
+                " pid INTEGER NOT NULL, name TEXT NOT NULL, value REAL NOT NULL,"
+                " updated_at REAL NOT NULL, PRIMARY KEY (pid, name))"
+            )
+        except Exception as e:
+            print(f"[metrics] sqlite indisponível ({self.db_path}), métricas só deste processo: {e}")
+            conn = None
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_process(self):
+        """Chamado com o lock: depois de um fork, zera o que veio do pai e sobe o flusher."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending = {}
+        self._totals = {}
+        self._in_flight = 0
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(METRICS_FLUSH_S)
+            self.flush()
+
+    # ---------------- registro ----------------
+    def _add(self, name: str, labels: Labels, value: float):
+        key = (name, labels)
+        self._pending[key] = self._pending.get(key, 0.0) + value
+        self._totals[key] = self._totals.get(key, 0.0) + value
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ensure_process()
+            self._add(name, _labels(labels), value)
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Histograma cumulativo (buckets em segundos), como o Prometheus espera."""
+        if not self.enabled:
+            return
+        base = _labels(labels)
+        with self._lock:
+            self._ensure_process()
+            for le in LATENCY_BUCKETS:
+                if seconds <= le:
+                    self._add(f"{name}_bucket", base + (("le", repr(le)),), 1)
+            self._add(f"{name}_bucket", base + (("le", "+Inf"),), 1)
+            self._add(f"{name}_sum", base, seconds)
+            self._add(f"{name}_count", base, 1)
+
+    def gauge(self, name: str, fn: Callable[[], float], help: str = ""):
+        """Medidor lido na hora (ex.: tamanho de fila); somado entre os workers."""
+        self._gauges[name] = fn
+        FAMILIES.setdefault(name, ("gauge", help))
+
+    def counted(self, pool: Executor, name: str, help: str = "") -> _CountedExecutor:
+        """Envolve `pool` com um contador explícito de pendentes e o expõe como o medidor `name`."""
+        counted = _CountedExecutor(pool)
+        self.gauge(name, counted.pending, help)
+        return counted
+
+    def request_started(self):
+        with self._lock:
+            self._ensure_process()
+            self._in_flight += 1
+
+    def request_finished(self):
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+    def _read_gauges(self) -> dict[str, float]:
+        out = {"in_flight": float(self._in_flight)}
+        for name, fn in list(self._gauges.items()):
+            try:
+                out[name] = float(fn())
+            except Exception:
+                pass
+        return out
+
+    # ---------------- gravação / leitura ----------------
+    def flush(self):
+        """Soma os deltas deste processo no SQLite e atualiza os medidores dele."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            pending, self._pending = self._pending, {}
+        conn = self._conn()
+        if conn is None:
+            return
+        now = time.time()
+        gauges = self._read_gauges()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?)"
+                    " ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+                    [(name, json.dumps(labels), v) for (name, labels), v in pending.items()],
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO metric_gauges (pid, name, value, updated_at) VALUES (?, ?, ?, ?)",
+                    [(os.getpid(), name, v, now) for name, v in gauges.items()],
+                )
+                # workers que sumiram há muito tempo
+                conn.execute("DELETE FROM metric_gauges WHERE updated_at < ?", (now - 10 * METRICS_STALE_S,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print(f"[metrics] falha ao gravar, tenta de novo no próximo ciclo: {e}")
+            with self._lock:
+                for key, v in pending.items():
+                    self._pending[key] = self._pending.get(key, 0.0) + v
+
+    def _series(self) -> dict[tuple[str, Labels], float]:
+        conn = self._conn()
+        if conn is None:
+            with self._lock:
+                return dict(self._totals)
+        rows = conn.execute("SELECT name, labels, value FROM metrics").fetchall()
+        return {(name, tuple(map(tuple, json.loads(labels)))): value for name, labels, value in rows}
+
+    def _live_gauges(self) -> dict[int, dict[str, float]]:
+        """pid -> medidores, só de workers vistos há pouco (o atual sempre com valores frescos)."""
+        out: dict[int, dict[str, float]] = {}
+        conn = self._conn()
+        if conn is not None:
+            try:
+                rows = conn.execute(
+                    "SELECT pid, name, value FROM metric_gauges WHERE updated_at >= ?",
+                    (time.time() - METRICS_STALE_S,),
+                ).fetchall()
+                for pid, name, value in rows:
+                    out.setdefault(pid, {})[name] = value
+            except Exception as e:
+                print(f"[metrics] erro lendo medidores: {e}")
+        with self._lock:
+            out[os.getpid()] = self._read_gauges()
+        return out
+
+    def render(self) -> str:
+        """Texto de exposição do Prometheus (versão 0.0.4)."""
+        if not self.enabled:
+            return ""
+        self.flush()
+        series = self._series()
+        live = self._live_gauges()
+        for name in sorted({n for g in live.values() for n in g}):
+            series[(name, ())] = sum(g.get(name, 0.0) for g in live.values())
+        series[("workers", ())] = len(live)
+
+        by_family: dict[str, list] = {}
+        for item in sorted(series.items(), key=_sort_key):
+            (name, _labels_), _v = item
+            family = name
+            for suffix in ("_bucket", "_sum", "_count"):
+                if name.endswith(suffix) and FAMILIES.get(name[: -len(suffix)], ("",))[0] == "histogram":
+                    family = name[: -len(suffix)]
+            if family in FAMILIES:
+                by_family.setdefault(family, []).append(item)
+
+        lines = []
+        for family, (kind, help_) in FAMILIES.items():
+            items = by_family.get(family)
+            if not items:
+                continue
+            lines.append(f"# HELP {PREFIX}{family} {help_}")
+            lines.append(f"# TYPE {PREFIX}{family} {kind}")
+            for (name, labels), v in items:
+                lbl = ",".join(f'{k}="{_escape(val)}"' for k, val in labels)
+                lines.append(f"{PREFIX}{name}{{{lbl}}} {_fmt(v)}" if lbl else f"{PREFIX}{name} {_fmt(v)}")
+        return "\n".join(lines) + "\n"
+
+    def saturation(self) -> dict:
+        """Medidores ao vivo para o /healthz: soma entre workers e o detalhe de cada um."""
+        if not self.enabled:
+            return {"enabled": False}
+        live = self._live_gauges()
+        names = sorted({n for g in live.values() for n in g})
+        return {
+            "workers": len(live),
+            "total": {n: sum(g.get(n, 0.0) for g in live.values()) for n in names},
+            "per_worker": {str(pid): g for pid, g in sorted(live.items())},
+        }
+
+
+metrics = Metrics()
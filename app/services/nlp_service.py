@@ -1,6 +1,11 @@
 import re
+from functools import lru_cache
+
 import nltk
 
+from .email_text import EmailLike, NormalizedEmail, normalized
+from .lang_id import language_identifier
+
 def ensure_nltk():
     try:
         nltk.data.find('tokenizers/punkt')
@@ -11,45 +16,80 @@ def ensure_nltk():
     except LookupError:
         nltk.download('stopwords', quiet=True)
 
-ensure_nltk()
+def detect_language(text: EmailLike) -> str:
+    """'pt' ou 'en' pelos perfis de n-gramas de caracteres (lang_id.py); na dúvida, 'pt'."""
+    return normalized(text).lang
 
-def detect_language(text: str) -> str:
-    t = (text or "").lower()
 
-    pt_markers = [
-        'por favor','obrigado','obrigada','bom dia','boa tarde','boa noite',
-        'anexo','andamento','protocolo','atualização','atualizacao',
-        'solicitação','solicitacao','dúvida','duvida','aguardo','retorno',
-        'segue em anexo','favor', 'previsão','previsao','chamado','incidente'
-    ]
-    en_markers = [
-        'please','thanks','thank you','hi','hello','attachment','status',
-        'ticket','update','request','question','regards','case'
-    ]
+def identify_language(text: EmailLike) -> tuple[str, float]:
+    """(idioma, confiança do idioma escolhido)."""
+    email = normalized(text)
+    return email.lang, email.lang_confidence
 
-    # conta ocorrências
-    pt_score = sum(t.count(m) for m in pt_markers)
-    en_score = sum(t.count(m) for m in en_markers)
 
-    technical = ['gpu','driver','firmware','windows','log','screenshot','error','bug','rtx','intel','nvidia']
-    tech_hits = sum(t.count(m) for m in technical)
+def detect_language_batch(texts: list[EmailLike]) -> list[str]:
+    """Vários textos numa matriz esparsa só; o resultado fica guardado em cada NormalizedEmail."""
+    emails = [t if isinstance(t, NormalizedEmail) else NormalizedEmail(t) for t in texts]
+    todo = [e for e in emails if not e.lang_known]
+    for email, (lang, conf) in zip(todo, language_identifier().identify_batch(todo)):
+        email.set_language(lang, conf)
+    return [e.lang for e in emails]
 
-    if en_score >= pt_score + 2 or (en_score == pt_score + 1 and tech_hits >= 2):
-        return 'en'
-    return 'pt'
+
+@lru_cache(maxsize=None)
+def _stopword_set(lang: str) -> frozenset:
+    """Carrega o corpus uma única vez por idioma; só tenta baixar se ainda não existir."""
+    from nltk.corpus import stopwords as sw
+    name = 'english' if lang == 'en' else 'portuguese'
+    try:
+        return frozenset(sw.words(name))
+    except LookupError:
+        ensure_nltk()
+    try:
+        return frozenset(sw.words(name))
+    except LookupError:
+        print(f"[nlp] stopwords '{name}' indisponíveis; seguindo sem remoção de stopwords")
+        return frozenset()
 
 
 def stopwords(lang='pt'):
-    from nltk.corpus import stopwords as sw
-    return set(sw.words('english' if lang=='en' else 'portuguese'))
-
-def preprocess(text: str, lang: str = 'pt') -> str:
-    t = (text or "").lower()
-    t = re.sub(r'(?m)^>.*$', ' ', t)                   # citações
-    t = re.sub(r'https?://\S+|www\.\S+', ' ', t)       # urls
-    t = re.sub(r'\b[\w\.-]+@[\w\.-]+\.\w+\b', ' ', t)  # emails
-    t = re.sub(r'\b\d{6,}\b', ' ', t)                  # numeros Longos
-    t = re.sub(r'[^\w\s]', ' ', t)                     # pontuação
-    t = re.sub(r'\s+', ' ', t)                         # espaços extras
-    toks = [w for w in t.split() if w not in stopwords(lang)]
-    return ' '.join(toks)
+    return _stopword_set('en' if lang == 'en' else 'pt')
+
+
+# limpeza em duas regexes combinadas (antes eram seis re.sub em sequência):
+# 1) citações | urls   2) emails | números longos | pontuação
+# A remoção de urls precisa vir antes: ela cria as fronteiras que a regex de emails enxerga.
+_CLEANUP_BLOCKS = re.compile(r'(?m)^>.*$|https?://\S+|www\.\S+')
+_CLEANUP_TOKENS = re.compile(r'\b[\w\.-]+@[\w\.-]+\.\w+\b|\b\d{6,}\b|[^\w\s]')
+_SEP = "\x1e"  # separador de registros no modo lote (é \s: a limpeza não o remove)
+
+
+def _drop_stopwords(t: str, lang: str) -> str:
+    sw = stopwords(lang)
+    return ' '.join(w for w in t.split() if w not in sw)
+
+
+def _cleanup(t: str) -> str:
+    return _CLEANUP_TOKENS.sub(' ', _CLEANUP_BLOCKS.sub(' ', t))
+
+
+def _lower(text: EmailLike) -> str:
+    return text.lower if isinstance(text, NormalizedEmail) else (text or "").lower()
+
+
+def preprocess(text: EmailLike, lang: str = 'pt') -> str:
+    return _drop_stopwords(_cleanup(_lower(text)), lang)
+
+
+def preprocess_batch(texts: list[EmailLike], langs: list[str] | str = 'pt') -> list[str]:
+    """
+    Pré-processa vários textos com uma única chamada de cada regex de limpeza
+    (textos concatenados com separador de registro e divididos de volta).
+    """
+    if isinstance(langs, str):
+        langs = [langs] * len(texts)
+    if not texts:
+        return []
+    joined = ("\n" + _SEP + "\n").join(_lower(t).replace(_SEP, " ") for t in texts)
+    parts = _cleanup(joined).split(_SEP)
+    return [_drop_stopwords(t, lang) for t, lang in zip(parts, langs)]
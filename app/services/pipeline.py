@@ -0,0 +1,620 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from .email_body import newest_message
+from .email_text import EmailLike, NormalizedEmail, normalized, scan
+from .metrics import metrics
+from .nlp_service import detect_language_batch, preprocess, preprocess_batch
+from .response_service import build_replies
+
+REQUIRE_AI = os.getenv("REQUIRE_AI", "true").lower() == "true"
+
+# resposta gerada só é descartada por idioma trocado acima desta confiança do identificador
+LANG_MISMATCH_MIN_CONF = float(os.getenv("LANG_MISMATCH_MIN_CONF", "0.8"))
+
+# pool compartilhado para as chamadas ao provedor no modo lote
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+_BATCH_POOL = metrics.counted(ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch"),
+                              "batch_queue", "Chamadas do lote no pool (na fila ou rodando).")
+
+# geração PT/EN em paralelo (e especulativa a partir do fastpath) num pool limitado
+PARALLEL_GEN = os.getenv("PARALLEL_GEN", "1") == "1"
+SPECULATIVE_GEN = os.getenv("SPECULATIVE_GEN", "1") == "1"
+# só especula com o fastpath seguro (0.55 + 0.12 por termo): palpite errado custa 1-2 gerações
+SPECULATIVE_MIN_CONF = float(os.getenv("SPECULATIVE_MIN_CONF", "0.75"))
+GEN_WORKERS = int(os.getenv("GEN_WORKERS", "8"))
+# /classify/stream: prazo total da geração; o que não chegou até lá sai do template local
+STREAM_GEN_TIMEOUT_S = float(os.getenv("STREAM_GEN_TIMEOUT_S", "60"))
+_GEN_POOL = metrics.counted(ThreadPoolExecutor(max_workers=GEN_WORKERS, thread_name_prefix="gen"),
+                            "gen_queue", "Gerações no pool (na fila ou rodando).")
+
+PRODUCTIVE = {"STATUS", "ATTACHMENT", "ACCESS", "ERROR", "SUPPORT"}
+
+
+def _record_metrics(debug: dict, status: int):
+    """Latências por etapa e contadores de origem/intenção a partir do debug da resposta."""
+    for stage, key in (("classify", "elapsed_ms_ai"), ("generate", "elapsed_ms_gen"), ("total", "elapsed_ms_total")):
+        if debug.get(key) is not None:
+            metrics.observe("stage_seconds", debug[key] / 1000, stage=stage)
+    metrics.inc("requests_total", status=status)
+    metrics.inc("ai_source_total", source=debug.get("ai_source") or "unknown")
+    if debug.get("reply_source"):
+        metrics.inc("reply_source_total", source=debug["reply_source"])
+    if debug.get("intent_final"):
+        metrics.inc("intent_total", intent=debug["intent_final"])
+    if debug.get("doc_only"):
+        metrics.inc("doc_only_total")
+
+
+def _pick_intent(*candidates):
+    """CLOSURE vence sempre; depois voto + precedência."""
+    PRIOR = [
+        "CLOSURE", "ERROR", "STATUS", "ATTACHMENT", "ACCESS",
+        "SUPPORT", "THANKS", "GREETINGS", "NON_MESSAGE", "OTHER",
+    ]
+    cands = [c for c in candidates if c]
+    if not cands:
+        return "OTHER"
+    if "CLOSURE" in cands:
+        return "CLOSURE"
+    counts = {k: cands.count(k) for k in set(cands)}
+    return sorted(
+        counts.items(),
+        key=lambda kv: (-kv[1], PRIOR.index(kv[0]) if kv[0] in PRIOR else 99)
+    )[0][0]
+
+
+def _lang_mismatch(target: str, txt: str) -> bool:
+    if not txt:
+        return False
+    reply = NormalizedEmail(txt)  # resposta gerada: um texto só desta checagem, fora do memo
+    h = reply.hits
+    if target == "en" and h.has("reply_pt"):
+        return True
+    if target == "pt" and h.has("reply_en"):
+        return True
+    try:
+        # identificador de n-gramas: só descarta com confiança (respostas curtas ficam na dúvida)
+        return reply.lang != target and reply.lang_confidence >= LANG_MISMATCH_MIN_CONF
+    except Exception:
+        return False
+
+
+def _final_intent(intent_api, intent_local, intent_cfg, raw_text: EmailLike, doc_only: bool) -> str:
+    # Se for documento puro (scan), força NON_MESSAGE/Improdutivo
+    if doc_only:
+        return "NON_MESSAGE"
+    intent = _pick_intent(intent_api, intent_local, intent_cfg)
+    if intent == "ATTACHMENT" and scan(raw_text).has("error_signs"):
+        intent = "ERROR"
+    return intent
+
+
+def _forced_label(intent: str) -> str:
+    return "Improdutivo" if intent == "NON_MESSAGE" else ("Produtivo" if intent in PRODUCTIVE else "Improdutivo")
+
+
+def _gen_one(raw_text: str, label: str, intent: str, lang: str, req_id: str,
+             stop: Optional[threading.Event] = None) -> tuple[str, int, Optional[str]]:
+    """
+    Gera a resposta num idioma; descarta se vier no idioma errado. Retorna (texto, ms, nível do cache).
+    Com `stop` (geração especulativa) a resposta vem em stream e para no próximo pedaço depois
+    do stop.set(): a conexão fecha e o provedor deixa de gerar (o HF, sem stream, só não começa).
+    """
+    from .ai_provider import ai_generate_reply, ai_stream_reply
+
+    start = time.perf_counter()
+    info = {}
+    if stop is None:
+        gen = (ai_generate_reply(raw_text, label, intent, lang, info=info) or "").strip()
+    else:
+        parts = []
+        if not stop.is_set():
+            pieces = ai_stream_reply(raw_text, label, intent, lang, info=info)
+            try:
+                for piece in pieces:
+                    if stop.is_set():
+                        break
+                    parts.append(piece)
+            finally:
+                pieces.close()
+        gen = "" if (info.get("error") or stop.is_set()) else "".join(parts).strip()
+    if gen and _lang_mismatch(lang, gen):
+        print(f"[{req_id}] descartando resposta {lang} por mismatch de idioma")
+        gen = ""
+    return gen, int((time.perf_counter() - start) * 1000), info.get("cache")
+
+
+def _submit_gen(raw_text: str, label: str, intent: str, order: list[str], req_id: str,
+                stop: Optional[threading.Event] = None) -> dict:
+    return {L: _GEN_POOL.submit(_gen_one, raw_text, label, intent, L, req_id, stop) for L in order}
+
+
+def _abandon(futs: Optional[dict], stop: Optional[threading.Event]):
+    """Palpite descartado: a que ainda está na fila sai do pool, a que já roda para no próximo pedaço."""
+    if stop is not None:
+        stop.set()
+    for fut in (futs or {}).values():
+        fut.cancel()
+
+
+# texto usado quando o arquivo não tem texto extraível (imagem/scan), para seguir o pipeline sem 400
+DOC_ONLY_TEXT = "(arquivo anexado sem texto extraível; provável imagem/scan)"
+
+
+def validate_text(raw_text: str, doc_only: bool = False) -> Optional[str]:
+    """Retorna a mensagem de erro (400) ou None se o texto pode seguir no pipeline."""
+    if not doc_only and (not raw_text or not raw_text.strip()):
+        return "Nenhum texto de email fornecido."
+    if not doc_only and len(raw_text.strip()) < 10:
+        return "Texto muito curto para classificar. Envie mais detalhes."
+    return None
+
+
+@dataclass
+class PreparedEmail:
+    """Etapas locais (CPU) já resolvidas para um email; as chamadas ao provedor vêm depois."""
+    raw_text: str           # texto recebido (prévia)
+    email: NormalizedEmail  # só a mensagem mais recente, normalizada uma vez; etapas locais e provedor leem daqui
+    lang: str
+    clean: str
+    preferred_lang: str
+    intent_local: str
+    intent_cfg: Optional[str]
+    doc_only: bool = False
+    cfg_conf: float = 0.0  # confiança do fastpath (intent_cfg)
+    local_pred: Optional[tuple] = None  # (label, proba, None) quando já calculado em lote
+    local_intent: Optional[tuple] = None  # (intent, proba, probs) do modelo de intenção, idem
+
+    @property
+    def chosen_lang(self) -> str:
+        return self.lang if self.preferred_lang == "auto" else self.preferred_lang
+
+
+def _norm_pref(preferred_lang: Optional[str]) -> str:
+    p = (preferred_lang or "").strip().lower()
+    return p if p in ("pt", "en", "auto") else "auto"
+
+
+def prepare(raw_text: EmailLike, preferred_lang: str = "auto", doc_only: bool = False,
+            lang: Optional[str] = None, clean: Optional[str] = None,
+            source: Optional[str] = None) -> PreparedEmail:
+    """
+    Texto -> corpo útil (sem histórico/assinatura/rodapé, ver email_body) -> etapas locais.
+    Modo lote: raw_text já é o NormalizedEmail do corpo, `source` o texto recebido e
+    lang/clean vêm pré-calculados.
+    """
+    from .ai_provider import fastpath_from_config
+    from .classifier_service import detect_intent
+
+    if isinstance(raw_text, NormalizedEmail):
+        email = raw_text
+    else:
+        source = raw_text or ""
+        email = normalized(newest_message(source))
+    if lang is None:
+        lang = email.lang                      # 'pt' ou 'en'
+    if clean is None:
+        clean = preprocess(email, lang=lang)
+    fp = fastpath_from_config(email) or {}
+    return PreparedEmail(
+        raw_text=email.raw if source is None else source,
+        email=email,
+        lang=lang,
+        clean=clean,
+        preferred_lang=_norm_pref(preferred_lang),
+        intent_local=detect_intent(email, lang),
+        intent_cfg=fp.get("intent"),
+        doc_only=doc_only,
+        cfg_conf=float(fp.get("confidence") or 0.0),
+    )
+
+
+def prepare_batch(items: list[tuple[str, str]]) -> list[PreparedEmail]:
+    """
+    Roda as etapas locais sobre o lote inteiro e faz UMA chamada de predict_proba
+    (matriz TF-IDF empilhada) para o fallback local, e outra para o modelo de intenção.
+    items: [(raw_text, preferred_lang), ...]
+    """
+    t_nlp = time.perf_counter()
+    # fora do memo por texto: num lote grande as primeiras entradas sairiam antes de serem usadas
+    emails = [NormalizedEmail(newest_message(text or "")) for text, _ in items]
+    langs = detect_language_batch(emails)  # idioma do lote inteiro numa matriz esparsa só
+    cleans = preprocess_batch(emails, langs)
+    prepared = [
+        prepare(email, pref, lang=lang, clean=clean, source=text or "")
+        for email, (text, pref), lang, clean in zip(emails, items, langs, cleans)
+    ]
+    if prepared:
+        from .classifier_service import classifier_service
+        cleans = [p.clean for p in prepared]
+        preds = classifier_service.predict_batch(cleans)
+        intents = classifier_service.predict_intent_batch(cleans)
+        for p, pred, intent_pred in zip(prepared, preds, intents):
+            p.local_pred = pred
+            p.local_intent = intent_pred
+        # etapas vetorizadas: cada email conta com a sua parte do tempo do lote
+        per_item = (time.perf_counter() - t_nlp) / len(prepared)
+        for _ in prepared:
+            metrics.observe("stage_seconds", per_item, stage="nlp")
+    return prepared
+
+
+def _speculative_key(prep: PreparedEmail) -> Optional[tuple[str, str]]:
+    """(categoria, intenção) para gerar PT/EN enquanto o provedor classifica; None se não vale a pena."""
+    from .ai_provider import remote_provider_enabled, replies_with_classify
+
+    # no modo oneshot as respostas já vêm com a classificação
+    if PARALLEL_GEN and SPECULATIVE_GEN and prep.intent_cfg and prep.cfg_conf >= SPECULATIVE_MIN_CONF \
+            and not prep.doc_only and remote_provider_enabled() and not replies_with_classify():
+        spec_intent = _final_intent(None, prep.intent_local, prep.intent_cfg, prep.email, prep.doc_only)
+        return _forced_label(spec_intent), spec_intent
+    return None
+
+
+def _gen_order(prep: PreparedEmail) -> list[str]:
+    chosen = prep.chosen_lang
+    return [chosen, "en" if chosen == "pt" else "pt"]
+
+
+def _drafted(ai_res, intent: str, gen: dict, req_id: str) -> dict:
+    """
+    Respostas que vieram na mesma chamada da classificação (OPENAI_MODE=oneshot).
+    Valem se a intenção final for a do provedor; idioma errado ou faltando é gerado à parte.
+    """
+    replies = ai_res.raw.get("replies") if ai_res.ok else None
+    if not replies or ai_res.intent != intent:
+        return {}
+    out = {}
+    for L, text in replies.items():
+        if _lang_mismatch(L, text):
+            print(f"[{req_id}] descartando resposta {L} do oneshot por mismatch de idioma")
+            continue
+        out[L] = text
+        gen["tiers"][f"reply_{L}"] = gen["tiers"].get("classify")
+    if out:
+        gen["mode"] = "oneshot"
+    return out
+
+
+def _unavailable(ai_res, ai_ms: int, req_id: str, t0: float) -> tuple[dict, int]:
+    """Provedor falhou e REQUIRE_AI=true: 502 com o debug mínimo."""
+    debug = {
+        "req_id": req_id,
+        "provider_env": os.getenv("PROVIDER", "").lower(),
+        "require_ai": True,
+        "ai_source": "unavailable",
+        "ai_error": ai_res.raw.get("error") if ai_res and ai_res.raw else "unknown",
+        "elapsed_ms_total": int((time.perf_counter() - t0) * 1000),
+        "elapsed_ms_ai": ai_ms,
+    }
+    print(f"[{req_id}] IA indisponível e REQUIRE_AI=true. Erro={debug['ai_error']}")
+    _record_metrics(debug, 502)
+    return {"ok": False, "error": "Falha ao chamar o provedor de IA. Verifique a chave/modelo.", "debug": debug}, 502
+
+
+def _decide(prep: PreparedEmail, ai_res) -> dict:
+    """Escolhe a fonte (provedor ou fallback local) e fecha categoria/intenção finais."""
+    from .classifier_service import classifier_service
+
+    label_api = label_local = intent_api = None
+    top_feats = []
+    proba = 0.0
+
+    if ai_res.ok:
+        label_api = ai_res.category
+        proba = ai_res.confidence or 0.0
+        intent_api = ai_res.intent
+        ai_source = ai_res.raw.get("source") or "api"
+    else:
+        # Fallback local permitido
+        if prep.local_pred:
+            label_local, proba, top_feats = prep.local_pred
+            if top_feats is None:  # o lote não calcula explicação; só este fallback precisa dela
+                top_feats = classifier_service.explain(prep.clean, label_local)
+        else:
+            label_local, proba, top_feats = classifier_service.predict(prep.clean, explain=True)
+        ai_source = "local_fallback"
+
+    intent = _final_intent(intent_api, prep.intent_local, prep.intent_cfg, prep.email, prep.doc_only)
+    forced_label = _forced_label(intent)
+
+    source_label = label_api if ai_res.ok else label_local
+    source_conf = float(proba or 0.0)
+    if source_label and source_label != forced_label:
+        source_conf = min(source_conf, 0.75)
+
+    return {
+        "label": forced_label,
+        "proba": source_conf,
+        "intent": intent,
+        "top_feats": top_feats,
+        "label_api": label_api,
+        "label_local": label_local,
+        "intent_api": intent_api,
+        "ai_source": ai_source,
+    }
+
+
+def _finish(prep: PreparedEmail, dec: dict, ai_res, ai_ms: int, gen: dict, gen_start: float,
+            req_id: str, t0: float) -> tuple[dict, int]:
+    """
+    Completa com templates locais o que a geração não trouxe, monta debug/métricas e o corpo.
+    gen: {"out": {lang: texto}, "ms": {lang: ms}, "tiers": {...}, "speculative": hit|miss|None}
+    """
+    raw_text, label, intent = prep.raw_text, dec["label"], dec["intent"]
+    out = gen["out"]
+    reply_pt = out.get("pt", "")
+    reply_en = out.get("en", "")
+    reply_source = (ai_res.raw.get("source") or "api") if (reply_pt or reply_en) else "local_template"
+
+    missing = [L for L, reply in (("pt", reply_pt), ("en", reply_en)) if not reply]
+    if missing:
+        local = build_replies(prep.email, category=label, intent=intent, langs=missing)
+        reply_pt = reply_pt or local["pt"].strip()
+        reply_en = reply_en or local["en"].strip()
+    gen_ms = int((time.perf_counter() - gen_start) * 1000)
+
+    # ------------------ Debug & retorno ------------------
+    debug = {
+        "req_id": req_id,
+        "provider_env": os.getenv("PROVIDER", "").lower(),
+        "require_ai": REQUIRE_AI,
+        "ai_source": dec["ai_source"],
+        "reply_source": reply_source,
+        "intent_api": dec["intent_api"],
+        "intent_local": prep.intent_local,
+        "intent_cfg": prep.intent_cfg,
+        "intent_final": intent,
+        "label_api": dec["label_api"],
+        "label_local": dec["label_local"],
+        "label_final": label,
+        "conf_final": float(dec["proba"]),
+        "elapsed_ms_ai": ai_ms,
+        "elapsed_ms_gen": gen_ms,
+        "elapsed_ms_gen_pt": gen["ms"].get("pt"),
+        "elapsed_ms_gen_en": gen["ms"].get("en"),
+        "gen_mode": gen.get("mode") or ("parallel" if PARALLEL_GEN else "sequential"),
+        "gen_speculative": gen["speculative"],
+        "cache": gen["tiers"],
+        "elapsed_ms_total": int((time.perf_counter() - t0) * 1000),
+        "doc_only": prep.doc_only,
+        "body_chars": len(prep.email.raw),
+        "raw_chars": len(prep.raw_text),
+    }
+    print(f"[{req_id}] DEBUG: {debug}")
+    _record_metrics(debug, 200)
+
+    return {
+        "ok": True,
+        "category": label,
+        "probability": round(float(dec["proba"] or 0.0), 3),
+        "reply_pt": reply_pt,
+        "reply_en": reply_en,
+        "reply_lang_default": prep.chosen_lang,
+        "explanation": {
+            "top_features": dec["top_feats"],
+            "language": prep.lang,
+            "language_confidence": round(prep.email.lang_confidence, 3),
+            "intent": intent
+        },
+        "debug": debug,
+        "text_preview": raw_text[:2000]
+    }, 200
+
+
+def run_classify(prep: PreparedEmail, req_id: Optional[str] = None, t0: Optional[float] = None) -> tuple[dict, int]:
+    """
+    Executa provedor (classificação + geração) sobre um email preparado.
+    Retorna (corpo_json, status_http), no mesmo formato de /classify.
+    """
+    from .ai_provider import ai_classify, AIClassifyResult
+
+    req_id = req_id or str(uuid.uuid4())[:8]
+    t0 = t0 if t0 is not None else time.perf_counter()
+    raw_text = prep.email.raw  # só a mensagem mais recente vai para o provedor
+    order = _gen_order(prep)
+
+    # ------------------ Geração especulativa ------------------
+    # Se o fastpath já aponta a intenção, começa a gerar PT/EN enquanto o provedor classifica.
+    spec_key = _speculative_key(prep)
+    spec_stop = threading.Event() if spec_key else None
+    spec_futs = _submit_gen(raw_text, spec_key[0], spec_key[1], order, req_id, spec_stop) if spec_key else None
+
+    # ------------------ IA (HF/OpenAI/Fastpath) ------------------
+    ai_start = time.perf_counter()
+    ai_res: AIClassifyResult = ai_classify(prep.email, clean=prep.clean, local_pred=prep.local_intent)
+    ai_ms = int((time.perf_counter() - ai_start) * 1000)
+
+    if not ai_res.ok and REQUIRE_AI:
+        _abandon(spec_futs, spec_stop)
+        return _unavailable(ai_res, ai_ms, req_id, t0)
+
+    dec = _decide(prep, ai_res)
+    label, intent = dec["label"], dec["intent"]
+
+    # ------------------ Geração da resposta ------------------
+    gen = {"out": {}, "ms": {}, "tiers": {"classify": ai_res.raw.get("cache")}, "speculative": None}
+    gen_start = time.perf_counter()
+    try:
+        if spec_futs is not None:
+            gen["speculative"] = "hit" if (ai_res.ok and (label, intent) == spec_key) else "miss"
+            if gen["speculative"] == "miss":
+                _abandon(spec_futs, spec_stop)
+                spec_futs = None
+
+        if ai_res.ok and not prep.doc_only:
+            out = _drafted(ai_res, intent, gen, req_id)
+            todo = [L for L in order if L not in out]
+            futs = spec_futs or (_submit_gen(raw_text, label, intent, todo, req_id) if PARALLEL_GEN else None)
+            for L in todo:
+                text, ms, tier = futs[L].result() if futs else _gen_one(raw_text, label, intent, L, req_id)
+                out[L] = text
+                gen["ms"][L] = ms
+                gen["tiers"][f"reply_{L}"] = tier
+            gen["out"] = out
+    except Exception as e:
+        print(f"[{req_id}] Erro ao gerar resposta via IA: {e}")
+
+    return _finish(prep, dec, ai_res, ai_ms, gen, gen_start, req_id, t0)
+
+
+def _stream_gen(raw_text: str, label: str, intent: str, lang: str, req_id: str,
+                out: queue.Queue, stop: threading.Event):
+    """Roda no _GEN_POOL: repassa os pedaços de um idioma para a fila e fecha com ("end", ...)."""
+    from .ai_provider import ai_stream_reply
+
+    start = time.perf_counter()
+    info = {}
+    text = ""
+    try:
+        parts = []
+        pieces = ai_stream_reply(raw_text, label, intent, lang, info=info)
+        try:
+            for piece in pieces:
+                if stop.is_set():
+                    break
+                parts.append(piece)
+                out.put(("token", lang, piece))
+        finally:
+            pieces.close()
+        text = "" if (info.get("error") or stop.is_set()) else "".join(parts).strip()
+        if text and _lang_mismatch(lang, text):
+            print(f"[{req_id}] descartando resposta {lang} por mismatch de idioma")
+            text = ""
+    except Exception as e:
+        print(f"[{req_id}] ERROR stream {lang}: {e}")
+        text = ""
+    finally:
+        # sempre fecha o idioma: stream_classify espera um "end" por geração
+        out.put(("end", lang, (text, int((time.perf_counter() - start) * 1000), info.get("cache"))))
+
+
+def _submit_stream(raw_text: str, label: str, intent: str, lang: str, req_id: str,
+                   out: queue.Queue, stop: threading.Event):
+    try:
+        _GEN_POOL.submit(_stream_gen, raw_text, label, intent, lang, req_id, out, stop)
+    except Exception as e:
+        print(f"[{req_id}] ERROR stream {lang}: {e}")
+        out.put(("end", lang, ("", 0, None)))
+
+
+def stream_classify(prep: PreparedEmail, req_id: Optional[str] = None,
+                    t0: Optional[float] = None) -> Iterator[tuple[str, dict]]:
+    """
+    Variante em streaming de run_classify (para /classify/stream). Gera (evento, dados):
+    - "classification": categoria, intenção e confiança assim que ai_classify responde
+    - "token": {"lang", "text"} — pedaços da resposta de cada idioma, como o provedor manda
+    - "done": o corpo completo de /classify (respostas finais, template onde a geração falhou)
+    - "error": corpo do 502 (com "status") quando o provedor falhou e REQUIRE_AI=true
+    Sem geração especulativa: aqui o que importa é o primeiro byte, não o último.
+    """
+    from .ai_provider import ai_classify
+
+    req_id = req_id or str(uuid.uuid4())[:8]
+    t0 = t0 if t0 is not None else time.perf_counter()
+    raw_text = prep.email.raw  # só a mensagem mais recente vai para o provedor
+
+    ai_start = time.perf_counter()
+    ai_res = ai_classify(prep.email, clean=prep.clean, local_pred=prep.local_intent)
+    ai_ms = int((time.perf_counter() - ai_start) * 1000)
+
+    if not ai_res.ok and REQUIRE_AI:
+        body, status = _unavailable(ai_res, ai_ms, req_id, t0)
+        yield "error", dict(body, status=status)
+        return
+
+    dec = _decide(prep, ai_res)
+    label, intent = dec["label"], dec["intent"]
+    first_ms = int((time.perf_counter() - t0) * 1000)
+    metrics.observe("stage_seconds", first_ms / 1000, stage="first_event")
+    yield "classification", {
+        "category": label,
+        "probability": round(float(dec["proba"] or 0.0), 3),
+        "intent": intent,
+        "language": prep.lang,
+        "language_confidence": round(prep.email.lang_confidence, 3),
+        "reply_lang_default": prep.chosen_lang,
+        "top_features": dec["top_feats"],
+    }
+
+    gen = {"out": {}, "ms": {}, "tiers": {"classify": ai_res.raw.get("cache")}, "speculative": None,
+           "mode": "stream"}
+    gen_start = time.perf_counter()
+    if ai_res.ok and not prep.doc_only:
+        for L, text in _drafted(ai_res, intent, gen, req_id).items():
+            gen["out"][L] = text
+            yield "token", {"lang": L, "text": text}
+        events: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        # paralelo: os dois idiomas chegam intercalados; sequencial: o idioma escolhido primeiro
+        waiting = [L for L in _gen_order(prep) if L not in gen["out"]]
+        running = waiting if PARALLEL_GEN else waiting[:1]
+        waiting = [L for L in waiting if L not in running]
+        for L in running:
+            _submit_stream(raw_text, label, intent, L, req_id, events, stop)
+        try:
+            pending = len(running) + len(waiting)
+            deadline = time.monotonic() + STREAM_GEN_TIMEOUT_S
+            while pending:
+                try:
+                    kind, lang, payload = events.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    print(f"[{req_id}] geração em streaming passou de {STREAM_GEN_TIMEOUT_S}s; faltantes saem do template")
+                    break
+                if kind == "token":
+                    yield "token", {"lang": lang, "text": payload}
+                    continue
+                text, ms, tier = payload
+                gen["out"][lang] = text
+                gen["ms"][lang] = ms
+                gen["tiers"][f"reply_{lang}"] = tier
+                pending -= 1
+                if waiting:
+                    _submit_stream(raw_text, label, intent, waiting.pop(0), req_id, events, stop)
+        finally:
+            stop.set()  # cliente desconectou: as gerações em curso param no próximo pedaço
+
+    body, status = _finish(prep, dec, ai_res, ai_ms, gen, gen_start, req_id, t0)
+    body["debug"]["elapsed_ms_first_event"] = first_ms
+    yield "done", body
+
+
+def classify_text(raw_text: str, preferred_lang: str = "auto", doc_only: bool = False,
+                  req_id: Optional[str] = None, t0: Optional[float] = None) -> tuple[dict, int]:
+    """Atalho: prepara + classifica um único email (sem camada Flask)."""
+    t0 = t0 if t0 is not None else time.perf_counter()
+    t_nlp = time.perf_counter()
+    prep = prepare(raw_text, preferred_lang, doc_only)
+    metrics.observe("stage_seconds", time.perf_counter() - t_nlp, stage="nlp")
+    return run_classify(prep, req_id=req_id, t0=t0)
+
+
+def classify_batch(items: list[tuple[str, str]]):
+    """
+    Classifica um lote: etapas locais vetorizadas e chamadas ao provedor em paralelo
+    (pool limitado por BATCH_WORKERS). Gera (indice, corpo, status) na ordem de conclusão.
+    """
+    from concurrent.futures import as_completed
+
+    prepared = prepare_batch(items)
+    futures = {_BATCH_POOL.submit(run_classify, p): i for i, p in enumerate(prepared)}
+    try:
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                body, status = fut.result()
+            except Exception as e:
+                body, status = {"ok": False, "error": str(e)}, 500
+                metrics.inc("requests_total", status=status)
+            yield i, body, status
+    finally:
+        # cliente desconectou no meio do stream: não segura o pool com itens pendentes
+        for fut in futures:
+            fut.cancel()
@@ -0,0 +1,151 @@
+"""
+Pipeline em modo assíncrono (entrada ASGI em asgi.py).
+
+Mesmas etapas e mesmo formato de resposta de pipeline.run_classify, mas:
+- chamadas ao provedor via ai_provider_async (sem uma thread presa por email)
+- trabalho de CPU (extração de PDF, NLP, modelos locais) num executor limitado (ASYNC_CPU_WORKERS)
+- geração PT/EN e lotes como tarefas do event loop; o teto é ASYNC_PROVIDER_CONCURRENCY
+"""
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Optional
+
+from .metrics import metrics
+from .pipeline import (
+    PARALLEL_GEN, REQUIRE_AI, PreparedEmail, _decide, _drafted, _finish, _gen_order, _lang_mismatch,
+    _speculative_key, _unavailable, prepare, prepare_batch,
+)
+
+ASYNC_CPU_WORKERS = int(os.getenv("ASYNC_CPU_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+_CPU_POOL = metrics.counted(ThreadPoolExecutor(max_workers=ASYNC_CPU_WORKERS, thread_name_prefix="cpu"),
+                            "cpu_queue", "Tarefas de CPU do modo assíncrono no pool (na fila ou rodando).")
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Roda `fn` no executor de CPU sem bloquear o event loop."""
+    # o que run_in_executor faria, mas pelo submit contado do pool
+    return await asyncio.wrap_future(_CPU_POOL.submit(partial(fn, *args, **kwargs)))
+
+
+def _prepare_one(raw_text: str, preferred_lang: str, doc_only: bool) -> PreparedEmail:
+    """prepare + predição do modelo de intenção (que o ai_classify usaria no event loop)."""
+    from .classifier_service import classifier_service
+
+    prep = prepare(raw_text, preferred_lang, doc_only)
+    prep.local_intent = classifier_service.predict_intent(prep.clean)
+    return prep
+
+
+async def _gen_one(raw_text: str, label: str, intent: str, lang: str, req_id: str) -> tuple[str, int, Optional[str]]:
+    from .ai_provider_async import ai_generate_reply
+
+    start = time.perf_counter()
+    info = {}
+    gen = (await ai_generate_reply(raw_text, label, intent, lang, info=info) or "").strip()
+    if gen and _lang_mismatch(lang, gen):
+        print(f"[{req_id}] descartando resposta {lang} por mismatch de idioma")
+        gen = ""
+    return gen, int((time.perf_counter() - start) * 1000), info.get("cache")
+
+
+def _spawn_gen(raw_text: str, label: str, intent: str, order: list[str], req_id: str) -> dict:
+    return {L: asyncio.ensure_future(_gen_one(raw_text, label, intent, L, req_id)) for L in order}
+
+
+def _cancel(tasks: Optional[dict]):
+    for task in (tasks or {}).values():
+        task.cancel()
+
+
+async def run_classify(prep: PreparedEmail, req_id: Optional[str] = None,
+                       t0: Optional[float] = None) -> tuple[dict, int]:
+    """Versão assíncrona de pipeline.run_classify (mesmo corpo/status)."""
+    from .ai_provider_async import ai_classify
+
+    req_id = req_id or str(uuid.uuid4())[:8]
+    t0 = t0 if t0 is not None else time.perf_counter()
+    raw_text = prep.email.raw  # só a mensagem mais recente vai para o provedor
+    order = _gen_order(prep)
+
+    spec_key = _speculative_key(prep)
+    spec_tasks = _spawn_gen(raw_text, spec_key[0], spec_key[1], order, req_id) if spec_key else None
+
+    try:
+        ai_start = time.perf_counter()
+        ai_res = await ai_classify(prep.email, clean=prep.clean, local_pred=prep.local_intent)
+        ai_ms = int((time.perf_counter() - ai_start) * 1000)
+
+        if not ai_res.ok and REQUIRE_AI:
+            _cancel(spec_tasks)
+            return _unavailable(ai_res, ai_ms, req_id, t0)
+
+        # fallback local pode chamar o classificador (CPU)
+        dec = await run_cpu(_decide, prep, ai_res) if not ai_res.ok else _decide(prep, ai_res)
+        label, intent = dec["label"], dec["intent"]
+
+        gen = {"out": {}, "ms": {}, "tiers": {"classify": ai_res.raw.get("cache")}, "speculative": None,
+               "mode": "async"}
+        gen_start = time.perf_counter()
+        try:
+            if spec_tasks is not None:
+                gen["speculative"] = "hit" if (ai_res.ok and (label, intent) == spec_key) else "miss"
+                if gen["speculative"] == "miss":
+                    _cancel(spec_tasks)
+                    spec_tasks = None
+
+            if ai_res.ok and not prep.doc_only:
+                out = _drafted(ai_res, intent, gen, req_id)
+                todo = [L for L in order if L not in out]
+                if spec_tasks is not None:
+                    tasks = spec_tasks
+                elif PARALLEL_GEN:
+                    tasks = _spawn_gen(raw_text, label, intent, todo, req_id)
+                else:
+                    tasks = None
+                for L in todo:
+                    text, ms, tier = await (tasks[L] if tasks else _gen_one(raw_text, label, intent, L, req_id))
+                    out[L] = text
+                    gen["ms"][L] = ms
+                    gen["tiers"][f"reply_{L}"] = tier
+                gen["out"] = out
+        except Exception as e:
+            print(f"[{req_id}] Erro ao gerar resposta via IA: {e}")
+
+        return await run_cpu(_finish, prep, dec, ai_res, ai_ms, gen, gen_start, req_id, t0)
+    except asyncio.CancelledError:
+        _cancel(spec_tasks)  # cliente desconectou: não gasta cota com o que ninguém vai ler
+        raise
+
+
+async def classify_text(raw_text: str, preferred_lang: str = "auto", doc_only: bool = False,
+                        req_id: Optional[str] = None, t0: Optional[float] = None) -> tuple[dict, int]:
+    t0 = t0 if t0 is not None else time.perf_counter()
+    t_nlp = time.perf_counter()
+    prep = await run_cpu(_prepare_one, raw_text, preferred_lang, doc_only)
+    metrics.observe("stage_seconds", time.perf_counter() - t_nlp, stage="nlp")
+    return await run_classify(prep, req_id=req_id, t0=t0)
+
+
+async def classify_batch(items: list[tuple[str, str]]) -> AsyncIterator[tuple[int, dict, int]]:
+    """Etapas locais vetorizadas no executor; provedor para todos ao mesmo tempo (ordem de conclusão)."""
+    prepared = await run_cpu(prepare_batch, items)
+
+    async def one(i: int, prep: PreparedEmail):
+        try:
+            body, status = await run_classify(prep)
+        except Exception as e:
+            body, status = {"ok": False, "error": str(e)}, 500
+            metrics.inc("requests_total", status=status)
+        return i, body, status
+
+    tasks = [asyncio.ensure_future(one(i, p)) for i, p in enumerate(prepared)]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,57 +1,224 @@
+"""
+Respostas locais (template), usadas quando o provedor não gera a resposta.
+
+Os textos ficam em reply_templates.json na raiz do projeto (REPLY_TEMPLATES_PATH; caminho
+relativo é resolvido a partir da raiz, não do cwd), no mesmo esquema do intents_config.json:
+recarregado quando o arquivo muda; JSON inválido mantém a versão anterior. Sem nenhuma versão
+válida (arquivo ausente ou quebrado já na primeira carga) vale a tabela mínima embutida
+(_BUILTIN): a resposta local é o último recurso e nunca pode falhar.
+Na carga cada template vira uma tabela (idioma, categoria, intenção, tem_anexo) -> trechos
+já separados; renderizar é só preencher os slots:
+- {ticket_ref}: o trecho "ticket" do template, vazio quando o email não cita ticket
+- {sign}: assinatura do idioma, com {when} (data/hora no formato do idioma)
+"""
+import json
+import os
 import re
+import threading
 from datetime import datetime
-import unicodedata
-
-SIGN_PT = "Atenciosamente,\nEquipe de Suporte"
-SIGN_EN = "Best regards,\nSupport Team"
-
-def _ticket(text: str):
-    m = re.search(r'(INC-\d+|\b\d{5,}\b)', text, flags=re.IGNORECASE)
-    return m.group(1) if m else None
-
-def _norm(s: str) -> str:
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    return (s or "").lower().strip()
-
-def _has_attachment(text: str) -> bool:
+from pathlib import Path
+from string import Formatter
+from typing import Iterable, Optional
+
+from .email_text import EmailLike, normalized, scan
+
+ANY_INTENT = "*"  # template da categoria para intenções sem entrada própria
+
+_ROOT = Path(__file__).resolve().parents[2]
+
+# só o genérico de cada categoria; usado enquanto reply_templates.json não carrega
+_BUILTIN = {
+    "when_format": {"pt": "%d/%m/%Y %H:%M", "en": "%Y-%m-%d %H:%M"},
+    "signature": {"pt": "Atenciosamente,\nEquipe de Suporte • {when}", "en": "Best regards,\nSupport Team • {when}"},
+    "templates": {
+        "pt": {
+            "Produtivo": {"*": {
+                "text": "Olá,\n\nObrigado pelo contato{ticket_ref}. Já estamos analisando sua solicitação e "
+                        "voltamos em breve com uma atualização.\n\n{sign}",
+                "ticket": " sobre o ticket {ticket}"}},
+            "Improdutivo": {"*": {
+                "text": "Olá,\n\nObrigado pela mensagem. No momento, não identificamos ações pendentes. "
+                        "Permanecemos à disposição para o que precisar.\n\n{sign}"}},
+        },
+        "en": {
+            "Produtivo": {"*": {
+                "text": "Hi,\n\nThanks for your message{ticket_ref}. We're analyzing it and will share an "
+                        "update soon.\n\n{sign}",
+                "ticket": " regarding ticket {ticket}"}},
+            "Improdutivo": {"*": {
+                "text": "Hi,\n\nThank you for your message. No action is required at this time. "
+                        "We're at your disposal if you need anything else.\n\n{sign}"}},
+        },
+    },
+}
+
+_SUBMINUTE_RE = re.compile(r'%[-#]?[SfXTcrs]')  # diretivas de strftime abaixo do minuto
+
+Parts = tuple[tuple[str, Optional[str]], ...]
+
+
+def _has_attachment(text: EmailLike) -> bool:
     """
     Heurística para detectar anexos / evidências já enviados (PT/EN).
     Evita falsos positivos em frases como "posso enviar logs" ou "vou mandar prints".
     """
-    t = _norm(text)
-
-    future_markers = [
-        "posso enviar", "vou enviar", "enviarei", "posso mandar", "mandarei",
-        "posso encaminhar", "encaminharei", "poderia enviar", "podem me enviar",
-        "podem enviar", "podem mandar", "poderiam enviar", "encaminharei",
-        "i can send", "i will send", "i’ll send", "will provide", "can provide"
-    ]
-    if any(m in t for m in future_markers):
+    h = scan(text)
+    if h.has("att_future"):
         return False
+    return h.has("att_strong") or h.has("att_generic")
+
+
+def _compile(text: str, slots: set[str], where: str) -> Parts:
+    """Separa literais e slots uma vez só; slot desconhecido é erro de configuração."""
+    parts = []
+    for literal, field, _spec, _conv in Formatter().parse(text):
+        if field is not None and field not in slots:
+            raise ValueError(f"slot {{{field}}} inválido em {where} (aceitos: {', '.join(sorted(slots))})")
+        parts.append((literal, field or None))
+    return tuple(parts)
+
+
+def _fill(parts: Parts, slots: dict) -> str:
+    return "".join([literal + slots[field] if field else literal for literal, field in parts])
+
+
+class _ReplyTemplates:
+    """reply_templates.json pré-compilado: tabela (idioma, categoria, intenção, tem_anexo) -> trechos."""
+    def __init__(self, path: str, mtime: Optional[int], cfg: dict):
+        self.path = path
+        self.mtime = mtime
+        self.default_lang = cfg.get("default_lang", "pt")
+        self.default_category = cfg.get("default_category", "Improdutivo")
+
+        self.when_format: dict[str, str] = {}
+        self.sign: dict[str, Parts] = {}
+        # (idioma, categoria, intenção, tem_anexo) -> (texto, trecho do ticket)
+        self.table: dict[tuple[str, str, str, bool], tuple[Parts, Parts]] = {}
+        # (idioma, categoria, intenção) cujo texto muda quando o email já traz anexos
+        self.att_keys: set[tuple[str, str, str]] = set()
+
+        for lang, cats in cfg["templates"].items():
+            self.when_format[lang] = cfg["when_format"][lang]
+            self.sign[lang] = _compile(cfg["signature"][lang], {"when"}, f"signature.{lang}")
+            for cat, intents in cats.items():
+                if ANY_INTENT not in intents:
+                    raise ValueError(f"templates.{lang}.{cat} sem a entrada '{ANY_INTENT}'")
+                for intent, entry in intents.items():
+                    where = f"templates.{lang}.{cat}.{intent}"
+                    ticket = _compile(entry.get("ticket", ""), {"ticket"}, f"{where}.ticket")
+                    text = _compile(entry["text"], {"ticket_ref", "sign"}, where)
+                    with_att = entry.get("with_attachment")
+                    self.table[(lang, cat, intent, False)] = (text, ticket)
+                    self.table[(lang, cat, intent, True)] = (
+                        (_compile(with_att, {"ticket_ref", "sign"}, f"{where}.with_attachment"), ticket)
+                        if with_att else (text, ticket)
+                    )
+                    if with_att:
+                        self.att_keys.add((lang, cat, intent))
+        if self.default_lang not in self.sign:
+            raise ValueError(f"default_lang '{self.default_lang}' sem templates")
+        # assinaturas prontas por minuto, se nenhum formato descer a segundos
+        self._per_minute = not any(_SUBMINUTE_RE.search(f) for f in self.when_format.values())
+        self._signs: tuple[tuple, dict[str, str]] = ((), {})  # (minuto, {idioma: assinatura})
+
+    def lang(self, lang: Optional[str]) -> str:
+        L = (lang or "").lower()[:2]
+        return L if L in self.sign else self.default_lang
+
+    def signatures(self, now: datetime) -> dict[str, str]:
+        """Assinaturas com a data/hora de `now`, por idioma."""
+        minute = (now.year, now.month, now.day, now.hour, now.minute)
+        cached_minute, signs = self._signs
+        if cached_minute != minute or not self._per_minute:
+            signs = {L: _fill(parts, {"when": now.strftime(self.when_format[L])}) for L, parts in self.sign.items()}
+            self._signs = (minute, signs)
+        return signs
+
+    def key(self, lang: str, category: str, intent: Optional[str]) -> tuple[str, str, str]:
+        it = (intent or "OTHER").upper()
+        if (lang, category, ANY_INTENT, False) not in self.table:
+            category = self.default_category
+        if (lang, category, it, False) not in self.table:
+            it = ANY_INTENT
+        return lang, category, it
+
+
+_TEMPLATES: Optional[_ReplyTemplates] = None
+_TEMPLATES_LOCK = threading.Lock()
+
+
+def _templates_path() -> str:
+    path = Path(os.getenv("REPLY_TEMPLATES_PATH") or "reply_templates.json")
+    return str(path if path.is_absolute() else _ROOT / path)
+
+
+def _reply_templates() -> _ReplyTemplates:
+    """Tabela atual; recompila (e troca atomicamente) quando o mtime do arquivo muda."""
+    global _TEMPLATES
+    path = _templates_path()
+    tpl = _TEMPLATES
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError as e:
+        if tpl is not None:
+            return tpl
+        with _TEMPLATES_LOCK:
+            if _TEMPLATES is None:
+                _TEMPLATES = _builtin(path, None, e)
+            return _TEMPLATES
+    if tpl is not None and tpl.path == path and tpl.mtime == mtime:
+        return tpl
+
+    with _TEMPLATES_LOCK:
+        tpl = _TEMPLATES
+        if tpl is None or tpl.path != path or tpl.mtime != mtime:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    cfg = json.load(f)
+                _TEMPLATES = _ReplyTemplates(path, mtime, cfg)
+                print(f"[templates] respostas locais carregadas de {path}")
+            except Exception as e:
+                # arquivo no meio de uma escrita/JSON inválido: segue com a tabela anterior
+                if tpl is None:
+                    _TEMPLATES = _builtin(path, mtime, e)
+                else:
+                    print(f"[templates] falha ao recarregar {path}, mantendo versão anterior: {e}")
+        return _TEMPLATES
+
+
+def _builtin(path: str, mtime: Optional[int], err: Exception) -> _ReplyTemplates:
+    """Tabela embutida no lugar do arquivo; volta a tentar o arquivo quando o mtime mudar."""
+    print(f"[templates] {path} indisponível ({err}); usando respostas embutidas")
+    return _ReplyTemplates(path, mtime, _BUILTIN)
+
+
+def render_replies(items: Iterable[tuple[EmailLike, str, str, Optional[str]]],
+                   now: Optional[datetime] = None) -> list[str]:
+    """
+    Lote de (raw_text, category, lang, intent) -> respostas, na mesma ordem.
+    Data/hora uma vez por lote (assinaturas uma vez por minuto); ticket e anexo vêm do
+    NormalizedEmail (anexo só quando o template escolhido depende dele).
+    """
+    tpl = _reply_templates()
+    signs = tpl.signatures(now or datetime.now())
+    out = []
+    for raw_text, category, lang, intent in items:
+        email = normalized(raw_text)
+        L = tpl.lang(lang)
+        key = tpl.key(L, category, intent)
+        has_att = key in tpl.att_keys and _has_attachment(email)
+
+        text, ticket = tpl.table[key + (has_att,)]
+        ticket_ref = _fill(ticket, {"ticket": email.ticket}) if email.ticket else ""
+        out.append(_fill(text, {"ticket_ref": ticket_ref, "sign": signs[L]}))
+    return out
 
-    strong_patterns = [
-        # PT
-        "em anexo", "segue em anexo", "segue anexo", "conforme anexo",
-        "anexei", "anexamos", "anexado", "vai anexo", "vão anexos",
-        "comprovante em anexo", "documento em anexo",
-        # EN
-        "attached", "attachment", "attachments", "please find attached",
-        "enclosed", "file attached", "files attached"
-    ]
-    if any(term in t for term in strong_patterns):
-        return True
-
-    generic_terms = [
-        "print", "prints", "captura de tela", "screenshot", "screenshots",
-        "arquivo", "arquivos", "comprovante", "comprovantes",
-        "log", "logs", "evidencia", "evidencias",
-        "evidence", "evidences"
-    ]
-    if any(term in t for term in generic_terms):
-        return True
-
-    return False
+
+def build_replies(raw_text: EmailLike, category: str, intent: Optional[str] = None,
+                  langs: Iterable[str] = ("pt", "en")) -> dict[str, str]:
+    """Mesma resposta em vários idiomas: {lang: texto}."""
+    langs = list(langs)
+    return dict(zip(langs, render_replies([(raw_text, category, L, intent) for L in langs])))
 
 
 def build_reply(raw_text: str, category: str, lang: str = 'pt', intent: str | None = None) -> str:
@@ -59,160 +226,4 @@ def build_reply(raw_text: str, category: str, lang: str = 'pt', intent: str | No
     Gera resposta automática alinhada à subintenção.
     intent: STATUS, ATTACHMENT, ACCESS, ERROR, CLOSURE, THANKS, GREETINGS, SUPPORT, NON_MESSAGE, OTHER
     """
-    t = (raw_text or "").strip()
-    ticket = _ticket(t)
-    when_pt = datetime.now().strftime('%d/%m/%Y %H:%M')
-    when_en = datetime.now().strftime('%Y-%m-%d %H:%M')
-    it = (intent or "OTHER").upper()
-    has_att = _has_attachment(t)
-
-    # ----------------- EN -----------------
-    if (lang or '').lower().startswith('en'):
-        sign = f"{SIGN_EN} • {when_en}"
-
-        if category == 'Produtivo':
-            if it == "SUPPORT":
-                return (
-                    f"Hi,\n\n"
-                    f"We understand your technical support request. Our team is already reviewing it and will get back to you shortly with further guidance.\n\n"
-                    f"{sign}"
-                )
-            if it == "STATUS":
-                return (
-                    f"Hi,\n\n"
-                    f"Thanks for reaching out. We're checking the current status"
-                    f"{f' for ticket {ticket}' if ticket else ''} and will get back to you shortly.\n"
-                    f"If possible, please share recent logs/screenshots or the ticket number to speed up the analysis.\n\n"
-                    f"{sign}"
-                )
-            if it == "ATTACHMENT":
-                return (
-                    f"Hi,\n\n"
-                    f"We've received your file"
-                    f"{f' related to ticket {ticket}' if ticket else ''}. We'll validate it and reply with next steps.\n\n"
-                    f"{sign}"
-                )
-            if it == "ACCESS":
-                return (
-                    f"Hi,\n\n"
-                    f"Sorry about the access issue. Please confirm your login e-mail and whether you received a lockout message.\n"
-                    f"We can proceed with an unlock or password reset as needed.\n\n"
-                    f"{sign}"
-                )
-            if it == "ERROR":
-                if has_att:
-                    return (
-                        f"Hi,\n\n"
-                        f"Sorry about the issue"
-                        f"{f' on ticket {ticket}' if ticket else ''}. We confirm we've received the attachments and will analyze them along with your report. "
-                        f"We'll get back to you shortly with guidance.\n\n"
-                        f"{sign}"
-                    )
-                return (
-                    f"Hi,\n\n"
-                    f"Sorry about the issue"
-                    f"{f' on ticket {ticket}' if ticket else ''}. To investigate quickly, please share steps to reproduce, "
-                    f"approximate time of occurrence, and any logs/screenshots you may have.\n\n"
-                    f"{sign}"
-                )
-
-            return (
-                f"Hi,\n\n"
-                f"Thanks for your message"
-                f"{f' regarding ticket {ticket}' if ticket else ''}. We're analyzing it and will share an update soon.\n\n"
-                f"{sign}"
-            )
-
-        # Improdutivo
-        if it == "CLOSURE":
-            return f"Hi,\n\nThanks for the update! We'll close the ticket here. If you need anything else, just let us know.\n\n{sign}"
-        if it == "THANKS":
-            return f"Hi,\n\nYou're welcome! We're here if you need anything else.\n\n{sign}"
-        if it == "GREETINGS":
-            return f"Hi,\n\nThanks for the message and kind wishes! (No action required.)\n\n{sign}"
-        if it == "NON_MESSAGE":
-            return (
-                f"Hi,\n\n"
-                f"Thanks for sending your document. This mailbox is dedicated to support requests, "
-                f"so no action is required at this time. If you need assistance, please describe the request here.\n\n"
-                f"{sign}"
-            )
-        return (
-            f"Hi,\n\nThank you for your message. No action is required at this time. "
-            f"We're at your disposal if you need anything else.\n\n{sign}"
-        )
-
-    # ----------------- PT (padrão) -----------------
-    sign = f"{SIGN_PT} • {when_pt}"
-
-    if category == 'Produtivo':
-        if it == "SUPPORT":
-            return (
-                f"Olá,\n\n"
-                f"Entendemos a sua solicitação de suporte técnico. Já estamos analisando e retornaremos em breve com orientações.\n\n"
-                f"{sign}"
-            )
-        if it == "STATUS":
-            return (
-                f"Olá,\n\n"
-                f"Obrigado pela mensagem. Estamos verificando o status"
-                f"{f' do ticket/protocolo {ticket}' if ticket else ''} e retornaremos em breve com uma atualização.\n"
-                f"Se possível, encaminhe logs/prints recentes ou o número do ticket para agilizar a análise.\n\n"
-                f"{sign}"
-            )
-        if it == "ATTACHMENT":
-            return (
-                f"Olá,\n\n"
-                f"Recebemos o arquivo"
-                f"{f' referente ao ticket {ticket}' if ticket else ''}. Vamos validar o material e retornaremos com os próximos passos.\n\n"
-                f"{sign}"
-            )
-        if it == "ACCESS":
-            return (
-                f"Olá,\n\n"
-                f"Lamentamos o transtorno com o acesso. Para seguirmos com agilidade, confirme o e-mail de login e se houve mensagem de bloqueio.\n"
-                f"Podemos realizar o desbloqueio ou o reset de senha, conforme necessário.\n\n"
-                f"{sign}"
-            )
-        if it == "ERROR":
-            if has_att:
-                return (
-                    f"Olá,\n\n"
-                    f"Lamentamos o ocorrido"
-                    f"{f' no ticket {ticket}' if ticket else ''}. Confirmamos o recebimento dos anexos e vamos analisá-los em conjunto com o seu relato. "
-                    f"Retornaremos em breve com as orientações.\n\n"
-                    f"{sign}"
-                )
-            return (
-                f"Olá,\n\n"
-                f"Lamentamos o ocorrido"
-                f"{f' no ticket {ticket}' if ticket else ''}. Para darmos sequência com agilidade, poderia nos enviar os passos para reproduzir, "
-                f"o horário aproximado da ocorrência e eventuais logs/prints?\n\n"
-                f"{sign}"
-            )
-
-        return (
-            f"Olá,\n\n"
-            f"Obrigado pelo contato"
-            f"{f' sobre o ticket {ticket}' if ticket else ''}. Já estamos analisando sua solicitação e voltamos em breve com uma atualização.\n\n"
-            f"{sign}"
-        )
-
-    # Improdutivo
-    if it == "CLOSURE":
-        return f"Olá,\n\nAgradecemos o retorno! Vamos encerrar o chamado por aqui. Caso precise novamente, é só nos acionar.\n\n{sign}"
-    if it == "THANKS":
-        return f"Olá,\n\nNós que agradecemos! Ficamos à disposição para qualquer outra necessidade.\n\n{sign}"
-    if it == "GREETINGS":
-        return f"Olá,\n\nObrigado pela mensagem e pelos votos! (Não é necessário retorno.)\n\n{sign}"
-    if it == "NON_MESSAGE":
-        return (
-            f"Olá,\n\n"
-            f"Obrigado pelo envio do documento. Este canal é voltado a solicitações de suporte/atendimento; "
-            f"no momento não identificamos ações pendentes. Se precisar de algo, descreva a demanda por aqui.\n\n"
-            f"{sign}"
-        )
-    return (
-        f"Olá,\n\nObrigado pela mensagem. No momento, não identificamos ações pendentes. "
-        f"Permanecemos à disposição para o que precisar.\n\n{sign}"
-    )
+    return render_replies([(raw_text, category, lang, intent)])[0]
@@ -0,0 +1,299 @@
+"""
+Coalescência de chamadas idênticas em andamento ("singleflight").
+
+Chamadores simultâneos com a mesma chave (a do cache de resultados: hash do texto
+normalizado + provedor + modelo) esperam uma única chamada ao provedor e dividem o resultado:
+- no mesmo processo: um evento por chave; quem chega depois espera o líder e recebe uma cópia
+- entre workers do gunicorn: uma tabela de locks no SQLite do cache; quem não pegou o lock
+  espera o resultado aparecer no cache de resultados (o líder grava antes de soltar o lock)
+Se o líder falhar, demorar mais que SINGLEFLIGHT_WAIT_S ou o lock expirar (worker morto),
+quem esperava faz a própria chamada. Sem SQLite, só há coalescência dentro do processo.
+
+    flight = singleflight.begin(key, lookup)
+    if flight.shared:
+        return flight.value          # resultado de outra chamada
+    with flight:
+        value = chamar_provedor()    # e gravar no cache
+        flight.finish(value)
+"""
+import asyncio
+import copy
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from .cache import CACHE_DB_PATH, CACHE_ENABLED
+from .metrics import metrics
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+SINGLEFLIGHT_WAIT_S = float(os.getenv("SINGLEFLIGHT_WAIT_S", "30"))
+SINGLEFLIGHT_POLL_S = float(os.getenv("SINGLEFLIGHT_POLL_S", "0.05"))
+SINGLEFLIGHT_DB_PATH = os.getenv("SINGLEFLIGHT_DB_PATH", CACHE_DB_PATH)
+
+INFLIGHT = "inflight"  # nível de "cache" no debug para quem recebeu o resultado de outra chamada
+
+
+class _Call:
+    __slots__ = ("event", "value", "ok")
+
+    def __init__(self, event):
+        self.event = event
+        self.value = None
+        self.ok = False
+
+
+class Flight:
+    """
+    Participação numa chave. shared=True: value é o resultado de outra chamada.
+    Senão este chamador chama o provedor e publica com finish(); sair do `with` sem
+    finish (exceção, cliente desistiu) libera quem espera para seguir por conta própria.
+    """
+
+    def __init__(self, group: "SingleFlight", key: str, call: Optional[_Call] = None,
+                 locked: bool = False, shared: bool = False, value: Any = None):
+        self.group = group
+        self.key = key
+        self.shared = shared
+        self.value = value
+        self._call = call
+        self._locked = locked
+        self._done = shared
+
+    def finish(self, value: Any = None, ok: bool = True):
+        if self._done:
+            return
+        self._done = True
+        if self._locked:
+            self.group._unlock(self.key)
+        if self._call is not None:
+            self.group._resolve(self.key, self._call, value, ok)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(ok=False)
+        return False
+
+
+class _AsyncFlight(Flight):
+    async def afinish(self, value: Any = None, ok: bool = True):
+        if self._done:
+            return
+        self._done = True
+        if self._locked:
+            await asyncio.to_thread(self.group._unlock, self.key)
+        if self._call is not None:
+            self.group._aresolve(self.key, self._call, value, ok)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.afinish(ok=False)
+        return False
+
+
+class SingleFlight:
+    def __init__(self, db_path: str = SINGLEFLIGHT_DB_PATH, enabled: bool = SINGLEFLIGHT_ENABLED,
+                 wait_s: float = SINGLEFLIGHT_WAIT_S, poll_s: float = SINGLEFLIGHT_POLL_S,
+                 cross_process: bool = CACHE_ENABLED):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.wait_s = wait_s
+        self.poll_s = poll_s
+        # entre workers o resultado chega pelo cache de resultados: sem cache, só no processo
+        self.cross_process = cross_process
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self._acalls: dict[tuple[int, str], _Call] = {}
+        self._local = threading.local()
+
+    # ---------------- locks entre workers (SQLite) ----------------
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        # uma conexão por thread e por processo (nunca herdar conexão através de fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inflight ("
+                " key TEXT PRIMARY KEY, pid INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+        except Exception as e:
+            print(f"[singleflight] sqlite indisponível ({self.db_path}), só coalescência no processo: {e}")
+            conn = None
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _try_lock(self, key: str) -> Optional[bool]:
+        """True = lock é nosso; False = outro worker está chamando; None = sem SQLite."""
+        conn = self._conn()
+        if conn is None:
+            return None
+        now = time.time()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM inflight WHERE key = ? AND expires_at < ?", (key, now))
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO inflight (key, pid, expires_at) VALUES (?, ?, ?)",
+                    (key, os.getpid(), now + self.wait_s),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print(f"[singleflight] erro no lock, seguindo sem coordenação: {e}")
+            return None
+        return cur.rowcount == 1
+
+    def _held(self, key: str) -> bool:
+        conn = self._conn()
+        if conn is None:
+            return False
+        try:
+            row = conn.execute("SELECT expires_at FROM inflight WHERE key = ?", (key,)).fetchone()
+        except Exception:
+            return False
+        return bool(row) and row[0] >= time.time()
+
+    def _unlock(self, key: str):
+        conn = self._conn()
+        if conn is None:
+            return
+        try:
+            conn.execute("DELETE FROM inflight WHERE key = ? AND pid = ?", (key, os.getpid()))
+        except Exception as e:
+            print(f"[singleflight] erro ao soltar lock (expira sozinho): {e}")
+
+    def _remote_poll(self, key: str, lookup: Callable[[], Any]) -> tuple[bool, Any]:
+        """(terminou?, valor): valor publicado, ou o lock sumiu/expirou sem resultado."""
+        value = lookup()
+        if value is not None:
+            return True, value
+        if not self._held(key):
+            return True, lookup()
+        return False, None
+
+    # ---------------- dentro do processo ----------------
+    def _resolve(self, key: str, call: _Call, value: Any, ok: bool):
+        # cópia: o líder ainda vai mexer no próprio resultado (ex.: raw["cache"])
+        call.value = copy.deepcopy(value) if ok else None
+        call.ok = ok
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.event.set()
+
+    def _aresolve(self, key: str, call: _Call, value: Any, ok: bool):
+        call.value = copy.deepcopy(value) if ok else None
+        call.ok = ok
+        loop_key = (id(asyncio.get_running_loop()), key)
+        if self._acalls.get(loop_key) is call:
+            del self._acalls[loop_key]
+        call.event.set()
+
+    # ---------------- API ----------------
+    def begin(self, key: str, lookup: Optional[Callable[[], Any]] = None) -> Flight:
+        """
+        Entra na chave. lookup() lê o resultado que outro worker publicou (None = ainda não há);
+        sem lookup, só coalesce dentro do processo.
+        """
+        if not self.enabled:
+            return Flight(self, key)
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(threading.Event())
+
+        if not leader:
+            if call.event.wait(self.wait_s) and call.ok:
+                metrics.inc("coalesced_total", scope="process")
+                return Flight(self, key, shared=True, value=copy.deepcopy(call.value))
+            return Flight(self, key)  # líder falhou ou demorou: segue sozinho
+
+        flight = Flight(self, key, call)
+        if self.cross_process and lookup is not None:
+            locked = self._try_lock(key)
+            if locked is False:
+                deadline = time.monotonic() + self.wait_s
+                done, value = self._remote_poll(key, lookup)
+                while not done and time.monotonic() < deadline:
+                    time.sleep(self.poll_s)
+                    done, value = self._remote_poll(key, lookup)
+                if value is not None:
+                    metrics.inc("coalesced_total", scope="workers")
+                    flight.finish(value)  # repassa também a quem esperava neste processo
+                    return Flight(self, key, shared=True, value=value)
+            flight._locked = bool(locked)
+        return flight
+
+    async def abegin(self, key: str, lookup: Optional[Callable[[], Any]] = None) -> _AsyncFlight:
+        """begin() para o modo assíncrono: espera no event loop; SQLite em thread."""
+        if not self.enabled:
+            return _AsyncFlight(self, key)
+
+        loop_key = (id(asyncio.get_running_loop()), key)
+        call = self._acalls.get(loop_key)
+        leader = call is None
+        if leader:
+            call = self._acalls[loop_key] = _Call(asyncio.Event())
+
+        if not leader:
+            try:
+                await asyncio.wait_for(call.event.wait(), self.wait_s)
+            except asyncio.TimeoutError:
+                return _AsyncFlight(self, key)
+            if call.ok:
+                metrics.inc("coalesced_total", scope="process")
+                return _AsyncFlight(self, key, shared=True, value=copy.deepcopy(call.value))
+            return _AsyncFlight(self, key)
+
+        flight = _AsyncFlight(self, key, call)
+        if self.cross_process and lookup is not None:
+            locked = await asyncio.to_thread(self._try_lock, key)
+            if locked is False:
+                deadline = time.monotonic() + self.wait_s
+                done, value = await asyncio.to_thread(self._remote_poll, key, lookup)
+                while not done and time.monotonic() < deadline:
+                    await asyncio.sleep(self.poll_s)
+                    done, value = await asyncio.to_thread(self._remote_poll, key, lookup)
+                if value is not None:
+                    metrics.inc("coalesced_total", scope="workers")
+                    await flight.afinish(value)
+                    return _AsyncFlight(self, key, shared=True, value=value)
+            flight._locked = bool(locked)
+        return flight
+
+    def do(self, key: str, fn: Callable[[], Any], lookup: Optional[Callable[[], Any]] = None) -> tuple[Any, bool]:
+        """Atalho: (valor, compartilhado?) — fn() só roda no líder."""
+        flight = self.begin(key, lookup)
+        if flight.shared:
+            return flight.value, True
+        with flight:
+            value = fn()
+            flight.finish(value)
+        return value, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]],
+                  lookup: Optional[Callable[[], Any]] = None) -> tuple[Any, bool]:
+        flight = await self.abegin(key, lookup)
+        if flight.shared:
+            return flight.value, True
+        async with flight:
+            value = await fn()
+            await flight.afinish(value)
+        return value, False
+
+
+singleflight = SingleFlight()
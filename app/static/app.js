@@ -214,12 +214,50 @@ function ensureHasValidInput() {
   return hasFile || hasTextMin;
 }
 
-async function postWithTimeout(url, body, timeoutMs) {
+// POST com resposta em Server-Sent Events (/classify/stream).
+// O timeout vale entre pedaços (ociosidade), não para a resposta inteira:
+// enquanto os tokens chegam, a requisição segue viva.
+// Se o servidor responder JSON (ex.: 400 de validação), devolve { res, data }.
+async function postStream(url, body, idleMs, onEvent) {
   const ctrl = new AbortController();
-  const id = setTimeout(() => ctrl.abort('timeout'), timeoutMs);
+  let id = setTimeout(() => ctrl.abort(), idleMs);
+  const touch = () => {
+    clearTimeout(id);
+    id = setTimeout(() => ctrl.abort(), idleMs);
+  };
   try {
     const res = await fetch(url, { method: 'POST', body, signal: ctrl.signal });
-    return res;
+    const type = res.headers.get('Content-Type') || '';
+    if (!type.includes('text/event-stream') || !res.body) {
+      let data = null;
+      try {
+        data = await res.json();
+      } catch {}
+      return { res, data };
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      touch();
+      buf += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buf.indexOf('\n\n')) >= 0) {
+        const block = buf.slice(0, sep);
+        buf = buf.slice(sep + 2);
+        let event = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+    return { res, data: null };
   } finally {
     clearTimeout(id);
   }
@@ -311,6 +349,107 @@ clearBtn.addEventListener('click', () => {
   lastResult = null;
 });
 
+// ===================== RESULTADO ==========================
+const intentMap = {
+  STATUS: 'Status',
+  ATTACHMENT: 'Anexo',
+  ACCESS: 'Acesso',
+  ERROR: 'Erro',
+  CLOSURE: 'Encerramento',
+  THANKS: 'Agradecimento',
+  GREETINGS: 'Saudação',
+  SUPPORT: 'Suporte',
+  NON_MESSAGE: 'Documento',
+  OTHER: 'Geral',
+};
+const intentClassMap = {
+  STATUS: 'pill pill-status ml-2',
+  ATTACHMENT: 'pill pill-attachment ml-2',
+  ACCESS: 'pill pill-access ml-2',
+  ERROR: 'pill pill-error ml-2',
+  CLOSURE: 'pill pill-closure ml-2',
+  THANKS: 'pill pill-thanks ml-2',
+  GREETINGS: 'pill pill-greetings ml-2',
+  SUPPORT: 'pill pill-support ml-2',
+  NON_MESSAGE: 'pill pill-nonmessage ml-2',
+  OTHER: 'pill pill-other ml-2',
+};
+
+// idioma padrão: respeita preferido salvo, senão o que veio do backend
+function pickDefaultLang(backendDefault) {
+  const preferred = localStorage.getItem('replyLang');
+  return (preferred || backendDefault || 'pt').toLowerCase();
+}
+
+// Primeiro evento do stream (ou parte do resultado final): chip, subintenção, confiança, explicação
+function renderClassification(c) {
+  // Mostra o cartão de resultado
+  resultEmpty.classList.add('hidden');
+  result.classList.remove('hidden');
+
+  // Confiança + badge de categoria
+  prob.textContent = (c.probability ?? 0).toFixed(3);
+  setBadge(c.category);
+
+  // Pill de subintenção ao lado do chip
+  const intent = c.intent || 'OTHER';
+  const intentPill = document.createElement('span');
+  intentPill.className = intentClassMap[intent] || 'pill pill-other ml-2';
+  intentPill.textContent = intentMap[intent] || 'Geral';
+  badge.appendChild(intentPill);
+
+  // Explicação
+  const feats = c.top_features || [];
+  const langDetected = (c.language || 'pt').toUpperCase();
+  const intentLabel = intentMap[intent] || 'Geral';
+  explain.innerHTML = `
+    <div><strong>Idioma detectado:</strong> ${langDetected}</div>
+    <div class="mt-1"><strong>Subintenção:</strong> ${intentLabel}</div>
+    <div class="mt-2"><strong>Principais sinais:</strong> <code>${
+      feats.length ? feats.join(', ') : 'Nenhum termo de destaque'
+    }</code></div>
+  `;
+}
+
+// Pedaço de resposta chegando: acumula e mostra se for o idioma em exibição
+function appendToken(lang, text) {
+  if (lang === 'en') replyEN += text;
+  else replyPT += text;
+  if (lang === currentReplyLang) {
+    reply.value = lang === 'en' ? replyEN : replyPT;
+    reply.scrollTop = reply.scrollHeight;
+  }
+}
+
+// Resultado completo (mesmo corpo de /classify): substitui o que veio em pedaços
+function renderResult(data) {
+  lastResult = data;
+  renderClassification({
+    category: data.category,
+    probability: data.probability,
+    intent: data.explanation?.intent,
+    language: data.explanation?.language,
+    top_features: data.explanation?.top_features,
+  });
+
+  // Replies
+  replyPT = data.reply_pt || '';
+  replyEN = data.reply_en || '';
+
+  if (pickDefaultLang(data.reply_lang_default) === 'en' && replyEN) {
+    currentReplyLang = 'en';
+    reply.value = replyEN;
+  } else {
+    currentReplyLang = 'pt';
+    reply.value = replyPT || replyEN || '';
+  }
+  localStorage.setItem('replyLang', currentReplyLang);
+  updateLangButtons();
+
+  // Prévia
+  preview.innerText = data.text_preview || '';
+}
+
 // ===================== SUBMIT =============================
 form.addEventListener('submit', async e => {
   e.preventDefault();
@@ -334,98 +473,40 @@ form.addEventListener('submit', async e => {
   setLoading(true);
   try {
     const fd = new FormData(form);
-    // timeout no fetch para evitar requests pendurados
-    const res = await postWithTimeout('/classify', fd, REQUEST_TIMEOUT_MS);
-    let data;
-    try {
-      data = await res.json();
-    } catch {
-      throw new Error('Resposta inválida do servidor.');
-    }
+    let failed = null;
+    // classificação chega primeiro; as respostas PT/EN vêm token a token
+    const { res, data } = await postStream(
+      '/classify/stream',
+      fd,
+      REQUEST_TIMEOUT_MS,
+      (event, payload) => {
+        if (event === 'classification') {
+          renderClassification(payload);
+          currentReplyLang =
+            pickDefaultLang(payload.reply_lang_default) === 'en' ? 'en' : 'pt';
+          updateLangButtons();
+        } else if (event === 'token') {
+          appendToken(payload.lang, payload.text);
+        } else if (event === 'done') {
+          renderResult(payload);
+        } else if (event === 'error') {
+          failed = payload;
+        }
+      },
+    );
 
-    if (!res.ok || !data.ok) {
-      alert((data && data.error) || 'Erro ao processar.');
+    if (data && (!res.ok || !data.ok)) {
+      alert(data.error || 'Erro ao processar.');
       return;
     }
-
-    lastResult = data;
-
-    // Mostra o cartão de resultado
-    resultEmpty.classList.add('hidden');
-    result.classList.remove('hidden');
-
-    // Confiança + badge de categoria
-    prob.textContent = (data.probability ?? 0).toFixed(3);
-    setBadge(data.category);
-
-    // Pill de subintenção ao lado do chip
-    const intent = (data.explanation && data.explanation.intent) || 'OTHER';
-    const intentMap = {
-      STATUS: 'Status',
-      ATTACHMENT: 'Anexo',
-      ACCESS: 'Acesso',
-      ERROR: 'Erro',
-      CLOSURE: 'Encerramento',
-      THANKS: 'Agradecimento',
-      GREETINGS: 'Saudação',
-      SUPPORT: 'Suporte',
-      NON_MESSAGE: 'Documento',
-      OTHER: 'Geral',
-    };
-    const intentClassMap = {
-      STATUS: 'pill pill-status ml-2',
-      ATTACHMENT: 'pill pill-attachment ml-2',
-      ACCESS: 'pill pill-access ml-2',
-      ERROR: 'pill pill-error ml-2',
-      CLOSURE: 'pill pill-closure ml-2',
-      THANKS: 'pill pill-thanks ml-2',
-      GREETINGS: 'pill pill-greetings ml-2',
-      SUPPORT: 'pill pill-support ml-2',
-      NON_MESSAGE: 'pill pill-nonmessage ml-2',
-      OTHER: 'pill pill-other ml-2',
-    };
-
-    const intentPill = document.createElement('span');
-    intentPill.className = intentClassMap[intent] || 'pill pill-other ml-2';
-    intentPill.textContent = intentMap[intent] || 'Geral';
-    badge.appendChild(intentPill);
-
-    // Replies
-    replyPT = data.reply_pt || '';
-    replyEN = data.reply_en || '';
-
-    // idioma padrão: respeita preferido salvo, senão o que veio do backend
-    const preferred = localStorage.getItem('replyLang');
-    const defaultLang = (
-      preferred ||
-      data.reply_lang_default ||
-      'pt'
-    ).toLowerCase();
-
-    if (defaultLang === 'en' && replyEN) {
-      currentReplyLang = 'en';
-      reply.value = replyEN;
-    } else {
-      currentReplyLang = 'pt';
-      reply.value = replyPT || replyEN || '';
+    if (!res.ok && !data) {
+      throw new Error('Resposta inválida do servidor.');
+    }
+    if (failed) {
+      alert(failed.error || 'Erro ao processar.');
+      return;
     }
-    localStorage.setItem('replyLang', currentReplyLang);
-    updateLangButtons();
-
-    // Explicação
-    const feats = data.explanation?.top_features || [];
-    const langDetected = (data.explanation?.language || 'pt').toUpperCase();
-    const intentLabel = intentMap[intent] || 'Geral';
-    explain.innerHTML = `
-      <div><strong>Idioma detectado:</strong> ${langDetected}</div>
-      <div class="mt-1"><strong>Subintenção:</strong> ${intentLabel}</div>
-      <div class="mt-2"><strong>Principais sinais:</strong> <code>${
-        feats.length ? feats.join(', ') : 'Nenhum termo de destaque'
-      }</code></div>
-    `;
-
-    // Prévia
-    preview.innerText = data.text_preview || '';
+    if (data) renderResult(data);
   } catch (err) {
     console.error(err);
     if (err?.name === 'AbortError') {
@@ -1,92 +1,163 @@
-from typing import BinaryIO
+from typing import BinaryIO, Iterator, Optional
+import mmap
 import re, os
 
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "40"))
+# para de ler páginas quando o texto acumulado passa deste tamanho (0 = sem limite);
+# a classificação só olha ~4000 caracteres (ver _trim_text), a prévia menos ainda
+PDF_CHAR_BUDGET = int(os.getenv("PDF_CHAR_BUDGET", "8000"))
+
+_PUNCT = ",.;:!?"
+_STRONG_END = ".!?:;"
+
+# uma regex só para a prévia: quebras de linha (com os espaços em volta),
+# espaços antes de pontuação e espaços repetidos/NBSP/tab
+_PREVIEW_WS = re.compile(
+    r"(?P<nl>[ \t ]*(?:\r\n?|\n)(?:[ \t ]*(?:\r\n?|\n))*[ \t ]*)"
+    r"|(?P<punct>[ \t ]+(?=[,.;:!?]))"
+    r"|(?P<sp>[ \t ]{2,}|[\t ])"
+)
+
+
+def _preview_ws(m: re.Match) -> str:
+    if m.lastgroup == "punct":
+        return ""
+    if m.lastgroup == "sp":
+        return " "
+
+    s, t = m.group(0), m.string
+    breaks = s.count("\n") + s.count("\r") - s.count("\r\n")
+    if breaks >= 2:
+        return "\n\n"  # parágrafo
+    end = m.end()
+    if end < len(t) and t[end] in _PUNCT:
+        return ""
+    start = m.start()
+    # linha anterior termina com pontuação forte: mantém a quebra; senão junta com espaço
+    return "\n" if start and t[start - 1] in _STRONG_END else " "
+
+
 def _beautify_preview(text: str) -> str:
     """
-    Deixa a prévia mais legível:
-    - troca NBSP por espaço
-    - colapsa espaços múltiplos
+    Deixa a prévia mais legível, numa passada só:
+    - troca NBSP/tab por espaço e colapsa espaços múltiplos
     - preserva parágrafos (linhas em branco)
     - junta quebras de linha no meio de frases
+    - tira espaços antes de pontuação
     """
     if not text:
         return ""
+    return _PREVIEW_WS.sub(_preview_ws, text).strip()
 
-    t = text.replace("\u00A0", " ")
 
-    # normaliza finais de linha (Windows/Mac)
-    t = t.replace("\r\n", "\n").replace("\r", "\n")
+def _open_pdf(fitz, fh: BinaryIO):
+    """
+    Abre o PDF sem copiar o upload quando dá:
+    - BytesIO (ou SpooledTemporaryFile ainda em memória): memoryview do buffer
+    - arquivo em disco (SpooledTemporaryFile que transbordou etc.): mmap somente leitura
+    - qualquer outra coisa: lê tudo, como antes
+    Retorna (doc, liberar) — `liberar` solta os buffers depois de fechar o doc.
+    """
+    inner = getattr(fh, "_file", fh)  # SpooledTemporaryFile guarda o arquivo real em _file
 
-    # preserva parágrafos: marca blocos com um marcador temporário
-    t = re.sub(r"\n{2,}", "\n<PARA>\n", t)
+    if hasattr(inner, "getbuffer"):
+        view = inner.getbuffer()
+        try:
+            return fitz.open(stream=view, filetype="pdf"), view.release
+        except Exception:
+            view.release()
+            raise
+
+    try:
+        mm = mmap.mmap(inner.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        mm = None
+    if mm is not None:
+        view = memoryview(mm)
 
-    # junta quebras de linha no meio de frases:
-    # se a linha anterior NÃO termina com pontuação forte, une com espaço
-    t = re.sub(r"([^\.\!\?\:\;])\n(?=\S)", r"\1 ", t)
+        def release():
+            view.release()
+            mm.close()
 
-    # restaura quebras de parágrafo
-    t = t.replace("<PARA>", "")
+        try:
+            return fitz.open(stream=view, filetype="pdf"), release
+        except Exception:
+            release()
+            raise
 
-    # colapsa espaços múltiplos
-    t = re.sub(r"[ \t]{2,}", " ", t)
+    return fitz.open(stream=fh.read(), filetype="pdf"), (lambda: None)
 
-    # tira espaços antes de pontuação
-    t = re.sub(r"\s+([,.;:!?])", r"\1", t)
 
-    return t.strip()
+def _iter_pymupdf(fh: BinaryIO, max_pages: int) -> Iterator[str]:
+    import fitz  # PyMuPDF
+
+    doc, release = _open_pdf(fitz, fh)
+    try:
+        for i in range(min(doc.page_count, max_pages)):
+            yield doc.load_page(i).get_text("text")
+    finally:
+        try:
+            doc.close()
+        except Exception:
+            pass
+        release()
 
-def extract_text_from_pdf(fh: BinaryIO) -> str:
+
+def _iter_pypdf2(fh: BinaryIO, max_pages: int) -> Iterator[str]:
+    from PyPDF2 import PdfReader
+
+    try:
+        fh.seek(0)  # reposiciona o ponteiro caso já tenha lido acima
+    except Exception:
+        pass
+    reader = PdfReader(fh)
+    for i, page in enumerate(reader.pages):
+        if i >= max_pages:
+            break
+        yield page.extract_text() or ""
+
+
+def iter_pdf_pages(fh: BinaryIO, max_pages: Optional[int] = None) -> Iterator[str]:
     """
-    Extrai texto de PDF com PyMuPDF (preferido) e cai para PyPDF2 se falhar.
-    Respeita PDF_MAX_PAGES (env) e garante fechamento de doc/reposition do stream.
+    Gera o texto bruto de cada página sob demanda: quem consome decide quando parar,
+    e as páginas não lidas nem chegam a ser extraídas.
+    PyMuPDF (preferido); se ele falhar antes da primeira página, cai para PyPDF2.
     """
-    MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "40"))
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    yielded = False
+    try:
+        for text in _iter_pymupdf(fh, max_pages):
+            yielded = True
+            yield text
+        return
+    except Exception:
+        if yielded:
+            return  # já entregou páginas: não recomeça do zero com outro leitor
 
-    # -------- TENTATIVA 1: PyMuPDF --------
     try:
-        import fitz  # PyMuPDF
+        yield from _iter_pypdf2(fh, max_pages)
     except Exception:
-        fitz = None
+        return
 
-    if fitz is not None:
-        doc = None
-        try:
-            data = fh.read()  # lê tudo (SpooledTemporaryFile etc.)
-            doc = fitz.open(stream=data, filetype="pdf")
-            pages = []
-            for i, page in enumerate(doc):
-                if i >= MAX_PAGES:
-                    break
-                pages.append(page.get_text("text"))
-            raw = "\n\n".join(pages)
-            return _beautify_preview(raw)
-        except Exception:
-            # cai para o fallback
-            pass
-        finally:
-            try:
-                if doc is not None:
-                    doc.close()
-            except Exception:
-                pass
 
-    # -------- TENTATIVA 2: PyPDF2 (fallback) --------
+def extract_text_from_pdf(fh: BinaryIO, char_budget: Optional[int] = None) -> str:
+    """
+    Extrai texto de PDF com PyMuPDF (preferido) e cai para PyPDF2 se falhar.
+    Respeita PDF_MAX_PAGES e para de ler páginas ao atingir PDF_CHAR_BUDGET (env).
+    """
+    budget = PDF_CHAR_BUDGET if char_budget is None else char_budget
+    pages = []
+    total = 0
+    it = iter_pdf_pages(fh)
     try:
-        from PyPDF2 import PdfReader
-        try:
-            fh.seek(0)  # reposiciona o ponteiro caso já tenha lido acima
-        except Exception:
-            pass
-        reader = PdfReader(fh)
-        text = []
-        for i, page in enumerate(reader.pages):
-            if i >= MAX_PAGES:
+        for text in it:
+            pages.append(text)
+            total += len(text)
+            if budget and total >= budget:
                 break
-            text.append(page.extract_text() or "")
-        raw = "\n\n".join(text)
-        return _beautify_preview(raw)
-    except Exception:
-        return ""
+    finally:
+        it.close()  # fecha o documento mesmo quando paramos no meio
+    return _beautify_preview("\n\n".join(pages))
 
 
 def extract_text_from_txt(fh: BinaryIO) -> str:
@@ -0,0 +1,139 @@
+"""
+Leitura de caixas de email para a ingestão em massa (scripts/ingest_mail.py).
+
+- iter_mbox: percorre um .mbox mensagem a mensagem (só a mensagem atual fica em memória)
+  e devolve, com cada uma, o offset em bytes onde começa a próxima (ponto de retomada)
+- iter_eml_dir: arquivos .eml de uma pasta (recursivo), em ordem estável
+- message_text: decodifica o MIME (charsets, quoted-printable/base64) e devolve o corpo
+  em texto: text/plain, senão text/html sem tags, senão o anexo .txt/.pdf, como no upload
+"""
+import html
+import io
+import os
+import re
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from typing import Iterator, Optional
+
+from .extract import extract_text_from_pdf, extract_text_from_txt
+
+# mboxrd: linhas ">From ", ">>From "... perdem um ">" na leitura
+_FROM_QUOTED = re.compile(rb"^>+From ")
+
+_HTML_BREAKS = re.compile(r"(?i)<br\s*/?>|</(?:p|div|tr|li|h\d|blockquote)\s*>")
+_HTML_DROP = re.compile(r"(?is)<(script|style|head)\b.*?</\1\s*>|<!--.*?-->")
+_HTML_TAGS = re.compile(r"(?s)<[^>]+>")
+_HTML_BLANKS = re.compile(r"\n[ \t\xa0]*\n(?:[ \t\xa0]*\n)+")
+
+_PARSER = BytesParser(policy=policy.default)
+
+
+def iter_mbox(path: str, offset: int = 0) -> Iterator[tuple[bytes, int]]:
+    """(mensagem, offset da próxima) a partir de `offset` (início de uma linha "From ")."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        pos = offset
+        lines: list[bytes] = []
+        started = False
+        prev_blank = True
+        for line in f:
+            if line.startswith(b"From ") and prev_blank:
+                if started:
+                    yield b"".join(lines), pos
+                lines, started = [], True
+            elif started:
+                lines.append(line[1:] if _FROM_QUOTED.match(line) else line)
+            pos += len(line)
+            prev_blank = not line.strip()
+        if started:
+            yield b"".join(lines), pos
+
+
+def iter_eml_dir(path: str) -> list[str]:
+    """Caminhos dos .eml sob `path`, ordenados (o índice na lista é o ponto de retomada)."""
+    out = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        out.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".eml"))
+    return out
+
+
+def _html_to_text(s: str) -> str:
+    s = _HTML_DROP.sub("", s)
+    s = _HTML_TAGS.sub("", _HTML_BREAKS.sub("\n", s))
+    return _HTML_BLANKS.sub("\n\n", html.unescape(s)).strip()
+
+
+def _part_text(part: EmailMessage) -> str:
+    try:
+        return part.get_content()
+    except Exception:
+        # charset desconhecido/errado: decodifica o payload na mão
+        data = part.get_payload(decode=True) or b""
+        try:
+            return data.decode(part.get_content_charset() or "utf-8", errors="replace")
+        except LookupError:
+            return data.decode("latin-1")
+
+
+def _attachment_text(part: EmailMessage) -> str:
+    name = (part.get_filename() or "").lower()
+    ctype = part.get_content_type()
+    data = part.get_payload(decode=True) or b""
+    if ctype == "application/pdf" or name.endswith(".pdf"):
+        return extract_text_from_pdf(io.BytesIO(data))
+    if ctype == "text/plain" or name.endswith(".txt"):
+        return extract_text_from_txt(io.BytesIO(data))
+    return ""
+
+
+def message_text(raw: bytes) -> dict:
+    """
+    {"message_id", "subject", "from", "date", "text", "attachments", "doc_only"}.
+    doc_only: só há anexos e nenhum texto extraível (imagem/scan), como no upload de arquivo.
+    """
+    msg = _PARSER.parsebytes(raw)
+    plain: list[str] = []
+    htmls: list[str] = []
+    files: list[EmailMessage] = []
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        if part.get_content_disposition() == "attachment" or part.get_filename():
+            files.append(part)
+        elif part.get_content_type() == "text/plain":
+            plain.append(_part_text(part))
+        elif part.get_content_type() == "text/html":
+            htmls.append(_part_text(part))
+
+    text = "\n\n".join(t.strip() for t in plain if t.strip())
+    if not text:
+        text = "\n\n".join(_html_to_text(h) for h in htmls).strip()
+    if not text:
+        for part in files:
+            try:
+                text = _attachment_text(part).strip()
+            except Exception as e:
+                print(f"[mail] anexo ilegível ({part.get_filename()}): {e}")
+            if text:
+                break
+
+    return {
+        "message_id": _header(msg, "Message-ID"),
+        "subject": _header(msg, "Subject"),
+        "from": _header(msg, "From"),
+        "date": _header(msg, "Date"),
+        "text": text,
+        "attachments": [p.get_filename() or p.get_content_type() for p in files],
+        "doc_only": not text and bool(files),
+    }
+
+
+def _header(msg: EmailMessage, name: str) -> Optional[str]:
+    try:
+        v = msg.get(name)
+    except Exception:
+        # cabeçalho malformado: o valor cru, sem decodificar
+        v = next((raw for key, raw in msg.raw_items() if key.lower() == name.lower()), None)
+    return str(v).strip() if v is not None else None
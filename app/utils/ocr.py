@@ -0,0 +1,231 @@
+"""
+OCR de PDFs escaneados (sem camada de texto), fora das threads de requisição.
+
+- as páginas são renderizadas com PyMuPDF (OCR_DPI, tons de cinza) e o tesseract
+  roda num pool de PROCESSOS limitado (OCR_WORKERS), com fila limitada (OCR_MAX_QUEUE)
+- para assim que há texto suficiente para classificar (OCR_CHAR_BUDGET)
+- resultado por página vai para o cache de resultados, endereçado pelo hash do conteúdo da página
+- cada documento tem um prazo (OCR_TIMEOUT_S): estourou, devolve o que já tiver
+Sem pytesseract/tesseract instalados, devolve "" e o fluxo segue como documento sem texto.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import BinaryIO, Optional
+
+from ocr_worker import ocr_image
+
+from ..services.metrics import metrics
+from .extract import _beautify_preview, _open_pdf
+
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") == "1"
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", str(OCR_WORKERS * 4)))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_LANG = os.getenv("OCR_LANG", "por+eng")
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "10"))
+OCR_CHAR_BUDGET = int(os.getenv("OCR_CHAR_BUDGET", "2000"))
+OCR_TIMEOUT_S = float(os.getenv("OCR_TIMEOUT_S", "20"))
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_PID: Optional[int] = None
+_POOL_LOCK = threading.Lock()
+# vagas na fila do pool, compartilhadas por todas as requisições do processo; as ocupadas
+# são contadas à parte (o semáforo não expõe quantas restam)
+_SLOTS = threading.BoundedSemaphore(OCR_MAX_QUEUE)
+_taken = 0
+_TAKEN_LOCK = threading.Lock()
+metrics.gauge("ocr_queue", lambda: _taken, "Páginas de OCR na fila/no pool.")
+
+
+def _take_slot(timeout: float) -> bool:
+    global _taken
+    if not _SLOTS.acquire(timeout=max(0.0, timeout)):
+        return False
+    with _TAKEN_LOCK:
+        _taken += 1
+    return True
+
+
+def _release_slot():
+    global _taken
+    with _TAKEN_LOCK:
+        _taken -= 1
+    _SLOTS.release()
+
+
+# ------------------------- pool -------------------------
+@lru_cache(maxsize=1)
+def ocr_available() -> bool:
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception as e:
+        print(f"[ocr] indisponível: {e}")
+        return False
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL, _POOL_PID
+    with _POOL_LOCK:
+        # pool por processo: nunca reaproveitar o de outro worker do gunicorn
+        if _POOL is None or _POOL_PID != os.getpid():
+            # fork com threads vivas é arriscado; forkserver/spawn criam filhos limpos.
+            # Os filhos só importam ocr_worker (fora do pacote app: nada de create_app/modelos);
+            # no forkserver ele é importado uma vez e os filhos já nascem com ele.
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context("forkserver")
+                ctx.set_forkserver_preload([ocr_image.__module__])
+            else:
+                ctx = multiprocessing.get_context("spawn")
+            _POOL = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=ctx)
+            _POOL_PID = os.getpid()
+        return _POOL
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Pool quebrado (filho morreu): descarta para o próximo uso criar outro."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(pix, key: str, timeout: float) -> Optional[Future]:
+    """Enfileira o OCR de uma página; None se a fila não abriu vaga dentro do prazo."""
+    from ..services.cache import result_cache
+
+    if not _take_slot(timeout):
+        return None
+    args = (ocr_image, pix.samples, pix.width, pix.height, OCR_LANG, timeout)
+    pool = _pool()
+    try:
+        try:
+            fut = pool.submit(*args)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            pool = _pool()
+            fut = pool.submit(*args)
+    except Exception:
+        _release_slot()
+        raise
+
+    def _done(f: Future):
+        _release_slot()
+        if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool):
+            _discard_pool(pool)
+        # grava mesmo se a requisição já desistiu: o próximo envio do mesmo PDF aproveita
+        if not f.cancelled() and f.exception() is None:
+            result_cache.set(key, f.result())
+
+    fut.add_done_callback(_done)
+    return fut
+
+
+def _page_hash(doc, page) -> str:
+    """Hash do conteúdo bruto da página (stream de desenho + imagens), sem renderizar nada."""
+    h = hashlib.sha256(repr((tuple(page.rect), page.rotation)).encode())
+    h.update(page.read_contents() or b"")
+    for img in page.get_images(full=True):
+        h.update(doc.xref_stream_raw(img[0]) or b"")
+    return h.hexdigest()
+
+
+# ------------------------- API -------------------------
+def ocr_pdf(fh: BinaryIO, timeout_s: Optional[float] = None,
+            char_budget: Optional[int] = None) -> tuple[str, dict]:
+    """
+    OCR das páginas em ordem, com até OCR_WORKERS páginas em voo por documento.
+    Retorna (texto, info) — info vai para o debug da resposta.
+    """
+    t0 = time.perf_counter()
+    info = {"pages": 0, "cached": 0, "timed_out": False, "elapsed_ms": 0}
+    if not OCR_ENABLED or not ocr_available():
+        info["skipped"] = True
+        return "", info
+
+    from ..services.cache import make_key, result_cache
+    import fitz  # PyMuPDF
+
+    budget = OCR_CHAR_BUDGET if char_budget is None else char_budget
+    deadline = time.monotonic() + (OCR_TIMEOUT_S if timeout_s is None else timeout_s)
+
+    try:
+        fh.seek(0)
+    except Exception:
+        pass
+
+    texts: dict[int, str] = {}
+    pending: dict[Future, int] = {}
+    doc, release = None, None
+    try:
+        doc, release = _open_pdf(fitz, fh)
+        n = min(doc.page_count, OCR_MAX_PAGES)
+        nxt = emit = total = 0
+        while emit < n:
+            # enche a janela: cache primeiro, senão renderiza e manda para o pool
+            while nxt < n and len(pending) < OCR_WORKERS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    info["timed_out"] = True
+                    break
+                page = doc.load_page(nxt)
+                key = make_key("ocr", _page_hash(doc, page), OCR_DPI, OCR_LANG)
+                cached, _tier = result_cache.get(key)
+                if cached is not None:
+                    texts[nxt] = cached
+                    info["cached"] += 1
+                else:
+                    pix = page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY, alpha=False)
+                    fut = _submit(pix, key, remaining)
+                    if fut is None:
+                        info["timed_out"] = True
+                        break
+                    pending[fut] = nxt
+                nxt += 1
+
+            # consome em ordem de página até ter texto suficiente
+            while emit in texts:
+                total += len(texts[emit])
+                emit += 1
+            if (budget and total >= budget) or emit >= n:
+                break
+            if not pending:
+                break
+
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                info["timed_out"] = True
+                break
+            for fut in done:
+                i = pending.pop(fut)
+                try:
+                    text = fut.result()
+                except Exception as e:
+                    print(f"[ocr] falha na página {i + 1}: {e}")
+                    text = ""
+                texts[i] = text
+    except Exception as e:
+        print(f"[ocr] erro: {e}")
+    finally:
+        for fut in pending:
+            fut.cancel()  # o que já está rodando termina sozinho no pool
+        if doc is not None:
+            try:
+                doc.close()
+            except Exception:
+                pass
+        if release is not None:
+            release()
+
+    info["pages"] = len(texts)
+    info["elapsed_ms"] = int((time.perf_counter() - t0) * 1000)
+    return _beautify_preview("\n\n".join(texts[i] for i in sorted(texts))), info
@@ -0,0 +1,187 @@
+"""
+Entrada ASGI (modo assíncrono), ao lado de wsgi.py:
+
+    uvicorn asgi:app --workers 2
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+
+POST /classify e POST /classify/batch rodam sobre pipeline_async: a espera pelo
+provedor não prende thread, e o limite de concorrência é a cota do provedor
+(ASYNC_PROVIDER_CONCURRENCY). Extração, OCR e NLP vão para executores.
+O resto (login, páginas, /config, /healthz, /metrics) continua sendo o app Flask,
+montado via WSGI — mesma sessão, mesmo login. wsgi.py segue funcionando igual.
+"""
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import create_app
+from app.routes.email import batch_error, parse_batch
+from app.services import pipeline_async
+from app.services.http_clients import clients
+from app.services.metrics import metrics
+from app.services.pipeline import DOC_ONLY_TEXT, validate_text
+from app.utils.extract import extract_text_from_pdf, extract_text_from_txt
+from app.utils.ocr import ocr_pdf
+
+flask_app = create_app()
+MAX_CONTENT_LENGTH = flask_app.config["MAX_CONTENT_LENGTH"]
+
+
+def _logged_in(request: Request) -> bool:
+    """Lê o cookie de sessão do Flask (mesma chave e assinatura do login)."""
+    cookie = request.cookies.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if not cookie:
+        return False
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        data = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return False
+    return bool(data.get("auth"))
+
+
+def _guard(request: Request):
+    """Mesmo portão do Flask: sem login redireciona; corpo grande demais dá 413."""
+    if not _logged_in(request):
+        return RedirectResponse("/login", status_code=302)
+    try:
+        size = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        size = 0
+    if size > MAX_CONTENT_LENGTH:
+        return JSONResponse({"ok": False, "error": "Arquivo muito grande."}, status_code=413)
+    return None
+
+
+async def _read_upload(upload, req_id: str):
+    """(texto, ocr_info) do arquivo enviado; None em formato não suportado."""
+    name = (upload.filename or "").lower()
+    ocr_info = None
+    t_ext = time.perf_counter()
+    if name.endswith(".pdf"):
+        raw_text = await pipeline_async.run_cpu(extract_text_from_pdf, upload.file)
+        metrics.observe("stage_seconds", time.perf_counter() - t_ext, stage="extract")
+        if not raw_text.strip():
+            # OCR já roda no pool de processos; aqui só esperamos o prazo, fora do executor de CPU
+            raw_text, ocr_info = await asyncio.to_thread(ocr_pdf, upload.file)
+            print(f"[{req_id}] OCR: {ocr_info}")
+            metrics.observe("stage_seconds", ocr_info["elapsed_ms"] / 1000, stage="ocr")
+    elif name.endswith(".txt"):
+        raw_text = await pipeline_async.run_cpu(extract_text_from_txt, upload.file)
+        metrics.observe("stage_seconds", time.perf_counter() - t_ext, stage="extract")
+    else:
+        return None
+    return raw_text, ocr_info
+
+
+async def classify(request: Request):
+    blocked = _guard(request)
+    if blocked:
+        return blocked
+
+    req_id = str(uuid.uuid4())[:8]
+    t0 = time.perf_counter()
+    metrics.request_started()
+    try:
+        async with request.form() as form:
+            raw_text = ""
+            had_file = False
+            ocr_info = None
+            upload = form.get("email_file")
+            if upload is not None and not isinstance(upload, str) and upload.filename:
+                had_file = True
+                read = await _read_upload(upload, req_id)
+                if read is None:
+                    metrics.inc("requests_total", status=400)
+                    return JSONResponse({"ok": False, "error": "Formato de arquivo não suportado. Envie .txt ou .pdf."},
+                                        status_code=400)
+                raw_text, ocr_info = read
+            else:
+                raw_text = form.get("email_text") or ""
+            preferred_lang = form.get("preferred_lang")
+
+        doc_only = False
+        if had_file and (not raw_text or not raw_text.strip()):
+            doc_only = True
+            raw_text = DOC_ONLY_TEXT
+
+        err = validate_text(raw_text, doc_only)
+        if err:
+            metrics.inc("requests_total", status=400)
+            return JSONResponse({"ok": False, "error": err}, status_code=400)
+
+        body, status = await pipeline_async.classify_text(raw_text, preferred_lang, doc_only, req_id=req_id, t0=t0)
+        if ocr_info is not None and isinstance(body.get("debug"), dict):
+            body["debug"]["ocr"] = ocr_info
+        return JSONResponse(body, status_code=status)
+    except Exception as e:
+        print(f"[{req_id}] ERROR: {e}")
+        metrics.inc("requests_total", status=500)
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+    finally:
+        metrics.request_finished()
+
+
+async def classify_batch(request: Request):
+    blocked = _guard(request)
+    if blocked:
+        return blocked
+
+    # mesma regra do request.is_json do Flask; o resto é tratado como JSONL
+    mimetype = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    is_json = mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+    try:
+        items = parse_batch(is_json, (await request.body()).decode("utf-8", errors="replace"))
+    except ValueError as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    err = batch_error(items)
+    if err:
+        return JSONResponse({"ok": False, "error": err[0]}, status_code=err[1])
+
+    def _line(i, body, status):
+        body = dict(body, index=i, id=items[i]["id"], status=status)
+        return json.dumps(body, ensure_ascii=False) + "\n"
+
+    async def generate():
+        metrics.request_started()
+        try:
+            valid = []
+            for i, it in enumerate(items):
+                err = it["error"] or validate_text(it["text"])
+                if err:
+                    metrics.inc("requests_total", status=400)
+                    yield _line(i, {"ok": False, "error": err}, 400)
+                else:
+                    valid.append(i)
+
+            batch = [(items[i]["text"], items[i]["preferred_lang"]) for i in valid]
+            async for j, body, status in pipeline_async.classify_batch(batch):
+                yield _line(valid[j], body, status)
+        finally:
+            metrics.request_finished()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@asynccontextmanager
+async def _lifespan(_app):
+    yield
+    await clients.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/classify", classify, methods=["POST"]),
+        Route("/classify/batch", classify_batch, methods=["POST"]),
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=_lifespan,
+)
@@ -0,0 +1,24 @@
+"""
+Config do gunicorn (lida automaticamente a partir da raiz do projeto).
+
+preload_app: o app — e o modelo, carregado com mmap — é montado uma vez no master;
+os workers herdam as páginas por fork em vez de cada um carregar (ou treinar) o seu.
+Estado por processo (pools HTTP, SQLite, pool de OCR) já é recriado em cada worker.
+"""
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# create_app não aquece conexões no master: uma thread de prewarm viva no fork deixaria o
+# lock do registro de clientes preso nos workers. Cada worker aquece no post_fork.
+os.environ["PREWARM_ON_CREATE"] = "0"
+
+
+def post_fork(server, worker):
+    # conexões não atravessam fork: cada worker aquece as suas
+    from app.services.ai_provider import prewarm_provider
+
+    try:
+        prewarm_provider()
+    except Exception as e:
+        print(f"[gunicorn] prewarm falhou no worker {worker.pid}: {e}")
@@ -0,0 +1,19 @@
+"""
+Função que roda nos processos do pool de OCR (app/utils/ocr.py).
+
+Fica fora do pacote `app` de propósito: importar qualquer `app.*` executa app/__init__.py
+(blueprints, nltk, pipeline, modelos). O forkserver pré-carrega só este módulo e os filhos
+(forkserver ou spawn) nascem sem nada disso.
+"""
+
+
+def ocr_image(samples: bytes, width: int, height: int, lang: str, timeout: float) -> str:
+    import pytesseract
+    from PIL import Image
+
+    img = Image.frombytes("L", (width, height), samples)
+    try:
+        return pytesseract.image_to_string(img, lang=lang, timeout=max(1, int(timeout))) or ""
+    except Exception as e:
+        # algumas exceções do pytesseract não voltam por pickle e quebrariam o pool inteiro
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
@@ -0,0 +1,132 @@
+"""
+Benchmark dos dois modos de classificação do Hugging Face: "dual" (dois zero-shots)
+vs "single" (um zero-shot sobre INTENTS, categoria derivada da intenção).
+
+Mede latência (p50/p95/média) de cada modo e a concordância de categoria/intenção
+entre eles, sobre os arquivos de data/tests (ou uma pasta passada em --data).
+Chama a Inference API de verdade: precisa de HUGGINGFACE_API_KEY.
+
+    python scripts/bench_hf_modes.py --repeat 3
+    python scripts/bench_hf_modes.py --data minha_pasta --json resultado.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# sem cache local nem do lado da API: queremos a latência real de cada chamada
+os.environ["CACHE_ENABLED"] = "0"
+os.environ.setdefault("HF_USE_CACHE", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv()
+
+from app.services import ai_provider  # noqa: E402
+from app.utils.extract import extract_text_from_pdf, extract_text_from_txt  # noqa: E402
+
+MODES = {
+    "dual": ai_provider._hf_classify_and_intent,
+    "single": ai_provider._hf_classify_single,
+}
+
+
+def load_samples(folder: Path) -> list[tuple[str, str]]:
+    out = []
+    for path in sorted(folder.iterdir()):
+        suffix = path.suffix.lower()
+        if suffix not in (".txt", ".pdf"):
+            continue
+        with open(path, "rb") as fh:
+            text = extract_text_from_pdf(fh) if suffix == ".pdf" else extract_text_from_txt(fh)
+        if text.strip():
+            out.append((path.name, text))
+    return out
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--data", default="data/tests", help="pasta com .txt/.pdf")
+    ap.add_argument("--repeat", type=int, default=1, help="rodadas por arquivo")
+    ap.add_argument("--json", help="grava o relatório completo neste arquivo")
+    args = ap.parse_args()
+
+    if not ai_provider.HUGGINGFACE_API_KEY:
+        sys.exit("HUGGINGFACE_API_KEY não definido.")
+
+    samples = load_samples(Path(args.data))
+    if not samples:
+        sys.exit(f"Nenhum .txt/.pdf com texto em {args.data}.")
+
+    latencies = {m: [] for m in MODES}
+    failures = {m: 0 for m in MODES}
+    rows = []
+    for r in range(args.repeat):
+        for i, (name, text) in enumerate(samples):
+            # alterna a ordem para nenhum modo levar sempre a conexão/modelo "frio"
+            order = list(MODES) if (i + r) % 2 == 0 else list(reversed(MODES))
+            res = {}
+            for mode in order:
+                t0 = time.perf_counter()
+                out = MODES[mode](text)
+                ms = (time.perf_counter() - t0) * 1000
+                if out.ok:
+                    latencies[mode].append(ms)
+                else:
+                    failures[mode] += 1
+                res[mode] = {"ok": out.ok, "category": out.category, "intent": out.intent,
+                             "confidence": round(out.confidence, 3), "ms": round(ms, 1)}
+            rows.append({"file": name, "round": r, **res})
+
+    both = [row for row in rows if row["dual"]["ok"] and row["single"]["ok"]]
+    same_cat = sum(row["dual"]["category"] == row["single"]["category"] for row in both)
+    same_intent = sum(row["dual"]["intent"] == row["single"]["intent"] for row in both)
+
+    report = {"samples": len(samples), "repeat": args.repeat, "modes": {}, "agreement": {}}
+    print(f"{'modo':<8}{'ok':>5}{'falhas':>8}{'p50 ms':>10}{'p95 ms':>10}{'média ms':>10}")
+    for mode in MODES:
+        lat = latencies[mode]
+        stats = {
+            "ok": len(lat),
+            "failures": failures[mode],
+            "p50_ms": round(percentile(lat, 50), 1),
+            "p95_ms": round(percentile(lat, 95), 1),
+            "mean_ms": round(statistics.fmean(lat), 1) if lat else 0.0,
+        }
+        report["modes"][mode] = stats
+        print(f"{mode:<8}{stats['ok']:>5}{stats['failures']:>8}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['mean_ms']:>10}")
+
+    if both:
+        report["agreement"] = {
+            "compared": len(both),
+            "category": round(same_cat / len(both), 3),
+            "intent": round(same_intent / len(both), 3),
+        }
+        print(f"\nconcordância ({len(both)} pares): categoria {same_cat}/{len(both)}, "
+              f"intenção {same_intent}/{len(both)}")
+        for row in both:
+            d, s = row["dual"], row["single"]
+            if (d["category"], d["intent"]) != (s["category"], s["intent"]):
+                print(f"  {row['file']}: dual={d['category']}/{d['intent']}  single={s['category']}/{s['intent']}")
+
+    report["rows"] = rows
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Micro-benchmark por etapa do caminho quente, sobre os arquivos de data/tests
+(ou uma pasta passada em --data) e variantes sintéticas maiores:
+
+- txt: original, 10x e 100x o tamanho (texto repetido em parágrafos)
+- pdf: original, 10x e 100x páginas (o documento concatenado com ele mesmo)
+
+Cada etapa é medida isolada, com as entradas já calculadas fora do cronômetro:
+extract_text_from_pdf, extract_text_from_txt, detect_language, preprocess,
+detect_intent, fastpath_from_config, classifier_service.predict e build_reply.
+Memos entre etapas (email normalizado: texto sem acentos, varredura do matcher) são limpos
+antes de cada chamada.
+
+Por caso: p50/p90/p99/min/média em µs e, numa passada separada com tracemalloc,
+pico de memória e blocos retidos por chamada. Saída JSON estável (chaves ordenadas).
+
+    python scripts/bench_stages.py --json bench.json
+    python scripts/bench_stages.py --json novo.json --compare bench.json
+    python scripts/bench_stages.py --compare bench.json --against novo.json   # só compara
+Com --compare o código de saída é 1 se alguma etapa ficou mais lenta que --threshold.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# só CPU local: sem provedor, sem cache de resultados, sem checagem de troca de modelo
+os.environ["CACHE_ENABLED"] = "0"
+os.environ["MODEL_RELOAD_S"] = "0"
+os.environ["PROVIDER"] = "local"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services import email_text  # noqa: E402
+from app.services.ai_provider import fastpath_from_config  # noqa: E402
+from app.services.classifier_service import classifier_service, detect_intent  # noqa: E402
+from app.services.nlp_service import detect_language, preprocess  # noqa: E402
+from app.services.response_service import build_reply  # noqa: E402
+from app.utils.extract import extract_text_from_pdf, extract_text_from_txt  # noqa: E402
+
+SCALES = (1, 10, 100)
+
+
+# ------------------------- corpus -------------------------
+def _scale_pdf(data: bytes, scale: int) -> bytes:
+    import fitz  # PyMuPDF
+
+    if scale == 1:
+        return data
+    src = fitz.open(stream=data, filetype="pdf")
+    out = fitz.open()
+    for _ in range(scale):
+        out.insert_pdf(src)
+    try:
+        return out.tobytes()
+    finally:
+        out.close()
+        src.close()
+
+
+def load_cases(folder: Path, scales) -> list[dict]:
+    """[{name, kind, data}] — data são os bytes do arquivo (escalado)."""
+    cases = []
+    for path in sorted(folder.iterdir()):
+        suffix = path.suffix.lower()
+        if suffix not in (".txt", ".pdf"):
+            continue
+        raw = path.read_bytes()
+        for scale in scales:
+            if suffix == ".pdf":
+                data = _scale_pdf(raw, scale)
+            else:
+                data = "\n\n".join([raw.decode("utf-8", errors="ignore")] * scale).encode("utf-8")
+            cases.append({"name": f"{path.stem}@x{scale}", "kind": suffix[1:], "data": data})
+    return cases
+
+
+def _text_of(case: dict) -> str:
+    fh = io.BytesIO(case["data"])
+    return extract_text_from_pdf(fh) if case["kind"] == "pdf" else extract_text_from_txt(fh)
+
+
+# ------------------------- etapas -------------------------
+def _clear_scan():
+    email_text._normalized_cached.cache_clear()
+
+
+def stages():
+    """nome -> (tipos de caso, prepara(case, ctx) -> thunk, reset entre chamadas)"""
+    return {
+        "extract_text_from_pdf": (("pdf",), lambda c, x: lambda: extract_text_from_pdf(io.BytesIO(c["data"])), None),
+        "extract_text_from_txt": (("txt",), lambda c, x: lambda: extract_text_from_txt(io.BytesIO(c["data"])), None),
+        "detect_language": (("txt", "pdf"), lambda c, x: lambda: detect_language(x["text"]), _clear_scan),
+        "preprocess": (("txt", "pdf"), lambda c, x: lambda: preprocess(x["text"], lang=x["lang"]), None),
+        "detect_intent": (("txt", "pdf"), lambda c, x: lambda: detect_intent(x["text"], x["lang"]), _clear_scan),
+        "fastpath_from_config": (("txt", "pdf"), lambda c, x: lambda: fastpath_from_config(x["text"]), _clear_scan),
+        "classifier_service.predict": (("txt", "pdf"), lambda c, x: lambda: classifier_service.predict(x["clean"]), None),
+        "build_reply": (("txt", "pdf"),
+                        lambda c, x: lambda: build_reply(x["text"], x["label"], lang=x["lang"], intent=x["intent"]),
+                        _clear_scan),
+    }
+
+
+def _context(case: dict) -> dict:
+    text = _text_of(case)
+    lang = detect_language(text)
+    clean = preprocess(text, lang=lang)
+    label, _p, _top = classifier_service.predict(clean)
+    _clear_scan()
+    return {"text": text, "lang": lang, "clean": clean, "label": label, "intent": detect_intent(text, lang)}
+
+
+# ------------------------- medição -------------------------
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def measure(thunk, reset, repeat: int, warmup: int, alloc_repeat: int) -> dict:
+    for _ in range(warmup):
+        if reset:
+            reset()
+        thunk()
+
+    times = []
+    gc_was = gc.isenabled()
+    gc.disable()  # coleta do GC no meio da medição vira ruído
+    try:
+        for _ in range(repeat):
+            if reset:
+                reset()
+            t0 = time.perf_counter_ns()
+            thunk()
+            times.append((time.perf_counter_ns() - t0) / 1000)
+    finally:
+        if gc_was:
+            gc.enable()
+
+    # passada separada: tracemalloc deixa cada alocação bem mais cara
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_repeat):
+            if reset:
+                reset()
+            gc.collect()
+            before = sys.getallocatedblocks()
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            thunk()
+            _cur, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base)
+            retained.append(sys.getallocatedblocks() - before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "n": len(times),
+        "p50_us": round(percentile(times, 50), 1),
+        "p90_us": round(percentile(times, 90), 1),
+        "p99_us": round(percentile(times, 99), 1),
+        "min_us": round(min(times), 1),
+        "mean_us": round(statistics.fmean(times), 1),
+        "peak_alloc_bytes": int(statistics.median(peaks)) if peaks else 0,
+        "retained_blocks": int(statistics.median(retained)) if retained else 0,
+    }
+
+
+def run(args) -> dict:
+    scales = [s for s in SCALES if not args.scales or s in args.scales]
+    cases = load_cases(Path(args.data), scales)
+    if not cases:
+        sys.exit(f"Nenhum .txt/.pdf em {args.data}.")
+
+    selected = {k: v for k, v in stages().items() if not args.stages or k in args.stages}
+    results: dict[str, dict] = {}
+    for case in cases:
+        ctx = _context(case)
+        for stage, (kinds, make, reset) in selected.items():
+            if case["kind"] not in kinds:
+                continue
+            repeat = max(3, args.repeat // 10) if case["name"].endswith("@x100") else args.repeat
+            res = measure(make(case, ctx), reset, repeat, args.warmup, args.alloc_repeat)
+            res["input_chars"] = len(ctx["text"])
+            results[f"{stage}/{case['name']}"] = res
+            print(f"{stage:<28}{case['name']:<36}{res['p50_us']:>12}{res['p99_us']:>12}"
+                  f"{res['peak_alloc_bytes']:>12}", flush=True)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "scales": scales,
+            "data": args.data,
+        },
+        "results": results,
+    }
+
+
+# ------------------------- comparação -------------------------
+def compare(old: dict, new: dict, threshold: float, min_us: float) -> list[dict]:
+    """Compara p50 caso a caso; devolve as linhas (marcadas com slower=True quando regrediu)."""
+    rows = []
+    a, b = old.get("results", {}), new.get("results", {})
+    for key in sorted(set(a) & set(b)):
+        before, after = a[key]["p50_us"], b[key]["p50_us"]
+        ratio = after / before if before else float("inf")
+        rows.append({
+            "case": key,
+            "old_p50_us": before,
+            "new_p50_us": after,
+            "ratio": round(ratio, 3),
+            "alloc_ratio": round(b[key]["peak_alloc_bytes"] / a[key]["peak_alloc_bytes"], 3)
+            if a[key]["peak_alloc_bytes"] else None,
+            # regressão = mais lento em proporção E em valor absoluto (ruído em etapas de poucos µs)
+            "slower": ratio > 1 + threshold and after - before > min_us,
+        })
+    return rows
+
+
+def print_comparison(rows: list[dict]):
+    print(f"\n{'caso':<64}{'antes µs':>12}{'depois µs':>12}{'razão':>8}")
+    for r in rows:
+        flag = "  << MAIS LENTO" if r["slower"] else ""
+        print(f"{r['case']:<64}{r['old_p50_us']:>12}{r['new_p50_us']:>12}{r['ratio']:>8}{flag}")
+    slower = [r for r in rows if r["slower"]]
+    print(f"\n{len(slower)} de {len(rows)} casos mais lentos")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--data", default="data/tests", help="pasta com .txt/.pdf")
+    ap.add_argument("--repeat", type=int, default=20, help="chamadas medidas por caso (x100 usa 1/10)")
+    ap.add_argument("--warmup", type=int, default=3, help="chamadas descartadas antes de medir")
+    ap.add_argument("--alloc-repeat", type=int, default=3, help="chamadas com tracemalloc por caso")
+    ap.add_argument("--stages", nargs="*", help="só estas etapas (nomes como na saída)")
+    ap.add_argument("--scales", nargs="*", type=int, help=f"só estas escalas (de {SCALES})")
+    ap.add_argument("--json", help="grava o resultado neste arquivo")
+    ap.add_argument("--compare", help="resultado anterior (JSON) para comparar")
+    ap.add_argument("--against", help="com --compare: compara com este JSON em vez de rodar")
+    ap.add_argument("--threshold", type=float, default=0.10, help="razão de p50 acima de 1+x = regressão")
+    ap.add_argument("--min-us", type=float, default=5.0, help="diferença mínima em µs para marcar regressão")
+    args = ap.parse_args()
+
+    if args.against:
+        if not args.compare:
+            sys.exit("--against precisa de --compare.")
+        with open(args.against, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    else:
+        print(f"{'etapa':<28}{'caso':<36}{'p50 µs':>12}{'p99 µs':>12}{'pico B':>12}")
+        report = run(args)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.threshold, args.min_us)
+        print_comparison(rows)
+        if any(r["slower"] for r in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Classificação em massa, fora do Flask: um .mbox ou uma pasta de .eml -> JSONL.
+
+- lê mensagem a mensagem (o .mbox nunca é carregado inteiro) e decodifica o MIME
+  (app/utils/mail.py): text/plain, senão HTML sem tags, senão o anexo .txt/.pdf
+- blocos de --chunk mensagens vão para um pool de --workers processos; cada processo roda
+  o mesmo pipeline do /classify/batch (etapas locais vetorizadas no bloco, chamadas ao
+  provedor em paralelo até BATCH_WORKERS, cache/coalescência compartilhados no SQLite)
+- a saída sai na ordem da entrada, uma linha por mensagem: chave (offset no .mbox ou
+  caminho do .eml), cabeçalhos e o corpo do /classify sem text_preview (debug com --debug)
+- depois de cada bloco gravado, o checkpoint (<saída>.ckpt) guarda até onde a entrada foi
+  lida e o tamanho da saída; rodando de novo, a saída é cortada nesse tamanho e a leitura
+  continua dali, sem linhas duplicadas. --restart começa do zero.
+- roda a partir da raiz do projeto (chdir no início), como o servidor: modelos, configs e
+  cache são os mesmos de qualquer diretório; caminhos relativos nos argumentos continuam
+  relativos ao diretório de onde o comando foi chamado
+- o checkpoint e as linhas de progresso contam as mensagens por status; se o primeiro bloco
+  falhar inteiro (status >= 500: provedor/configuração), para sem gravar nada, com código 1.
+  Terminando com alguma falha >= 500, o código de saída também é 1.
+
+    python scripts/ingest_mail.py caixa.mbox --out resultados.jsonl --workers 4
+    python scripts/ingest_mail.py emails/ --out resultados.jsonl --lang pt
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+_CWD = os.getcwd()  # base dos caminhos passados na linha de comando
+os.chdir(ROOT)
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv()
+
+from app.utils.mail import iter_eml_dir, iter_mbox, message_text  # noqa: E402
+
+PROGRESS_S = 10.0  # intervalo entre as linhas de progresso
+
+
+# ------------------------- processo do pool -------------------------
+def _classify_chunk(items: list[tuple[str, object]], preferred_lang: str, debug: bool) -> list[dict]:
+    """Bloco de (chave, bytes da mensagem ou caminho do .eml) -> registros, na mesma ordem."""
+    from app.services.pipeline import DOC_ONLY_TEXT, classify_batch, classify_text, validate_text
+
+    out: list[dict] = []
+    batch, where = [], []
+    for key, raw in items:
+        rec = {"key": key}
+        out.append(rec)
+        try:
+            if isinstance(raw, str):
+                with open(raw, "rb") as f:
+                    raw = f.read()
+            msg = message_text(raw)
+        except Exception as e:
+            rec.update(ok=False, status=400, error=f"mensagem ilegível: {e}")
+            continue
+        text, doc_only = msg.pop("text"), msg["doc_only"]
+        rec.update(msg)
+        if doc_only:
+            text = DOC_ONLY_TEXT
+        err = validate_text(text, doc_only)
+        if err:
+            rec.update(ok=False, status=400, error=err)
+        elif doc_only:
+            # raro: fora do lote (prepare_batch não recebe doc_only)
+            _merge(rec, *_safe(classify_text, text, preferred_lang, True), debug)
+        else:
+            batch.append((text, preferred_lang))
+            where.append(rec)
+
+    if batch:
+        for i, body, status in classify_batch(batch):
+            _merge(where[i], body, status, debug)
+    return out
+
+
+def _safe(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}, 500
+
+
+def _merge(rec: dict, body: dict, status: int, debug: bool):
+    body = dict(body)
+    body.pop("text_preview", None)
+    if not debug:
+        body.pop("debug", None)
+    rec.update(body, status=status)
+
+
+# ------------------------- entrada -------------------------
+def _messages(source: str, kind: str, position: int) -> Iterator[tuple[str, object, int]]:
+    """(chave, mensagem, posição da próxima) a partir de `position`."""
+    if kind == "mbox":
+        start = position
+        for raw, nxt in iter_mbox(source, position):
+            yield str(start), raw, nxt
+            start = nxt
+    else:
+        paths = iter_eml_dir(source)
+        for i in range(position, len(paths)):
+            yield os.path.relpath(paths[i], source), paths[i], i + 1
+
+
+def _chunks(messages: Iterator, size: int, limit: Optional[int]) -> Iterator[tuple[list, int]]:
+    items, nxt, n = [], None, 0
+    for key, raw, nxt in messages:
+        items.append((key, raw))
+        n += 1
+        if len(items) >= size or (limit and n >= limit):
+            yield items, nxt
+            items = []
+            if limit and n >= limit:
+                return
+    if items:
+        yield items, nxt
+
+
+# ------------------------- checkpoint -------------------------
+def _load_checkpoint(path: str, source: str, kind: str) -> dict:
+    empty = {"source": source, "kind": kind, "position": 0, "out_bytes": 0, "messages": 0, "status": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            ckpt = json.load(f)
+    except FileNotFoundError:
+        return empty
+    if ckpt.get("source") != source or ckpt.get("kind") != kind:
+        raise SystemExit(f"[ingest] {path} é de outra entrada ({ckpt.get('source')}); use --restart")
+    ckpt.setdefault("status", {})
+    return ckpt
+
+
+def _save_checkpoint(path: str, ckpt: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(ckpt, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _failures(status: dict) -> str:
+    bad = sorted((k, n) for k, n in status.items() if k != "200")
+    return ", ".join(f"{n} com status {k}" for k, n in bad) or "nenhuma falha"
+
+
+# ------------------------- principal -------------------------
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Classifica um .mbox ou uma pasta de .eml e grava JSONL.")
+    ap.add_argument("source", help="arquivo .mbox ou pasta com .eml")
+    ap.add_argument("--out", required=True, help="arquivo JSONL de saída")
+    ap.add_argument("--checkpoint", help="arquivo de checkpoint (padrão: <out>.ckpt)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="processos no pool")
+    ap.add_argument("--chunk", type=int, default=64, help="mensagens por bloco enviado a um processo")
+    ap.add_argument("--lang", default="auto", choices=("auto", "pt", "en"), help="idioma preferido da resposta")
+    ap.add_argument("--limit", type=int, help="para depois de N mensagens nesta execução")
+    ap.add_argument("--debug", action="store_true", help="inclui o debug do pipeline em cada linha")
+    ap.add_argument("--restart", action="store_true", help="ignora o checkpoint e recomeça a saída")
+    args = ap.parse_args(argv)
+
+    source = os.path.join(_CWD, args.source)
+    args.out = os.path.join(_CWD, args.out)
+    kind = "eml" if os.path.isdir(source) else "mbox"
+    ckpt_path = os.path.join(_CWD, args.checkpoint) if args.checkpoint else f"{args.out}.ckpt"
+    if args.restart and os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+    ckpt = _load_checkpoint(ckpt_path, source, kind)
+    if not ckpt["out_bytes"] and not args.restart and os.path.getsize(args.out) if os.path.exists(args.out) else 0:
+        raise SystemExit(f"[ingest] {args.out} já tem conteúdo e não há checkpoint; use --restart")
+    if ckpt["position"]:
+        print(f"[ingest] retomando {source} da posição {ckpt['position']} ({ckpt['messages']} mensagens já gravadas)")
+
+    out = open(args.out, "r+b" if os.path.exists(args.out) else "wb")
+    out.truncate(ckpt["out_bytes"])  # linhas gravadas depois do último checkpoint saem
+    out.seek(ckpt["out_bytes"])
+
+    t0 = last = time.perf_counter()
+    done = 0
+    run_status: dict[str, int] = {}  # só desta execução (o checkpoint acumula)
+    max_pending = max(1, args.workers) * 2  # blocos em voo: limita a memória de um .mbox grande
+
+    def write(fut, nxt) -> bool:
+        nonlocal done, last
+        records = fut.result()
+        if not done and all(r.get("status", 500) >= 500 for r in records):
+            # nada funcionou no primeiro bloco: provedor fora/configuração errada; não grava
+            print(f"[ingest] as {len(records)} mensagens do primeiro bloco falharam "
+                  f"({records[0].get('error')}); nada gravado")
+            return False
+        for r in records:
+            k = str(r.get("status", 500))
+            run_status[k] = run_status.get(k, 0) + 1
+            ckpt["status"][k] = ckpt["status"].get(k, 0) + 1
+        out.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8"))
+        out.flush()
+        os.fsync(out.fileno())
+        done += len(records)
+        ckpt.update(position=nxt, out_bytes=out.tell(), messages=ckpt["messages"] + len(records),
+                    updated_at=time.time())
+        _save_checkpoint(ckpt_path, ckpt)
+        now = time.perf_counter()
+        if now - last >= PROGRESS_S:
+            last = now
+            print(f"[ingest] {ckpt['messages']} mensagens ({done / (now - t0):.1f}/s), posição {nxt}, "
+                  f"{_failures(ckpt['status'])}")
+        return True
+
+    pool = ProcessPoolExecutor(max_workers=max(1, args.workers))
+    pending: deque = deque()
+    try:
+        for items, nxt in _chunks(_messages(source, kind, ckpt["position"]), args.chunk, args.limit):
+            pending.append((pool.submit(_classify_chunk, items, args.lang, args.debug), nxt))
+            while len(pending) >= max_pending or (pending and pending[0][0].done()):
+                if not write(*pending.popleft()):
+                    return 1
+        while pending:
+            if not write(*pending.popleft()):
+                return 1
+    except KeyboardInterrupt:
+        print(f"[ingest] interrompido; rode de novo para continuar da posição {ckpt['position']}")
+        return 130
+    finally:
+        pool.shutdown(wait=not pending, cancel_futures=True)
+        out.close()
+
+    elapsed = time.perf_counter() - t0
+    print(f"[ingest] {done} mensagens em {elapsed:.1f}s ({done / max(elapsed, 1e-9):.1f}/s), "
+          f"{_failures(run_status)}; total {ckpt['messages']} em {args.out} ({_failures(ckpt['status'])})")
+    return 1 if any(int(k) >= 500 for k in run_status) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""
+Retreina os modelos locais (categoria e intenção) e publica os artefatos de forma atômica
+(arquivo temporário + os.replace, com .meta.json de versão/sha256).
+
+Os workers em execução percebem a troca em até MODEL_RELOAD_S segundos e passam a usar
+o modelo novo sem reiniciar.
+
+    python scripts/train_models.py
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv()
+
+from app.services.classifier_service import classifier_service  # noqa: E402
+
+
+def main():
+    classifier_service.retrain()
+    print(json.dumps(classifier_service.model_info(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()